@@ -0,0 +1,184 @@
+from collections import deque
+from typing import NamedTuple
+
+import numpy as np
+
+from cached_engine import CachedEngine
+from currency import RateCache
+from database import DB_PATH
+
+# An expense is flagged when it is far above its category's median in
+# robust terms (modified z-score, Iglewicz & Hoaglin) and also above the
+# category's recent run of spending. Both sides only: small charges are
+# never interesting.
+ROBUST_THRESHOLD = 3.5
+ROLLING_THRESHOLD = 3.0
+ROLLING_WINDOW = 30
+MIN_HISTORY = 10
+
+
+class Anomaly(NamedTuple):
+    expense_id: int
+    category_id: int
+    date: str
+    amount: float
+    median: float
+    score: float
+
+
+def group_bounds(groups):
+    # groups must be sorted; returns each group's start, size and the
+    # start of the group each element belongs to
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    return starts, sizes, np.repeat(starts, sizes)
+
+
+def grouped_median(starts, sizes, values):
+    # Groups are contiguous, so each median is a linear-time partition of a
+    # slice; the loop runs once per category, not per expense
+    return np.array([np.median(values[start:start + size]) for start, size in zip(starts, sizes)])
+
+
+def robust_scores(groups, amounts):
+    # Modified z-scores 0.6745 * (x - median) / MAD within each group. When
+    # the MAD is 0 (e.g. a fixed monthly charge) the mean absolute deviation
+    # is used instead, scaled to match (1.2533 ~ sqrt(pi / 2)).
+    starts, sizes, _ = group_bounds(groups)
+    inverse = np.repeat(np.arange(len(starts)), sizes)
+    medians = grouped_median(starts, sizes, amounts)
+    deviations = np.abs(amounts - medians[inverse])
+    mad = grouped_median(starts, sizes, deviations) / 0.6745
+    mean_ad = np.bincount(inverse, weights=deviations) / sizes * 1.2533
+    scale = np.where(mad > 0, mad, mean_ad)
+
+    element_scale = scale[inverse]
+    scores = np.divide(amounts - medians[inverse], element_scale,
+                       out=np.zeros(len(amounts)), where=element_scale > 0)
+    return scores, medians, scale
+
+
+def rolling_scores(groups, amounts, window=ROLLING_WINDOW, min_history=MIN_HISTORY):
+    # z-score of each amount against the previous `window` amounts of the
+    # same group (groups sorted, chronological within a group), from prefix
+    # sums; NaN while a group has fewer than min_history earlier amounts
+    _, _, group_start = group_bounds(groups)
+    positions = np.arange(len(amounts))
+    low = np.maximum(group_start, positions - window)
+    count = positions - low
+
+    sums = np.r_[0, np.cumsum(amounts)]
+    squares = np.r_[0, np.cumsum(amounts * amounts)]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (sums[positions] - sums[low]) / count
+        variance = (squares[positions] - squares[low]) / count - mean * mean
+        std = np.sqrt(np.maximum(variance, 0))
+        scores = (amounts - mean) / std
+    scores[(count < min_history) | ~(std > 0)] = np.nan
+    return scores
+
+
+def detect(expense_ids, category_ids, amounts):
+    # Arrays in chronological order; returns the flag mask, robust scores
+    # and the per-category state needed to score later inserts
+    order = np.argsort(category_ids, kind='stable')
+    groups = category_ids[order]
+    sorted_amounts = amounts[order]
+
+    robust, medians, scale = robust_scores(groups, sorted_amounts)
+    rolling = rolling_scores(groups, sorted_amounts)
+    flagged = (robust > ROBUST_THRESHOLD) & (np.isnan(rolling) | (rolling > ROLLING_THRESHOLD))
+
+    starts, sizes, _ = group_bounds(groups)
+    stats = {}
+    for group, start, size, median, group_scale in zip(groups[starts], starts, sizes, medians, scale):
+        recent = sorted_amounts[max(start, start + size - ROLLING_WINDOW):start + size]
+        stats[int(group)] = (float(median), float(group_scale), deque(recent.tolist(), maxlen=ROLLING_WINDOW))
+
+    mask = np.zeros(len(amounts), dtype=bool)
+    mask[order] = flagged
+    scores = np.empty(len(amounts))
+    scores[order] = robust
+    return mask, scores, stats
+
+
+class _UserModel:
+    def __init__(self, anomalies, stats):
+        self.anomalies = anomalies
+        self.stats = stats
+
+
+class AnomalyDetector(CachedEngine):
+    # Per-user outlier detection over the whole expense history, fitted in
+    # one vectorized pass and cached until PRAGMA data_version changes, so
+    # edits, deletes and writes from outside the app refit on next use.
+    # New expenses are scored against the last fit as soon as they are
+    # added, so they can be marked before that refit. Amounts are compared
+    # in the reporting currency.
+    def __init__(self, db_path=DB_PATH, rates=None):
+        super().__init__(db_path, 'anomalies')
+        self.rates = rates or RateCache(db_path)
+
+    def anomalies(self, user_id):
+        with self._lock:
+            return dict(self._cached(user_id, (), self._fit).anomalies)
+
+    def anomalies_async(self, user_id):
+        return self._executor.submit(self.anomalies, user_id)
+
+    def add_async(self, user_id, expense_ids):
+        return self._executor.submit(self.add, user_id, expense_ids)
+
+    def flagged(self, user_id):
+        # What is known right now, without fitting
+        model = self._peek(user_id)
+        return model.anomalies if model else {}
+
+    def add(self, user_id, expense_ids):
+        # Score new expenses against the current fit; returns the new anomalies
+        with self._lock:
+            model = self._peek(user_id)
+            if model is None:
+                return []
+
+            conn = self._connection()
+            placeholders = ', '.join('?' * len(expense_ids))
+            rows = conn.execute(f'''SELECT expense_id, category_id, date, amount, currency FROM Expenses
+                                    WHERE user_id = ? AND expense_id IN ({placeholders})
+                                    ORDER BY date, expense_id''', [user_id] + list(expense_ids)).fetchall()
+
+            found = []
+            for expense_id, category_id, expense_date, amount, currency in rows:
+                amount = self.rates.rate(currency, expense_date) * amount
+                median, scale, recent = model.stats.setdefault(category_id, (amount, 0.0, deque(maxlen=ROLLING_WINDOW)))
+                robust = (amount - median) / scale if scale > 0 else 0.0
+                rolling = np.nan
+                if len(recent) >= MIN_HISTORY:
+                    std = np.std(recent)
+                    rolling = (amount - np.mean(recent)) / std if std > 0 else np.nan
+                recent.append(amount)
+
+                if robust > ROBUST_THRESHOLD and (np.isnan(rolling) or rolling > ROLLING_THRESHOLD):
+                    anomaly = Anomaly(expense_id, category_id, expense_date, amount, median, float(robust))
+                    model.anomalies[expense_id] = anomaly
+                    found.append(anomaly)
+            return found
+
+    def _fit(self, user_id):
+        # idx_expenses_user_date returns the rows already in date order
+        rows = self._connection().execute('''SELECT expense_id, category_id, date, amount, currency FROM Expenses
+                                             WHERE user_id = ?
+                                             ORDER BY date, expense_id''', (user_id,)).fetchall()
+        if not rows:
+            return _UserModel({}, {})
+
+        expense_ids, category_ids, dates, amounts, currencies = zip(*rows)
+        amounts = self.rates.convert(amounts, currencies, dates)
+        mask, scores, stats = detect(np.array(expense_ids), np.array(category_ids), amounts)
+
+        anomalies = {}
+        for i in np.flatnonzero(mask):
+            category_id = category_ids[i]
+            anomalies[expense_ids[i]] = Anomaly(expense_ids[i], category_id, dates[i], float(amounts[i]),
+                                                stats[category_id][0], float(scores[i]))
+        return _UserModel(anomalies, stats)
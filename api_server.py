@@ -0,0 +1,752 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from http import HTTPStatus
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+from archive import fetch_expenses
+from budgets import PERIODS, BudgetEngine
+from currency import RateCache, month_rate_sql
+from dashboard import DashboardProvider
+from database import DB_PATH, REPORTING_CURRENCY, connect, init_database, is_currency_code
+from forecast import Forecaster
+from pivot import PivotEngine
+from shards import ShardMap
+from trends import TrendAnalyzer
+from write_queue import WriteQueue
+
+# Local JSON API next to the desktop app. Reads run on a fixed pool of
+# threads, each with its own connection; expense writes go through the
+# group-committing write queue and are awaited without holding a thread.
+# Reports and budgets are answered by cached engines on their own threads.
+# With sharded storage each user's requests go to their own shard, which
+# has its own write queue, budget tracker and report engines.
+DEFAULT_PORT = 8765
+DB_WORKERS = 4
+DB_BACKLOG = 64
+WRITE_LATENCY_MS = 5
+
+SESSION_HOURS = 8
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+MAX_BODY = 64 * 1024
+
+# Latency percentiles are taken over the most recent samples of each route
+METRIC_SAMPLES = 2048
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Storage(NamedTuple):
+    write_queue: WriteQueue
+    budgets: 'BudgetTracker'
+    dashboard_provider: DashboardProvider
+    forecaster: Forecaster
+    pivot_engine: PivotEngine
+    trend_analyzer: TrendAnalyzer
+
+
+class Session(NamedTuple):
+    user_id: int
+    name: str
+    email: str
+    is_admin: bool
+    expires: float
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def to_json(value):
+    if isinstance(value, tuple) and hasattr(value, '_asdict'):
+        return {key: to_json(item) for key, item in value._asdict().items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def positive_number(value):
+    # json.loads lets NaN, Infinity and integers too large for a REAL
+    # through; none of them may reach the rollups
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return 0 < float(value) < math.inf
+    except OverflowError:
+        return False
+
+
+def parse_expense(data, partial=False):
+    # Validated column values from a JSON body; with partial only the
+    # fields present are returned
+    fields = {}
+    if 'date' in data or not partial:
+        try:
+            fields['date'] = datetime.strptime(str(data.get('date')), '%Y-%m-%d').strftime('%Y-%m-%d')
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "date must be YYYY-MM-DD")
+    if 'category_id' in data or not partial:
+        if not isinstance(data.get('category_id'), int):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "category_id must be an integer")
+        fields['category_id'] = data['category_id']
+    if 'amount' in data or not partial:
+        amount = data.get('amount')
+        if not positive_number(amount):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "amount must be a positive number")
+        fields['amount'] = float(amount)
+    if 'description' in data or not partial:
+        fields['description'] = str(data.get('description') or '')
+    if 'currency' in data or not partial:
+        currency = str(data.get('currency') or REPORTING_CURRENCY).strip().upper()
+        if not is_currency_code(currency):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "currency must be a 3-letter code")
+        fields['currency'] = currency
+    if partial and not fields:
+        raise ApiError(HTTPStatus.BAD_REQUEST, "Nothing to update")
+    return fields
+
+
+def expense_json(row):
+    expense_id, expense_date, category_id, category_name, amount, currency, description = row
+    return {'id': expense_id, 'date': expense_date, 'category_id': category_id, 'category': category_name,
+            'amount': amount, 'currency': currency, 'description': description}
+
+
+class DatabasePool:
+    # A bounded set of worker threads, each holding one connection per
+    # database (catalog or shard) for its lifetime. The semaphore caps queued
+    # work so a burst of requests waits in the event loop instead of piling
+    # up in the executor.
+    def __init__(self, db_path=DB_PATH, workers=DB_WORKERS, backlog=DB_BACKLOG):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._slots = asyncio.Semaphore(workers + backlog)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-db',
+                                            initializer=self._open)
+
+    async def run(self, func, *args, path=None):
+        # func(conn, *args) on a worker thread, against path or the catalog
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, func, args,
+                                                                    path or self.db_path)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _open(self):
+        self._local.connections = {}
+
+    def _call(self, func, args, path):
+        conn = self._local.connections.get(path)
+        if conn is None:
+            conn = self._local.connections[path] = connect(path, check_same_thread=False)
+            with self._lock:
+                self._connections.append(conn)
+        return func(conn, *args)
+
+
+class BudgetTracker:
+    # The budget engines of one database's users, kept between requests and
+    # read through one connection. An expense's engine is seeded before its
+    # insert is queued and the expense recorded once it commits, both under
+    # the lock, so concurrent inserts each count the others. Totals are
+    # reloaded when the file has changed (PRAGMA data_version), but not while
+    # one of the user's inserts is between the two steps.
+    def __init__(self, db_path):
+        self._conn = connect(db_path, check_same_thread=False)
+        self._engines = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='api-budgets')
+
+    def begin_async(self, user_id):
+        return self._executor.submit(self._begin, user_id)
+
+    def record_async(self, user_id, category_id, expense_date, amount):
+        return self._executor.submit(self._record, user_id, category_id, expense_date, amount)
+
+    def cancel(self, user_id):
+        # The insert begun for user_id failed
+        with self._lock:
+            self._engines[user_id][2] -= 1
+
+    def statuses_async(self, user_id):
+        return self._executor.submit(self._statuses, user_id)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    def _statuses(self, user_id):
+        with self._lock:
+            return self._engine(user_id)[0].statuses()
+
+    def _begin(self, user_id):
+        with self._lock:
+            self._engine(user_id)[2] += 1
+
+    def _record(self, user_id, category_id, expense_date, amount):
+        with self._lock:
+            entry = self._engines[user_id]
+            entry[2] -= 1
+            return entry[0].record(category_id, expense_date, amount)
+
+    def _engine(self, user_id):
+        # [engine, data_version it was loaded at, inserts in flight]; the
+        # caller holds the lock
+        entry = self._engines.get(user_id)
+        if entry is None:
+            entry = self._engines[user_id] = [BudgetEngine(user_id, conn=self._conn), None, 0]
+        version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        if entry[1] != version and not entry[2]:
+            entry[0].load()
+            entry[1] = version
+        return entry
+
+
+class LatencyMetrics:
+    def __init__(self, samples=METRIC_SAMPLES):
+        self.started = time.monotonic()
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._totals = defaultdict(float)
+        self._samples = defaultdict(lambda: deque(maxlen=samples))
+
+    def record(self, route, status, seconds):
+        self._counts[route] += 1
+        self._totals[route] += seconds
+        self._samples[route].append(seconds)
+        if status >= 500:
+            self._errors[route] += 1
+
+    def snapshot(self):
+        routes = {}
+        for route, count in sorted(self._counts.items()):
+            p50, p95, p99 = np.percentile(np.array(self._samples[route]) * 1000, [50, 95, 99])
+            routes[route] = {'count': count, 'errors': self._errors[route],
+                             'mean_ms': self._totals[route] / count * 1000,
+                             'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+                             'max_ms': max(self._samples[route]) * 1000}
+        uptime = time.monotonic() - self.started
+        requests = sum(self._counts.values())
+        return {'uptime_s': uptime, 'requests': requests,
+                'requests_per_s': requests / uptime if uptime else 0.0, 'routes': routes}
+
+
+class ApiServer:
+    def __init__(self, db_path=DB_PATH, workers=DB_WORKERS):
+        self.db_path = db_path
+        self.workers = workers
+        self.sessions = {}
+        self.metrics = LatencyMetrics()
+
+        self.rates = RateCache(db_path)
+        self.shard_map = ShardMap(db_path)
+        self.storages = {}
+
+        # (method, path segments, handler, needs a session); '{}' matches an id
+        self.routes = [
+            ('POST', ('login',), self.login, False),
+            ('POST', ('logout',), self.logout, True),
+            ('GET', ('metrics',), self.get_metrics, False),
+            ('GET', ('categories',), self.list_categories, True),
+            ('GET', ('expenses',), self.list_expenses, True),
+            ('POST', ('expenses',), self.create_expense, True),
+            ('GET', ('expenses', '{}'), self.get_expense, True),
+            ('PATCH', ('expenses', '{}'), self.update_expense, True),
+            ('DELETE', ('expenses', '{}'), self.delete_expense, True),
+            ('GET', ('budgets',), self.list_budgets, True),
+            ('PUT', ('budgets',), self.set_budget, True),
+            ('DELETE', ('budgets', '{}'), self.delete_budget, True),
+            ('GET', ('dashboard',), self.get_dashboard, True),
+            ('GET', ('reports', 'monthly'), self.monthly_report, True),
+            ('GET', ('reports', 'yearly'), self.yearly_report, True),
+            ('GET', ('reports', 'category'), self.category_report, True),
+            ('GET', ('reports', 'pivot'), self.pivot_report, True),
+            ('GET', ('reports', 'trends'), self.trend_report, True),
+            ('GET', ('reports', 'forecast'), self.forecast_report, True),
+        ]
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.pool = DatabasePool(self.db_path, self.workers)
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for storage in self.storages.values():
+            for engine in storage:
+                engine.close()
+        self.pool.close()
+        self.rates.close()
+        self.shard_map.close()
+
+    def storage(self, request):
+        # (database path, write queue and engines) of the session's user
+        path = self.shard_map.path_for(request['session'].user_id)
+        if path not in self.storages:
+            self.storages[path] = Storage(WriteQueue(path, latency_ms=WRITE_LATENCY_MS), BudgetTracker(path),
+                                          DashboardProvider(path),
+                                          Forecaster(path), PivotEngine(path), TrendAnalyzer(path))
+        return path, self.storages[path]
+
+    async def run_for_user(self, request, func, *args):
+        return await self.pool.run(func, *args, path=self.shard_map.path_for(request['session'].user_id))
+
+    async def handle_connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive: one request at a time per connection
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                started = time.perf_counter()
+
+                try:
+                    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                    method, target, version = request_line.split(' ', 2)
+                    headers = {}
+                    for line in header_lines:
+                        if line:
+                            name, _, value = line.partition(':')
+                            headers[name.strip().lower()] = value.strip()
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    await self.respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Malformed request"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                route, status, payload = await self.dispatch(method, target, headers, body)
+                await self.respond(writer, status, payload, keep_alive)
+                self.metrics.record(route, status, time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(to_json(payload)).encode()
+        status = HTTPStatus(status)
+        writer.write(f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(body)}\r\n'
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        segments = tuple(segment for segment in url.path.split('/') if segment)
+        route = f'{method} /{"/".join(segments)}'
+        try:
+            handler, needs_session, args, route = self.match(method, segments)
+            session = self.authenticate(headers) if needs_session else None
+            data = {}
+            if body:
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON")
+                if not isinstance(data, dict):
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+            request = {'session': session, 'query': dict(parse_qsl(url.query)), 'data': data, 'headers': headers}
+            status, payload = await handler(request, *args)
+        except ApiError as e:
+            status, payload = e.status, {'error': str(e)}
+        except sqlite3.IntegrityError as e:
+            status, payload = HTTPStatus.CONFLICT, {'error': str(e)}
+        except Exception:
+            # The details go to the server's log, not to the client
+            print(f"{route} failed:", file=sys.stderr)
+            traceback.print_exc()
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal server error"}
+        return route, status, payload
+
+    def match(self, method, segments):
+        allowed = False
+        for route_method, pattern, handler, needs_session in self.routes:
+            if len(pattern) != len(segments):
+                continue
+            args = []
+            for part, segment in zip(pattern, segments):
+                if part == '{}' and segment.isdigit():
+                    args.append(int(segment))
+                elif part != segment:
+                    break
+            else:
+                if route_method == method:
+                    return handler, needs_session, args, f"{method} /{'/'.join(pattern)}"
+                allowed = True
+        if allowed:
+            raise ApiError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+        raise ApiError(HTTPStatus.NOT_FOUND, "Not found")
+
+    def authenticate(self, headers):
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        session = self.sessions.get(token) if scheme.lower() == 'bearer' else None
+        if session is None or session.expires < time.time():
+            self.sessions.pop(token, None)
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Login required")
+        return session
+
+    def query_int(self, request, name, default, low=None, high=None):
+        value = request['query'].get(name)
+        if value is None:
+            return default
+        try:
+            value = int(value)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer")
+        if low is not None:
+            value = max(value, low)
+        if high is not None:
+            value = min(value, high)
+        return value
+
+    def query_date(self, request, name):
+        value = request['query'].get(name)
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} must be YYYY-MM-DD")
+        return value or None
+
+    # Session
+
+    async def login(self, request):
+        email = request['data'].get('email')
+        password = request['data'].get('password')
+        if not email or not password:
+            raise ApiError(HTTPStatus.BAD_REQUEST, "email and password are required")
+
+        def find_user(conn):
+            return conn.execute('SELECT user_id, name, email, is_admin FROM Users WHERE email = ? AND password = ?',
+                                (email, hash_password(password))).fetchone()
+
+        user = await self.pool.run(find_user)
+        if user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, "Invalid credentials")
+
+        token = secrets.token_urlsafe(32)
+        expires = time.time() + SESSION_HOURS * 3600
+        self.sessions[token] = Session(user[0], user[1], user[2], user[3] == 1, expires)
+        return HTTPStatus.OK, {'token': token, 'user_id': user[0], 'name': user[1], 'is_admin': user[3] == 1,
+                               'expires': datetime.fromtimestamp(expires).isoformat(timespec='seconds')}
+
+    async def logout(self, request):
+        token = request['headers']['authorization'].partition(' ')[2]
+        self.sessions.pop(token, None)
+        return HTTPStatus.OK, {}
+
+    async def get_metrics(self, request):
+        metrics = self.metrics.snapshot()
+        metrics['writes_committed'] = sum(storage.write_queue.writes_committed for storage in self.storages.values())
+        metrics['write_batches'] = sum(storage.write_queue.batches_committed for storage in self.storages.values())
+        return HTTPStatus.OK, metrics
+
+    # Expenses
+
+    async def list_categories(self, request):
+        rows = await self.pool.run(lambda conn: conn.execute(
+            'SELECT category_id, category_name FROM Categories ORDER BY category_name').fetchall())
+        return HTTPStatus.OK, {'categories': [{'id': row[0], 'name': row[1]} for row in rows]}
+
+    async def list_expenses(self, request):
+        # Keyset pagination in idx_expenses_user_date order: the cursor is the
+        # (date, id) of the last row returned, so every page is an index seek
+        # however deep the client pages
+        query = request['query']
+        limit = self.query_int(request, 'limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        date_from = self.query_date(request, 'from')
+        date_to = self.query_date(request, 'to')
+        filters = ['e.user_id = ?']
+        params = [request['session'].user_id]
+        if date_from:
+            filters.append('e.date >= ?')
+            params.append(date_from)
+        if date_to:
+            filters.append('e.date <= ?')
+            params.append(date_to)
+        if query.get('category_id'):
+            filters.append('e.category_id = ?')
+            params.append(self.query_int(request, 'category_id', None))
+        if query.get('currency'):
+            filters.append('e.currency = ?')
+            params.append(query['currency'].upper())
+        if query.get('q'):
+            filters.append("e.description LIKE ? ESCAPE '\\'")
+            params.append('%' + query['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if query.get('cursor'):
+            cursor_date, _, cursor_id = query['cursor'].partition(',')
+            try:
+                datetime.strptime(cursor_date, '%Y-%m-%d')
+            except ValueError:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Invalid cursor")
+            if not cursor_id.isdigit():
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Invalid cursor")
+            filters.append('(e.date < ? OR (e.date = ? AND e.expense_id < ?))')
+            params.extend([cursor_date, cursor_date, int(cursor_id)])
+
+        # Archived years are read too when the from date reaches into them;
+        # each source returns its own first page and the pages are merged
+        sql = f'''SELECT e.expense_id, e.date, e.category_id, c.category_name, e.amount, e.currency, e.description
+                  FROM {{expenses}} e
+                  JOIN Categories c ON e.category_id = c.category_id
+                  WHERE {' AND '.join(filters)}
+                  ORDER BY e.date DESC, e.expense_id DESC
+                  LIMIT ?'''
+        path = self.shard_map.path_for(request['session'].user_id)
+        rows = await self.pool.run(lambda conn: fetch_expenses(conn, path, sql, params + [limit + 1], date_from,
+                                                               date_to, key=lambda row: (row[1], row[0]),
+                                                               limit=limit + 1), path=path)
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f'{rows[-1][1]},{rows[-1][0]}'
+        return HTTPStatus.OK, {'expenses': [expense_json(row) for row in rows], 'next': next_cursor}
+
+    def fetch_expense(self, conn, user_id, expense_id):
+        return conn.execute('''SELECT e.expense_id, e.date, e.category_id, c.category_name, e.amount, e.currency,
+                                      e.description
+                               FROM Expenses e
+                               JOIN Categories c ON e.category_id = c.category_id
+                               WHERE e.user_id = ? AND e.expense_id = ?''', (user_id, expense_id)).fetchone()
+
+    async def get_expense(self, request, expense_id):
+        row = await self.run_for_user(request, self.fetch_expense, request['session'].user_id, expense_id)
+        if row is None:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Expense not found")
+        return HTTPStatus.OK, expense_json(row)
+
+    async def create_expense(self, request):
+        session = request['session']
+        fields = parse_expense(request['data'])
+        path, storage = self.storage(request)
+
+        def prepare(conn):
+            if conn.execute('SELECT 1 FROM Categories WHERE category_id = ?', (fields['category_id'],)).fetchone() is None:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Unknown category")
+            return self.rates.rate(fields['currency'], fields['date'])
+
+        rate = await self.pool.run(prepare, path=path)
+
+        # The user's budget totals are seeded before the insert, as in the
+        # desktop app, so the alerts below see the expense exactly once
+        await asyncio.wrap_future(storage.budgets.begin_async(session.user_id))
+        try:
+            future = storage.write_queue.submit('''INSERT INTO Expenses (user_id, category_id, date, amount, description,
+                                                                         currency)
+                                                   VALUES (?, ?, ?, ?, ?, ?)''',
+                                                (session.user_id, fields['category_id'], fields['date'],
+                                                 fields['amount'], fields['description'], fields['currency']))
+            result = await asyncio.wrap_future(future)
+        except BaseException:
+            storage.budgets.cancel(session.user_id)
+            raise
+
+        alerts = await asyncio.wrap_future(storage.budgets.record_async(session.user_id, fields['category_id'],
+                                                                        fields['date'], fields['amount'] * rate))
+        return HTTPStatus.CREATED, {'id': result.lastrowid,
+                                    'alerts': [dict(to_json(alert.status), threshold=alert.threshold)
+                                               for alert in alerts]}
+
+    async def update_expense(self, request, expense_id):
+        fields = parse_expense(request['data'], partial=True)
+        if 'category_id' in fields:
+            exists = await self.pool.run(lambda conn: conn.execute(
+                'SELECT 1 FROM Categories WHERE category_id = ?', (fields['category_id'],)).fetchone())
+            if exists is None:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "Unknown category")
+
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        _, storage = self.storage(request)
+        future = storage.write_queue.submit(f'UPDATE Expenses SET {assignments} WHERE user_id = ? AND expense_id = ?',
+                                            list(fields.values()) + [request['session'].user_id, expense_id])
+        result = await asyncio.wrap_future(future)
+        if not result.rowcount:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Expense not found")
+        return await self.get_expense(request, expense_id)
+
+    async def delete_expense(self, request, expense_id):
+        _, storage = self.storage(request)
+        future = storage.write_queue.submit('DELETE FROM Expenses WHERE user_id = ? AND expense_id = ?',
+                                            (request['session'].user_id, expense_id))
+        result = await asyncio.wrap_future(future)
+        if not result.rowcount:
+            raise ApiError(HTTPStatus.NOT_FOUND, "Expense not found")
+        return HTTPStatus.OK, {'id': expense_id}
+
+    # Budgets
+
+    async def list_budgets(self, request):
+        budgets = self.storage(request)[1].budgets
+        statuses = await asyncio.wrap_future(budgets.statuses_async(request['session'].user_id))
+        return HTTPStatus.OK, {'budgets': to_json(statuses)}
+
+    async def set_budget(self, request):
+        # One limit per user, category (null for overall) and period
+        data = request['data']
+        category_id = data.get('category_id')
+        period = data.get('period')
+        amount = data.get('limit_amount')
+        if period not in PERIODS:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"period must be one of {', '.join(PERIODS)}")
+        if category_id is not None and not isinstance(category_id, int):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "category_id must be an integer or null")
+        if not positive_number(amount):
+            raise ApiError(HTTPStatus.BAD_REQUEST, "limit_amount must be a positive number")
+
+        def replace(conn):
+            user_id = request['session'].user_id
+            with conn:
+                conn.execute('DELETE FROM CategoryBudgets WHERE user_id = ? AND category_id IS ? AND period = ?',
+                             (user_id, category_id, period))
+                cursor = conn.execute('''INSERT INTO CategoryBudgets (user_id, category_id, period, limit_amount)
+                                         VALUES (?, ?, ?, ?)''', (user_id, category_id, period, float(amount)))
+            return cursor.lastrowid
+
+        budget_id = await self.run_for_user(request, replace)
+        return HTTPStatus.OK, {'id': budget_id}
+
+    async def delete_budget(self, request, budget_id):
+        def remove(conn):
+            with conn:
+                return conn.execute('DELETE FROM CategoryBudgets WHERE budget_id = ? AND user_id = ?',
+                                    (budget_id, request['session'].user_id)).rowcount
+
+        if not await self.run_for_user(request, remove):
+            raise ApiError(HTTPStatus.NOT_FOUND, "Budget not found")
+        return HTTPStatus.OK, {'id': budget_id}
+
+    # Reports, in the reporting currency
+
+    async def get_dashboard(self, request):
+        provider = self.storage(request)[1].dashboard_provider
+        snapshot = await asyncio.wrap_future(provider.snapshot_async(request['session'].user_id))
+        result = to_json(snapshot)
+        result['recent'] = [dict(zip(('id', 'date', 'category', 'amount', 'description', 'currency'), row))
+                            for row in snapshot.recent]
+        return HTTPStatus.OK, result
+
+    async def monthly_report(self, request):
+        months = self.query_int(request, 'months', 12, 1)
+        rows = await self.run_for_user(request, lambda conn: conn.execute(f'''
+            SELECT t.month, SUM(t.total * {month_rate_sql('t')}), SUM(t.count) FROM MonthlyTotals t
+            WHERE t.user_id = ?
+            GROUP BY t.month
+            ORDER BY t.month DESC
+            LIMIT ?''', (request['session'].user_id, months)).fetchall())
+        return HTTPStatus.OK, {'currency': REPORTING_CURRENCY,
+                               'months': [{'month': row[0], 'total': row[1], 'count': row[2]} for row in reversed(rows)]}
+
+    async def yearly_report(self, request):
+        rows = await self.run_for_user(request, lambda conn: conn.execute(f'''
+            SELECT substr(t.month, 1, 4) AS year, SUM(t.total * {month_rate_sql('t')}), SUM(t.count) FROM MonthlyTotals t
+            WHERE t.user_id = ?
+            GROUP BY year
+            ORDER BY year''', (request['session'].user_id,)).fetchall())
+        return HTTPStatus.OK, {'currency': REPORTING_CURRENCY,
+                               'years': [{'year': row[0], 'total': row[1], 'count': row[2]} for row in rows]}
+
+    async def category_report(self, request):
+        rows = await self.run_for_user(request, lambda conn: conn.execute(f'''
+            SELECT c.category_id, c.category_name, SUM(t.total * {month_rate_sql('t')}) AS total, SUM(t.count)
+            FROM MonthlyTotals t
+            JOIN Categories c ON t.category_id = c.category_id
+            WHERE t.user_id = ?
+            GROUP BY c.category_id
+            ORDER BY total DESC''', (request['session'].user_id,)).fetchall())
+        return HTTPStatus.OK, {'currency': REPORTING_CURRENCY,
+                               'categories': [{'id': row[0], 'name': row[1], 'total': row[2], 'count': row[3]}
+                                              for row in rows]}
+
+    async def pivot_report(self, request):
+        months = self.query_int(request, 'months', None, 1)
+        engine = self.storage(request)[1].pivot_engine
+        matrix = await asyncio.wrap_future(engine.matrix_async(request['session'].user_id))
+        if months:
+            matrix = matrix.last(months)
+        return HTTPStatus.OK, dict(to_json(matrix), currency=REPORTING_CURRENCY)
+
+    async def trend_report(self, request):
+        analyzer = self.storage(request)[1].trend_analyzer
+        rows = await asyncio.wrap_future(analyzer.trends_async(request['session'].user_id))
+        return HTTPStatus.OK, {'currency': REPORTING_CURRENCY, 'trends': to_json(rows)}
+
+    async def forecast_report(self, request):
+        forecaster = self.storage(request)[1].forecaster
+        forecast = await asyncio.wrap_future(forecaster.forecast_async(request['session'].user_id))
+        return HTTPStatus.OK, dict(to_json(forecast), currency=REPORTING_CURRENCY)
+
+
+async def serve(db_path, host, port, workers):
+    server = ApiServer(db_path, workers)
+    await server.start(host, port)
+    print(f"Serving {db_path} on http://{host}:{port} ({workers} database workers)", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+        for route, stats in server.metrics.snapshot()['routes'].items():
+            print(f"{route:<28}{stats['count']:>9} requests  p50 {stats['p50_ms']:.2f} ms  p95 {stats['p95_ms']:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local JSON API for the expense tracker database")
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=DB_WORKERS)
+    args = parser.parse_args()
+
+    init_database(args.db)
+    try:
+        asyncio.run(serve(args.db, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
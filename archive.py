@@ -0,0 +1,198 @@
+import os
+from contextlib import contextmanager
+from datetime import date
+
+from changelog import set_capture
+from database import connect
+
+# Cold expenses are moved out of Expenses into one file per year,
+# <name>.archive<YEAR>.db next to the database they came from (the catalog
+# or a shard). The MonthlyTotals and DailyTotals rollups keep covering the
+# archived rows, so dashboards, budgets and reports never open an archive;
+# only listings whose date filter starts before the horizon attach the
+# years they reach into. Archived expenses are read-only.
+ARCHIVE_KEEP_YEARS = 2
+
+
+def archive_path(db_path, year):
+    base = db_path[:-3] if db_path.endswith('.db') else db_path
+    return f'{base}.archive{year}.db'
+
+
+def archive_cutoff(keep_years=ARCHIVE_KEEP_YEARS, today=None):
+    # First day kept live: the current year and keep_years - 1 before it
+    return f'{(today or date.today()).year - keep_years + 1}-01-01'
+
+
+def archived_years(conn):
+    return [row[0] for row in conn.execute('SELECT year FROM main.ArchivedYears ORDER BY year DESC')]
+
+
+def archive_horizon(conn):
+    # Dates before this may be in an archive; None when nothing is archived
+    row = conn.execute('SELECT MAX(year) FROM main.ArchivedYears').fetchone()
+    return f'{row[0] + 1}-01-01' if row[0] is not None else None
+
+
+def expense_table(conn):
+    # The live Expenses table's column definitions and (name, type) pairs,
+    # for creating archives like it
+    table_sql = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = 'Expenses'").fetchone()[0]
+    column_types = [(row[1], row[2]) for row in conn.execute('PRAGMA main.table_info(Expenses)')]
+    return table_sql[table_sql.index('(') + 1:table_sql.rindex(')')], column_types
+
+
+def init_archive(path, columns, column_types):
+    conn = connect(path)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS Expenses ({columns})')
+    # Archives written before a column was added to Expenses
+    existing = {row[1] for row in conn.execute('PRAGMA table_info(Expenses)')}
+    for column, column_type in column_types:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE Expenses ADD COLUMN {column} {column_type}')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON Expenses (user_id, date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON Expenses (user_id, amount)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON Expenses (user_id, category_id, date)')
+    conn.commit()
+    conn.close()
+
+
+def adjust_rollups(conn, source, where, params, sign):
+    # Add (sign 1) or remove (sign -1) the contribution of source's matching
+    # rows to the rollups, which the Expenses triggers never see for archives
+    conn.execute(f'''INSERT INTO main.MonthlyTotals (user_id, month, category_id, currency, total, count)
+                     SELECT user_id, substr(date, 1, 7), category_id, currency, {sign} * SUM(amount), {sign} * COUNT(*)
+                     FROM {source} WHERE {where}
+                     GROUP BY user_id, substr(date, 1, 7), category_id, currency
+                     ON CONFLICT (user_id, month, category_id, currency)
+                     DO UPDATE SET total = total + excluded.total, count = count + excluded.count''', params)
+    conn.execute(f'''INSERT INTO main.DailyTotals (user_id, day, currency, total, count)
+                     SELECT user_id, date, currency, {sign} * SUM(amount), {sign} * COUNT(*)
+                     FROM {source} WHERE {where}
+                     GROUP BY user_id, date, currency
+                     ON CONFLICT (user_id, day, currency)
+                     DO UPDATE SET total = total + excluded.total, count = count + excluded.count''', params)
+    conn.execute('DELETE FROM main.MonthlyTotals WHERE count <= 0')
+    conn.execute('DELETE FROM main.DailyTotals WHERE count <= 0')
+
+
+def archive_expenses(db_path, cutoff):
+    # Move every expense dated before cutoff into its year's archive; one
+    # transaction per year. Returns the number of rows moved.
+    conn = connect(db_path)
+    years = [int(row[0]) for row in conn.execute('SELECT DISTINCT substr(date, 1, 4) FROM main.Expenses WHERE date < ?',
+                                                 (cutoff,))]
+    definition, column_types = expense_table(conn)
+    columns = ', '.join(column for column, column_type in column_types)
+
+    moved = 0
+    for year in years:
+        path = archive_path(db_path, year)
+        init_archive(path, definition, column_types)
+        # ATTACH cannot run inside a transaction
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            where = 'date >= ? AND date < ?'
+            params = (f'{year}-01-01', min(f'{year + 1}-01-01', cutoff))
+            # The delete triggers take the rows out of the rollups; adding
+            # them back first leaves the rollups unchanged. Moving a row is
+            # not a change to sync.
+            adjust_rollups(conn, 'main.Expenses', where, params, 1)
+            conn.execute(f'INSERT INTO archive.Expenses ({columns}) SELECT {columns} FROM main.Expenses WHERE {where}',
+                         params)
+            set_capture(conn, False)
+            moved += conn.execute(f'DELETE FROM main.Expenses WHERE {where}', params).rowcount
+            set_capture(conn, True)
+            conn.execute('''INSERT INTO main.ArchivedYears (year, expense_count)
+                            VALUES (?, (SELECT COUNT(*) FROM archive.Expenses))
+                            ON CONFLICT (year) DO UPDATE SET expense_count = excluded.expense_count,
+                                                             archived_at = CURRENT_TIMESTAMP''', (year,))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    conn.close()
+    return moved
+
+
+def purge_archives(db_path, user_id=None):
+    # Remove one user's archived expenses, or all of them (after the live
+    # table has been cleared), together with their share of the rollups
+    conn = connect(db_path)
+    for year in archived_years(conn):
+        path = archive_path(db_path, year)
+        if user_id is None:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM main.MonthlyTotals WHERE month >= ? AND month < ?',
+                         (f'{year}-01', f'{year + 1}-01'))
+            conn.execute('DELETE FROM main.DailyTotals WHERE day >= ? AND day < ?',
+                         (f'{year}-01-01', f'{year + 1}-01-01'))
+            conn.execute('DELETE FROM main.ArchivedYears WHERE year = ?', (year,))
+            conn.commit()
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        if not os.path.exists(path):
+            continue
+
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            adjust_rollups(conn, 'archive.Expenses', 'user_id = ?', (user_id,), -1)
+            conn.execute('DELETE FROM archive.Expenses WHERE user_id = ?', (user_id,))
+            conn.execute('UPDATE main.ArchivedYears SET expense_count = (SELECT COUNT(*) FROM archive.Expenses) WHERE year = ?',
+                         (year,))
+            conn.commit()
+        finally:
+            conn.execute('DETACH DATABASE archive')
+    conn.close()
+
+
+@contextmanager
+def attached(conn, path):
+    conn.execute('ATTACH DATABASE ? AS archive', (path,))
+    try:
+        yield 'archive.Expenses'
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+
+def expense_sources(conn, db_path, date_from=None, date_to=None):
+    # Tables holding the user's expenses in [date_from, date_to]: the live
+    # table, then each archived year the range overlaps, newest first, each
+    # attached only while it is being read. Without date_from listings stay
+    # within the live table.
+    yield 'main.Expenses'
+    if not date_from:
+        return
+    for year in archived_years(conn):
+        if date_from > f'{year}-12-31' or (date_to and date_to < f'{year}-01-01'):
+            continue
+        path = archive_path(db_path, year)
+        if os.path.exists(path):
+            with attached(conn, path) as source:
+                yield source
+
+
+def all_expense_sources(conn, db_path):
+    # Every table holding expenses, for exports and whole-system jobs
+    return expense_sources(conn, db_path, '0000-01-01')
+
+
+def fetch_expenses(conn, db_path, sql, params, date_from=None, date_to=None, key=None, limit=None, reverse=True):
+    # Run sql against every source the date range reaches and merge the
+    # results by key, largest (newest) first unless reverse is False. In sql
+    # {expenses} stands for the table and {archived} for 0 (live) or 1
+    # (archived).
+    rows = []
+    sources = 0
+    for source in expense_sources(conn, db_path, date_from, date_to):
+        statement = sql.replace('{expenses}', source).replace('{archived}', str(int(source != 'main.Expenses')))
+        rows.extend(conn.execute(statement, params).fetchall())
+        sources += 1
+    if sources > 1:
+        rows.sort(key=key, reverse=reverse)
+    return rows[:limit] if limit else rows
@@ -0,0 +1,197 @@
+import hashlib
+import mmap
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from PIL import Image, UnidentifiedImageError
+
+from archive import all_expense_sources
+from database import DB_PATH, connect
+
+# Receipts and other files attached to expenses. The files live outside the
+# database, in a directory next to it named after their SHA-256
+# (expense_tracker.attachments/objects/ab/ab12...), so the same receipt
+# attached twice is stored once and the database only holds a small row per
+# attachment. Files are hashed through a memory map and copied by the OS,
+# and never read into memory whole; thumbnails are made on first view and
+# kept in thumbs/.
+
+# Bytes per read when copying a file out of the store
+CHUNK_SIZE = 1024 * 1024
+
+# Edge of the square thumbnails, in pixels
+THUMBNAIL_SIZE = 160
+
+# Stored files nothing refers to are removed after this long; a file is
+# stored before its row is written, so a new one is never taken for garbage
+GARBAGE_GRACE = 60 * 60
+
+
+class Attachment(NamedTuple):
+    attachment_id: int
+    expense_id: int
+    sha256: str
+    file_name: str
+    size: int
+    added_at: str
+
+
+def attachments_dir(db_path):
+    base = db_path[:-3] if db_path.endswith('.db') else db_path
+    return f'{base}.attachments'
+
+
+def file_digest(path):
+    # SHA-256 of a file of any size through a memory map, without copying
+    # it into Python
+    with open(path, 'rb') as source:
+        if os.fstat(source.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+
+def open_with_viewer(path):
+    # The system's viewer for the file type, outside this process
+    if sys.platform == 'win32':
+        os.startfile(path)
+    elif sys.platform == 'darwin':
+        subprocess.Popen(['open', path])
+    else:
+        subprocess.Popen(['xdg-open', path])
+
+
+def collect_garbage(conn, db_path, grace=GARBAGE_GRACE):
+    # Drop the rows of expenses deleted from the live table and every
+    # archive, then the stored files and thumbnails no row refers to.
+    # Returns a note for the maintenance log.
+    orphans = dict(conn.execute('''SELECT a.attachment_id, a.expense_id FROM main.Attachments a
+                                   WHERE NOT EXISTS (SELECT 1 FROM main.Expenses e
+                                                     WHERE e.expense_id = a.expense_id)'''))
+    if orphans:
+        # Archiving moves expenses out of the live table; their receipts stay
+        missing = set(orphans.values())
+        for source in all_expense_sources(conn, db_path):
+            if source == 'main.Expenses' or not missing:
+                continue
+            placeholders = ', '.join('?' * len(missing))
+            missing -= {row[0] for row in conn.execute(f'SELECT expense_id FROM {source} WHERE expense_id IN ({placeholders})',
+                                                       list(missing))}
+        dropped = [(attachment_id,) for attachment_id, expense_id in orphans.items() if expense_id in missing]
+        conn.executemany('DELETE FROM main.Attachments WHERE attachment_id = ?', dropped)
+        conn.commit()
+
+    store = attachments_dir(db_path)
+    referenced = {row[0] for row in conn.execute('SELECT DISTINCT sha256 FROM main.Attachments')}
+    cutoff = time.time() - grace
+    removed = 0
+    for folder in ('objects', 'thumbs'):
+        for root, dirs, files in os.walk(os.path.join(store, folder)):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.split('-')[0].split('.')[0] in referenced or os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                removed += folder == 'objects'
+    return f'{removed} unused files removed'
+
+
+class AttachmentStore:
+    # Content-addressed store for one database file. Adding and thumbnails
+    # run on a background thread; listing is a small indexed read.
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self.store = attachments_dir(db_path)
+        self._thumbnail_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='attachments')
+
+    def object_path(self, sha256):
+        return os.path.join(self.store, 'objects', sha256[:2], sha256)
+
+    def thumbnail_path(self, sha256, size=THUMBNAIL_SIZE):
+        return os.path.join(self.store, 'thumbs', f'{sha256}-{size}.png')
+
+    def list(self, expense_id):
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute('''SELECT attachment_id, expense_id, sha256, file_name, size, added_at
+                                   FROM Attachments WHERE expense_id = ?
+                                   ORDER BY attachment_id''', (expense_id,)).fetchall()
+        finally:
+            conn.close()
+        return [Attachment(*row) for row in rows]
+
+    def add(self, expense_id, source_path):
+        # Store the file unless the same content is already stored, then
+        # record it against the expense
+        sha256 = file_digest(source_path)
+        target = self.object_path(sha256)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            partial = f'{target}.{os.getpid()}.{threading.get_ident()}.part'
+            shutil.copyfile(source_path, partial)
+            os.replace(partial, target)
+        else:
+            # Touched, so a collection running now keeps it
+            os.utime(target)
+
+        conn = connect(self.db_path)
+        try:
+            cursor = conn.execute('INSERT INTO Attachments (expense_id, sha256, file_name, size) VALUES (?, ?, ?, ?)',
+                                  (expense_id, sha256, os.path.basename(source_path), os.path.getsize(target)))
+            conn.commit()
+            row = conn.execute('''SELECT attachment_id, expense_id, sha256, file_name, size, added_at
+                                  FROM Attachments WHERE attachment_id = ?''', (cursor.lastrowid,)).fetchone()
+        finally:
+            conn.close()
+        return Attachment(*row)
+
+    def add_async(self, expense_id, source_paths):
+        return self._executor.submit(lambda: [self.add(expense_id, path) for path in source_paths])
+
+    def remove(self, attachment_id):
+        # The file goes at the next collection, if nothing else refers to it
+        conn = connect(self.db_path)
+        try:
+            conn.execute('DELETE FROM Attachments WHERE attachment_id = ?', (attachment_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def copy_to(self, attachment, target_path):
+        with open(self.object_path(attachment.sha256), 'rb') as source, open(target_path, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+
+    def open(self, attachment):
+        open_with_viewer(self.object_path(attachment.sha256))
+
+    def thumbnail(self, attachment, size=THUMBNAIL_SIZE):
+        # Path of a PNG no larger than size x size, made on first use; None
+        # for files that are not images. JPEGs are decoded at a reduced
+        # scale, so even large photos are never expanded in full.
+        path = self.thumbnail_path(attachment.sha256, size)
+        with self._thumbnail_lock:
+            if os.path.exists(path):
+                return path
+            try:
+                with Image.open(self.object_path(attachment.sha256)) as image:
+                    image.draft('RGB', (size, size))
+                    image.thumbnail((size, size))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    image.convert('RGBA').save(f'{path}.part', 'PNG')
+            except (UnidentifiedImageError, OSError):
+                return None
+            os.replace(f'{path}.part', path)
+            return path
+
+    def thumbnail_async(self, attachment, size=THUMBNAIL_SIZE):
+        return self._executor.submit(self.thumbnail, attachment, size)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
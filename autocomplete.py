@@ -0,0 +1,220 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import lru_cache
+from heapq import nlargest
+from typing import NamedTuple
+
+from database import DB_PATH, connect
+
+# As-you-type suggestions for the expense description, from the user's own
+# past descriptions. Each distinct description is indexed under the start of
+# every word in it (so "bigb" finds "Groceries - BigBasket") in one sorted
+# list searched with bisect, and ranked by how often and how recently it was
+# used: every use adds a weight that doubles every HALF_LIFE_DAYS, so a use
+# today counts as much as two uses HALF_LIFE_DAYS ago. Weights are kept as
+# their base-2 logarithms, which stay finite for any date.
+HALF_LIFE_DAYS = 90
+EPOCH = date(2000, 1, 1).toordinal()
+
+# Suggestions returned per lookup
+SUGGESTIONS = 8
+
+# Prefixes up to this length match too many descriptions to rank at lookup;
+# each keeps its running top SUGGESTIONS instead. Weights only grow, so a
+# description can only enter a top list when it is used itself.
+RANKED_PREFIX = 6
+
+WORD_START = re.compile(r'(?<!\w)\w')
+
+
+class Suggestion(NamedTuple):
+    description: str
+    category_id: int
+    amount: float
+    currency: str
+    uses: int
+    last_date: str
+
+
+class _Entry:
+    # One distinct description. Categories are weighted like the entry
+    # itself; the amount is the one last used.
+    def __init__(self, description):
+        self.description = description
+        self.weight = -math.inf
+        self.uses = 0
+        self.last_date = ''
+        self.amount = None
+        self.currency = None
+        self.categories = defaultdict(lambda: -math.inf)
+
+    def add(self, category_id, expense_date, amount, currency):
+        weight = recency_weight(expense_date)
+        self.weight = add_log2(self.weight, weight)
+        self.uses += 1
+        self.categories[category_id] = add_log2(self.categories[category_id], weight)
+        if expense_date >= self.last_date:
+            self.last_date = expense_date
+            self.amount = amount
+            self.currency = currency
+
+    def suggestion(self):
+        category_id = max(self.categories, key=self.categories.get)
+        return Suggestion(self.description, category_id, self.amount, self.currency, self.uses, self.last_date)
+
+
+def normalize(text):
+    return ' '.join(text.split()).casefold()
+
+
+@lru_cache(maxsize=4096)
+def recency_weight(expense_date):
+    # log2 of a use's weight
+    try:
+        days = date.fromisoformat(expense_date[:10]).toordinal() - EPOCH
+    except ValueError:
+        days = 0
+    return days / HALF_LIFE_DAYS
+
+
+def add_log2(a, b):
+    # log2(2**a + 2**b), without forming either power
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2.0 ** (low - high))
+
+
+def word_suffixes(text):
+    return [text[match.start():] for match in WORD_START.finditer(text)]
+
+
+class _UserIndex:
+    # Entries by normalized text, the sorted (word suffix, text) keys, and
+    # the ranked texts of each short prefix
+    def __init__(self, rows=()):
+        self.entries = {}
+        for description, category_id, expense_date, amount, currency in rows:
+            text = normalize(description)
+            if text:
+                self.entry(text, description).add(category_id, expense_date, amount, currency)
+
+        self.keys = sorted((suffix, text) for text in self.entries for suffix in word_suffixes(text))
+        prefixes = defaultdict(set)
+        for suffix, text in self.keys:
+            for length in range(1, RANKED_PREFIX + 1):
+                prefixes[suffix[:length]].add(text)
+        self.top = {prefix: self.rank(texts) for prefix, texts in prefixes.items()}
+
+    def entry(self, text, description):
+        entry = self.entries.get(text)
+        if entry is None:
+            entry = self.entries[text] = _Entry(' '.join(description.split()))
+        return entry
+
+    def rank(self, texts):
+        return nlargest(SUGGESTIONS, texts, key=lambda text: self.entries[text].weight)
+
+    def add(self, description, category_id, expense_date, amount, currency):
+        text = normalize(description)
+        if not text:
+            return
+        new = text not in self.entries
+        self.entry(text, description).add(category_id, expense_date, amount, currency)
+        for suffix in set(word_suffixes(text)):
+            if new:
+                insort(self.keys, (suffix, text))
+            for length in range(1, RANKED_PREFIX + 1):
+                top = self.top.setdefault(suffix[:length], [])
+                self.top[suffix[:length]] = self.rank(set(top) | {text})
+
+    def lookup(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= RANKED_PREFIX:
+            texts = self.top.get(prefix, [])
+        else:
+            start = bisect_left(self.keys, (prefix,))
+            end = bisect_left(self.keys, (prefix + '\U0010ffff',), start)
+            texts = self.rank({text for key, text in self.keys[start:end]})
+        # An exact match is already typed out, so it goes last
+        texts = sorted(texts, key=lambda text: text == prefix)
+        return [self.entries[text].suggestion() for text in texts[:limit]]
+
+
+class DescriptionIndex:
+    # Per-user prefix index of expense descriptions, built in the background
+    # at login and then kept current from change events: new expenses are
+    # added to it, anything else rebuilds it on next use. Lookups run on the
+    # caller's thread and take microseconds.
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._indexes = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='autocomplete')
+
+    def suggest(self, user_id, prefix, limit=SUGGESTIONS):
+        # [] while the user's index is still being built
+        with self._lock:
+            index = self._indexes.get(user_id)
+            return index.lookup(prefix, limit) if index else []
+
+    def load(self, user_id):
+        with self._lock:
+            if user_id in self._indexes:
+                return
+            generation = self._generation
+        # idx_expenses_user_date returns the rows in date order, so the last
+        # use of each description is seen last
+        rows = self._connection().execute('''SELECT description, category_id, date, amount, currency FROM Expenses
+                                             WHERE user_id = ? AND description IS NOT NULL
+                                             ORDER BY date, expense_id''', (user_id,)).fetchall()
+        index = _UserIndex(rows)
+        with self._lock:
+            # Not if the rows changed while it was being built
+            if generation == self._generation:
+                self._indexes.setdefault(user_id, index)
+
+    def load_async(self, user_id):
+        return self._executor.submit(self.load, user_id)
+
+    def add(self, user_id, expense_ids):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is None:
+                return
+            placeholders = ', '.join('?' * len(expense_ids))
+            rows = self._connection().execute(f'''SELECT description, category_id, date, amount, currency FROM Expenses
+                                                  WHERE user_id = ? AND expense_id IN ({placeholders})
+                                                  AND description IS NOT NULL''',
+                                              [user_id] + list(expense_ids)).fetchall()
+            for row in rows:
+                index.add(*row)
+
+    def add_async(self, user_id, expense_ids):
+        return self._executor.submit(self.add, user_id, expense_ids)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            self._generation += 1
+            if user_id is None:
+                self._indexes.clear()
+            else:
+                self._indexes.pop(user_id, None)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, check_same_thread=False)
+        return self._conn
@@ -0,0 +1,77 @@
+# Anomaly detection cost: the vectorized pass over in-memory arrays of up
+# to a million expenses, a full fit from the database, and scoring a new
+# insert incrementally.
+#
+#   python -m benchmarks.bench_anomalies
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from anomalies import AnomalyDetector, detect
+from database import connect, init_database
+
+
+def synthetic(size, seed=42):
+    rng = np.random.default_rng(seed)
+    category_ids = rng.integers(1, 6, size)
+    amounts = rng.lognormal(6, 0.8, size)
+    amounts[rng.random(size) < 0.001] *= 25
+    return np.arange(size), category_ids, amounts
+
+
+def populate(db_path, size):
+    init_database(db_path)
+    random.seed(42)
+    _, category_ids, amounts = synthetic(size)
+    first = date(2010, 1, 1)
+    rows = [(1, int(category_id), (first + timedelta(days=i * 5000 // size)).isoformat(), float(amount), 'Purchase')
+            for i, (category_id, amount) in enumerate(zip(category_ids, amounts))]
+
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    print(f"{'expenses':>10}{'detect ms':>11}{'flagged':>9}")
+    for size in (10_000, 100_000, 1_000_000):
+        expense_ids, category_ids, amounts = synthetic(size)
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            mask, scores, stats = detect(expense_ids, category_ids, amounts)
+            timings.append(time.perf_counter() - start)
+        print(f"{size:>10}{min(timings) * 1000:>11.1f}{int(mask.sum()):>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        size = 200_000
+        populate(db_path, size)
+        detector = AnomalyDetector(db_path)
+
+        start = time.perf_counter()
+        detector.anomalies(1)
+        fitted = time.perf_counter() - start
+
+        conn = connect(db_path)
+        cursor = conn.execute('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                                 VALUES (1, 1, '2024-01-01', 90000, 'Outlier')''')
+        conn.commit()
+        start = time.perf_counter()
+        found = detector.add(1, [cursor.lastrowid])
+        added = time.perf_counter() - start
+
+        print(f"\nfit from database, {size} expenses: {fitted * 1000:.1f} ms")
+        print(f"incremental insert: {added * 1000:.3f} ms (flagged: {bool(found)})")
+        conn.close()
+        detector.close()
+
+
+if __name__ == '__main__':
+    main()
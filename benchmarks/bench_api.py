@@ -0,0 +1,151 @@
+# Requests per second against the local JSON API: a mixed read/write load
+# (expense pages, dashboard, reports, inserts) from N keep-alive clients.
+# Without an address a server is started on a temporary database.
+#
+#   python -m benchmarks.bench_api [host:port] [seconds]
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from api_server import DEFAULT_PORT
+from database import connect, init_database
+
+EMAIL = 'admin@expense.com'
+PASSWORD = 'admin123'
+
+# (weight, method, path, body)
+MIX = (
+    (50, 'GET', '/expenses?limit=50', None),
+    (15, 'GET', '/dashboard', None),
+    (10, 'GET', '/reports/monthly', None),
+    (5, 'GET', '/reports/category', None),
+    (5, 'GET', '/budgets', None),
+    (15, 'POST', '/expenses', {'date': '2024-06-01', 'category_id': 1, 'amount': 99.0, 'description': 'Load test'}),
+)
+
+
+class Client:
+    # One keep-alive HTTP/1.1 connection
+    def __init__(self, host, port, token=None):
+        self.host = host
+        self.port = port
+        self.token = token
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method, path, body=None):
+        payload = json.dumps(body).encode() if body is not None else b''
+        auth = f'Authorization: Bearer {self.token}\r\n' if self.token else ''
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n{auth}'
+                          f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ')[1])
+        length = next(int(line.split(':', 1)[1]) for line in lines if line.lower().startswith('content-length'))
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        self.writer.close()
+
+
+def populate(db_path, size):
+    init_database(db_path)
+    random.seed(42)
+    first = date(2015, 1, 1)
+    rows = [(1, random.randint(1, 5), (first + timedelta(days=i * 3650 // size)).isoformat(),
+             round(random.uniform(10, 2000), 2), f'Purchase {i}') for i in range(size)]
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+
+
+async def wait_for_server(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def worker(host, port, token, until, latencies, statuses):
+    client = Client(host, port, token)
+    await client.open()
+    weights = [entry[0] for entry in MIX]
+    try:
+        while time.monotonic() < until:
+            _, method, path, body = random.choices(MIX, weights)[0]
+            start = time.perf_counter()
+            status, _ = await client.request(method, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        client.close()
+
+
+async def run(host, port, seconds):
+    await wait_for_server(host, port)
+    login = Client(host, port)
+    await login.open()
+    status, session = await login.request('POST', '/login', {'email': EMAIL, 'password': PASSWORD})
+    if status != 200:
+        raise SystemExit(f"Login failed: {session}")
+    login.token = session['token']
+
+    print(f"{'clients':>8}{'requests':>10}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for clients in (1, 4, 16, 64):
+        latencies, statuses = [], {}
+        start = time.monotonic()
+        await asyncio.gather(*(worker(host, port, login.token, start + seconds, latencies, statuses)
+                               for _ in range(clients)))
+        elapsed = time.monotonic() - start
+        p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+        print(f"{clients:>8}{len(latencies):>10}{len(latencies) / elapsed:>10.0f}"
+              f"{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}  {dict(sorted(statuses.items()))}")
+
+    _, metrics = await login.request('GET', '/metrics')
+    print(f"\nserver side ({metrics['writes_committed']} writes in {metrics['write_batches']} commits):")
+    for route, stats in metrics['routes'].items():
+        print(f"  {route:<24}{stats['count']:>9}  p50 {stats['p50_ms']:6.2f} ms  p95 {stats['p95_ms']:6.2f} ms")
+    login.close()
+
+
+def main():
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    if len(sys.argv) > 1:
+        host, _, port = sys.argv[1].partition(':')
+        asyncio.run(run(host, int(port or DEFAULT_PORT), seconds))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        populate(db_path, 100_000)
+        port = DEFAULT_PORT + 1
+        server = subprocess.Popen([sys.executable, '-m', 'api_server', '--db', db_path, '--port', str(port)],
+                                  stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(run('127.0.0.1', port, seconds))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# Description autocomplete: time to build a user's prefix index and to look
+# up suggestions for prefixes of one to ten characters, for histories of
+# growing size, against a LIKE query on the expense table.
+#
+#   python -m benchmarks.bench_autocomplete
+import os
+import random
+import string
+import tempfile
+import time
+
+from autocomplete import DescriptionIndex
+from database import connect, init_database
+
+SIZES = (10_000, 100_000, 500_000)
+DISTINCT = 5_000
+LOOKUPS = 2_000
+
+SHOPS = ('BigBasket', 'Swiggy', 'Zomato', 'Amazon', 'Uber', 'Ola', 'Reliance Fresh', 'DMart', 'Netflix', 'Airtel')
+KINDS = ('Groceries', 'Dinner', 'Lunch', 'Taxi', 'Books', 'Electricity', 'Subscription', 'Medicine', 'Fuel', 'Gift')
+
+
+def descriptions():
+    random.seed(42)
+    found = set()
+    while len(found) < DISTINCT:
+        suffix = ''.join(random.choices(string.ascii_lowercase, k=4)) if len(found) >= len(KINDS) * len(SHOPS) else ''
+        found.add(f'{random.choice(KINDS)} - {random.choice(SHOPS)} {suffix}'.strip())
+    return sorted(found)
+
+
+def populate(db_path, expenses, texts):
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.execute("INSERT INTO Users (name, email, password) VALUES ('Bench', 'bench@example.com', '-')")
+    # A few descriptions take most of the uses, as in real histories
+    weights = [1 / (rank + 1) for rank in range(len(texts))]
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (1, ?, ?, ?, ?)''',
+                     ((random.randint(1, 5),
+                       f'{random.randint(2015, 2024)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+                       round(random.uniform(20, 2000), 2), text)
+                      for text in random.choices(texts, weights, k=expenses)))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    texts = descriptions()
+    prefixes = [text.casefold()[:length] for text in random.choices(texts, k=LOOKUPS) for length in range(1, 11)]
+    print(f"{'expenses':>9}{'build ms':>10}{'lookup us':>11}{'p99 us':>10}{'LIKE us':>10}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            populate(db_path, size, texts)
+            index = DescriptionIndex(db_path)
+
+            begin = time.perf_counter()
+            index.load(1)
+            built = time.perf_counter() - begin
+
+            timings = []
+            for prefix in prefixes:
+                begin = time.perf_counter()
+                index.suggest(1, prefix)
+                timings.append(time.perf_counter() - begin)
+
+            conn = connect(db_path)
+            begin = time.perf_counter()
+            for prefix in prefixes[:60]:
+                conn.execute('''SELECT description, COUNT(*) FROM Expenses WHERE user_id = ? AND description LIKE ?
+                                GROUP BY description ORDER BY COUNT(*) DESC LIMIT 8''', (1, prefix + '%')).fetchall()
+            like = (time.perf_counter() - begin) / 60
+            conn.close()
+            index.close()
+
+            print(f"{size:>9}{built * 1000:>10.1f}{sum(timings) / len(timings) * 1e6:>11.1f}"
+                  f"{sorted(timings)[len(timings) * 99 // 100] * 1e6:>10.1f}{like * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# Calendar heatmap build and render time for ranges from one month to
+# twenty years, over 20 years of history. Rendering uses the Agg backend,
+# so no display is needed.
+#
+#   python -m benchmarks.bench_calendar
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from calendar_heatmap import CalendarHeatmap
+from database import connect, init_database
+
+TODAY = date(2024, 6, 15)
+RANGES = (('1 month', 30), ('1 year', 365), ('5 years', 5 * 365), ('20 years', 20 * 365))
+
+
+def populate(db_path, per_day):
+    init_database(db_path)
+    random.seed(42)
+    rows = []
+    day = TODAY - timedelta(days=20 * 365)
+    while day <= TODAY:
+        for _ in range(per_day):
+            rows.append((1, random.randint(1, 5), day.isoformat(), round(random.uniform(20, 2000), 2), 'Purchase'))
+        day += timedelta(days=1)
+
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def render(calendar_grid):
+    fig, ax = plt.subplots(figsize=(12, 4))
+    ax.imshow(calendar_grid.grid, aspect='auto', interpolation='nearest')
+    fig.canvas.draw()
+    plt.close(fig)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        expenses = populate(db_path, 5)
+        heatmap = CalendarHeatmap(db_path)
+        print(f"{expenses} expenses")
+        print(f"{'range':>10}{'binning':>9}{'cells':>7}{'build ms':>10}{'render ms':>11}")
+
+        for name, days in RANGES:
+            start = TODAY - timedelta(days=days - 1)
+            heatmap.grid(1, start, TODAY)
+            heatmap._cache.clear()
+
+            begin = time.perf_counter()
+            calendar_grid = heatmap.grid(1, start, TODAY)
+            built = time.perf_counter() - begin
+
+            begin = time.perf_counter()
+            render(calendar_grid)
+            rendered = time.perf_counter() - begin
+
+            print(f"{name:>10}{calendar_grid.binning:>9}{calendar_grid.grid.size:>7}"
+                  f"{built * 1000:>10.2f}{rendered * 1000:>11.2f}")
+        heatmap.close()
+
+
+if __name__ == '__main__':
+    main()
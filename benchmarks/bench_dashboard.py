@@ -0,0 +1,80 @@
+# Dashboard load time as a user's history grows: the old four statements
+# against Expenses versus the rollup-backed DashboardProvider (cold and cached).
+#
+#   python -m benchmarks.bench_dashboard [max_expenses]
+import os
+import sys
+import tempfile
+import time
+
+from dashboard import DashboardProvider
+from database import connect, init_database
+
+MONTH = '2024-06'
+
+LEGACY_QUERIES = [
+    ('SELECT SUM(amount) FROM Expenses WHERE user_id = ?', (1,)),
+    ('''SELECT SUM(amount) FROM Expenses
+        WHERE user_id = ? AND strftime('%Y-%m', date) = ?''', (1, MONTH)),
+    ('SELECT COUNT(*) FROM Expenses WHERE user_id = ?', (1,)),
+    ('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?', (1, MONTH)),
+    ('''SELECT e.date, c.category_name, e.amount, e.description
+        FROM Expenses e
+        JOIN Categories c ON e.category_id = c.category_id
+        WHERE e.user_id = ?
+        ORDER BY e.date DESC LIMIT 10''', (1,)),
+]
+
+
+def add_expenses(db_path, start, stop):
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     ((1, i % 5 + 1, f'{2000 + i % 25}-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 10.0 + i % 100, f'Expense {i}')
+                      for i in range(start, stop)))
+    conn.commit()
+    conn.close()
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    max_expenses = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    sizes = [size for size in (1000, 10000, 100000, 300000, 1000000) if size <= max_expenses]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        init_database(db_path)
+
+        reader = connect(db_path)
+        provider = DashboardProvider(db_path)
+
+        def legacy():
+            for sql, params in LEGACY_QUERIES:
+                reader.execute(sql, params).fetchall()
+
+        def cold():
+            provider.invalidate()
+            provider.snapshot(1, MONTH)
+
+        def cached():
+            provider.snapshot(1, MONTH)
+
+        print(f"{'expenses':>10}{'legacy ms':>12}{'rollup ms':>12}{'cached ms':>12}")
+        loaded = 0
+        for size in sizes:
+            add_expenses(db_path, loaded, size)
+            loaded = size
+            print(f"{size:>10}{timed(legacy, 5):>12.2f}{timed(cold, 50):>12.3f}{timed(cached, 1000):>12.4f}")
+
+        provider.close()
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Cost of the dashboard's change check: an idle PRAGMA data_version poll
+# versus recomputing the dashboard statistics on every tick.
+#
+#   python -m benchmarks.bench_data_version [expenses]
+import os
+import sys
+import tempfile
+import time
+
+from database import connect, init_database
+from watcher import DataVersionWatcher
+
+DASHBOARD_QUERIES = [
+    ('SELECT SUM(amount) FROM Expenses WHERE user_id = ?', (1,)),
+    ('''SELECT SUM(amount) FROM Expenses
+        WHERE user_id = ? AND strftime('%Y-%m', date) = ?''', (1, '2024-06')),
+    ('SELECT COUNT(*) FROM Expenses WHERE user_id = ?', (1,)),
+    ('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?', (1, '2024-06')),
+    ('''SELECT e.expense_id, e.date, c.category_name, e.amount, e.description
+        FROM Expenses e
+        JOIN Categories c ON e.category_id = c.category_id
+        WHERE e.user_id = ?
+        ORDER BY e.date DESC LIMIT 10''', (1,)),
+]
+
+
+def populate(db_path, expenses):
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''',
+                     ((1, i % 5 + 1, f'20{i % 10 + 14}-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 10.0 + i % 100, f'Expense {i}')
+                      for i in range(expenses)))
+    conn.execute("INSERT INTO Budgets (user_id, month, limit_amount) VALUES (1, '2024-06', 5000)")
+    conn.commit()
+    conn.close()
+
+
+def per_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    expenses = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        populate(db_path, expenses)
+
+        watcher = DataVersionWatcher(db_path)
+        idle = per_call(watcher.changed, 10000)
+
+        reader = connect(db_path)
+
+        def recompute():
+            for sql, params in DASHBOARD_QUERIES:
+                reader.execute(sql, params).fetchall()
+
+        full = per_call(recompute, 20)
+
+        writer = connect(db_path)
+
+        def poll_after_write():
+            writer.execute('UPDATE Budgets SET limit_amount = limit_amount + 1 WHERE user_id = 1')
+            writer.commit()
+            assert watcher.changed()
+
+        changed = per_call(poll_after_write, 1000)
+
+        print(f"expenses: {expenses}")
+        print(f"idle data_version poll:     {idle * 1e6:10.1f} us")
+        print(f"write + detecting poll:     {changed * 1e6:10.1f} us")
+        print(f"full dashboard recompute:   {full * 1e6:10.1f} us")
+        print(f"idle poll is {full / idle:.0f}x cheaper than recomputing")
+
+        writer.close()
+        reader.close()
+        watcher.close()
+
+
+if __name__ == '__main__':
+    main()
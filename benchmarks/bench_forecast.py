@@ -0,0 +1,67 @@
+# Forecast latency over 10-year histories of increasing density, cold
+# (after a write) and cached.
+#
+#   python -m benchmarks.bench_forecast
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import connect, init_database
+from forecast import Forecaster
+
+TODAY = date(2024, 6, 15)
+
+
+def populate(db_path, per_day):
+    init_database(db_path)
+    random.seed(42)
+    rows = []
+    day = TODAY - timedelta(days=3650)
+    while day <= TODAY:
+        if day.day == 1:
+            rows.append((1, 4, day.isoformat(), 15000.0, 'Rent'))
+            rows.append((1, 4, day.isoformat(), 499.0, 'Streaming subscription'))
+        for _ in range(per_day):
+            rows.append((1, random.randint(1, 5), day.isoformat(), round(random.uniform(20, 2000), 2), 'Purchase'))
+        day += timedelta(days=1)
+
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+    return len(rows)
+
+
+def main():
+    print(f"{'per day':>8}{'expenses':>10}{'cold ms':>10}{'cached ms':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for per_day in (1, 5, 20):
+            db_path = os.path.join(tmp, f'bench_{per_day}.db')
+            expenses = populate(db_path, per_day)
+            forecaster = Forecaster(db_path)
+            writer = connect(db_path)
+
+            cold = []
+            for i in range(10):
+                # Any write invalidates the cache
+                writer.execute('UPDATE Users SET name = ? WHERE user_id = 1', (f'Admin {i}',))
+                writer.commit()
+                start = time.perf_counter()
+                forecaster.forecast(1, TODAY)
+                cold.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            for _ in range(1000):
+                forecaster.forecast(1, TODAY)
+            cached = (time.perf_counter() - start) / 1000
+
+            print(f"{per_day:>8}{expenses:>10}{min(cold) * 1000:>10.2f}{cached * 1000:>11.4f}")
+            writer.close()
+            forecaster.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Saved views: time to save a view (materializing its rows and totals), to
+# read its running total against a filtered SUM over the expense table, and
+# the extra cost the view triggers add to inserting expenses, for growing
+# numbers of expenses.
+#
+#   python -m benchmarks.bench_saved_views
+import os
+import random
+import tempfile
+import time
+
+from database import connect, init_database
+from saved_views import list_views, save_view
+
+SIZES = (100_000, 1_000_000)
+VIEWS = 10
+INSERTS = 5_000
+REPEATS = 5
+
+SQL_TOTAL = '''SELECT COUNT(*), SUM(amount) FROM Expenses
+               WHERE user_id = 1 AND date >= '2018-01-01' AND category_id = 2'''
+
+
+def populate(db_path, expenses):
+    init_database(db_path)
+    random.seed(42)
+    # Everything belongs to user 1, the admin init_database creates
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (1, ?, ?, ?, 'Purchase')''',
+                     ((random.randint(1, 5), f'{random.randint(2015, 2024)}-{random.randint(1, 12):02d}-01',
+                       round(random.uniform(20, 2000), 2)) for _ in range(expenses)))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def best(function):
+    timings = []
+    for _ in range(REPEATS):
+        begin = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - begin)
+    return min(timings), result
+
+
+def insert_rate(conn):
+    begin = time.perf_counter()
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount) VALUES (1, ?, '2024-06-01', ?)''',
+                     ((random.randint(1, 5), round(random.uniform(20, 2000), 2)) for _ in range(INSERTS)))
+    conn.commit()
+    return (time.perf_counter() - begin) / INSERTS
+
+
+def main():
+    print(f"{'expenses':>9}{'save ms':>9}{'total ms':>10}{'SQL ms':>9}{'insert us':>11}{'+views us':>11}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            populate(db_path, size)
+            conn = connect(db_path)
+            plain = insert_rate(conn)
+
+            begin = time.perf_counter()
+            save_view(conn, db_path, 1, 'Food since 2018', '2018-01-01', None, 2)
+            saved = time.perf_counter() - begin
+            # More views of the same user, which every insert has to check
+            for number in range(1, VIEWS):
+                save_view(conn, db_path, 1, f'View {number}', f'{2014 + number}-01-01', None, number % 5 + 1)
+
+            total, views = best(lambda: list_views(conn, 1))
+            sql_total, expected = best(lambda: conn.execute(SQL_TOTAL).fetchone())
+            view = next(view for view in views if view.name == 'Food since 2018')
+            assert (view.count, round(view.total, 2)) == (expected[0], round(expected[1], 2))
+            maintained = insert_rate(conn)
+            conn.close()
+
+            print(f"{size:>9}{saved * 1000:>9.0f}{total * 1000:>10.2f}{sql_total * 1000:>9.1f}"
+                  f"{plain * 1e6:>11.1f}{maintained * 1e6:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Write throughput with and without sharded storage: one writer process per
+# user, each committing single-row inserts as fast as it can. Unsharded,
+# every writer queues on the one database's write lock; with shards only
+# the users of the same shard contend.
+#
+#   python -m benchmarks.bench_shards [writers] [seconds]
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from database import connect, init_database
+from shards import ShardMap, enable_sharding
+
+SHARD_COUNTS = (1, 2, 4, 8)
+
+
+def create_users(db_path, writers):
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.executemany('INSERT INTO Users (name, email, password) VALUES (?, ?, ?)',
+                     [(f'Writer {i}', f'writer{i}@bench.local', '-') for i in range(writers)])
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute("SELECT user_id FROM Users WHERE email LIKE '%@bench.local'")]
+    conn.close()
+    return user_ids
+
+
+def writer(db_path, user_id, start, seconds, results):
+    conn = connect(db_path)
+    conn.execute('PRAGMA busy_timeout = 30000')
+    start.wait()
+    until = time.monotonic() + seconds
+    inserts = 0
+    while time.monotonic() < until:
+        conn.execute('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (?, 1, '2024-06-01', 10.0, 'Benchmark')''', (user_id,))
+        conn.commit()
+        inserts += 1
+    conn.close()
+    results.put(inserts)
+
+
+def run(writers, shards, seconds, tmp):
+    db_path = os.path.join(tmp, f'bench{shards}.db')
+    user_ids = create_users(db_path, writers)
+    if shards > 1:
+        enable_sharding(db_path, shards)
+    shard_map = ShardMap(db_path)
+
+    context = multiprocessing.get_context('spawn')
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=writer, args=(shard_map.path_for(user_id), user_id, start, seconds, results))
+                 for user_id in user_ids]
+    for process in processes:
+        process.start()
+    time.sleep(1)
+    start.set()
+    inserts = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    shard_map.close()
+    return inserts
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{writers} writers, single-row commits for {seconds:g} s")
+    print(f"{'shards':>8}{'inserts':>10}{'inserts/s':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for shards in SHARD_COUNTS:
+            inserts = run(writers, shards, seconds, tmp)
+            print(f"{shards:>8}{inserts:>10}{inserts / seconds:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Expense table sorting: time to show the first page and the 50th page of
+# each sort, read with keyset paging in index order, against reading all of
+# the user's rows and sorting them in Python, for growing numbers of
+# expenses.
+#
+#   python -m benchmarks.bench_sorting
+import os
+import random
+import tempfile
+import time
+
+from database import connect, init_database
+from et import EXPENSE_PAGE_SIZE
+from paging import EXPENSE_SORTS, after, order_by
+
+SIZES = (10_000, 100_000, 500_000)
+DEEP_PAGE = 50
+CATEGORIES = 12
+
+COLUMNS = 'e.expense_id, e.date, c.category_name, e.amount, e.description, e.currency'
+POSITIONS = {'e.expense_id': 0, 'e.date': 1, 'c.category_name': 2, 'e.amount': 3}
+
+
+def populate(db_path, expenses):
+    init_database(db_path)
+    random.seed(42)
+    conn = connect(db_path)
+    conn.execute("INSERT INTO Users (name, email, password) VALUES ('Bench', 'bench@example.com', '-')")
+    conn.executemany('INSERT OR IGNORE INTO Categories (category_name) VALUES (?)',
+                     [(f'Category {i}',) for i in range(CATEGORIES)])
+    category_ids = [row[0] for row in conn.execute('SELECT category_id FROM Categories')]
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (1, ?, ?, ?, 'Purchase')''',
+                     ((random.choice(category_ids),
+                       f'{random.randint(2005, 2024)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+                       round(random.uniform(20, 2000), 2)) for _ in range(expenses)))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def page(conn, sort, descending, start):
+    source, columns, first_descending = EXPENSE_SORTS[sort]
+    page_filter, params = after(columns, descending, start) if start else ('', [])
+    rows = conn.execute(f'''SELECT {COLUMNS} FROM {source.format(expenses='Expenses')}
+                            WHERE e.user_id = ? {'AND ' + page_filter if page_filter else ''}
+                            {order_by(columns, descending)} LIMIT ?''',
+                        [1] + params + [EXPENSE_PAGE_SIZE]).fetchall()
+    return rows, tuple(rows[-1][POSITIONS[column]] for column in columns)
+
+
+def client_side(conn, sort, descending, number):
+    columns = EXPENSE_SORTS[sort][1]
+    rows = conn.execute(f'''SELECT {COLUMNS} FROM Expenses e JOIN Categories c ON e.category_id = c.category_id
+                            WHERE e.user_id = ?''', (1,)).fetchall()
+    rows.sort(key=lambda row: tuple(row[POSITIONS[column]] for column in columns), reverse=descending)
+    return rows[(number - 1) * EXPENSE_PAGE_SIZE:number * EXPENSE_PAGE_SIZE]
+
+
+def main():
+    print(f"{'expenses':>9}{'sort':>10}{'page 1 ms':>11}{f'page {DEEP_PAGE} ms':>12}{'client ms':>11}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            populate(db_path, size)
+            conn = connect(db_path)
+            for sort, (source, columns, descending) in EXPENSE_SORTS.items():
+                begin = time.perf_counter()
+                rows, last = page(conn, sort, descending, None)
+                first = time.perf_counter() - begin
+
+                # Walk to the deep page the way Next does, timing only its read
+                for _ in range(DEEP_PAGE - 2):
+                    rows, last = page(conn, sort, descending, last)
+                begin = time.perf_counter()
+                deep_rows, last = page(conn, sort, descending, last)
+                deep = time.perf_counter() - begin
+
+                begin = time.perf_counter()
+                expected = client_side(conn, sort, descending, DEEP_PAGE)
+                client = time.perf_counter() - begin
+                assert [row[0] for row in deep_rows] == [row[0] for row in expected]
+
+                print(f"{size:>9}{sort:>10}{first * 1000:>11.2f}{deep * 1000:>12.2f}{client * 1000:>11.2f}")
+            conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Tag queries: an AND/OR/NOT tag search and the per-tag totals answered
+# from the in-memory tag bitmaps, against the same answers from SQL joins on
+# ExpenseTags, for growing numbers of expenses. Tags range from a handful of
+# expenses to half of them.
+#
+#   python -m benchmarks.bench_tags
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from database import connect, init_database
+from tags import TagIndex
+
+SIZES = (100_000, 1_000_000)
+TAG_SHARES = {'reimbursable': 0.5, 'tax-deductible': 0.2, 'work': 0.1, 'trip-goa': 0.01, 'gift': 0.001}
+EXPRESSION = 'work AND (reimbursable OR tax-deductible) AND NOT trip-goa'
+REPEATS = 5
+
+SQL_SEARCH = '''SELECT expense_id FROM ExpenseTags WHERE user_id = 1 AND tag_id = :work
+                AND expense_id IN (SELECT expense_id FROM ExpenseTags WHERE user_id = 1 AND tag_id IN (:reimbursable,
+                                                                                                       :deductible))
+                AND expense_id NOT IN (SELECT expense_id FROM ExpenseTags WHERE user_id = 1 AND tag_id = :goa)'''
+SQL_TOTALS = '''SELECT t.name, SUM(e.amount), COUNT(*) FROM Tags t
+                JOIN ExpenseTags et ON et.user_id = t.user_id AND et.tag_id = t.tag_id
+                JOIN Expenses e ON e.expense_id = et.expense_id
+                WHERE t.user_id = 1 GROUP BY t.tag_id'''
+
+
+def populate(db_path, expenses):
+    init_database(db_path)
+    random.seed(42)
+    # Everything belongs to user 1, the admin init_database creates
+    conn = connect(db_path)
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                        VALUES (1, ?, ?, ?, 'Purchase')''',
+                     ((random.randint(1, 5), f'{random.randint(2015, 2024)}-{random.randint(1, 12):02d}-01',
+                       round(random.uniform(20, 2000), 2)) for _ in range(expenses)))
+    ids = np.array([row[0] for row in conn.execute('SELECT expense_id FROM Expenses')])
+    tag_ids = {}
+    for name, share in TAG_SHARES.items():
+        tag_ids[name] = conn.execute('INSERT INTO Tags (user_id, name) VALUES (1, ?)', (name,)).lastrowid
+        tagged = np.random.default_rng(len(tag_ids)).choice(ids, int(len(ids) * share), replace=False)
+        conn.executemany('INSERT INTO ExpenseTags (user_id, tag_id, expense_id) VALUES (1, ?, ?)',
+                         ((tag_ids[name], int(expense_id)) for expense_id in tagged))
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return tag_ids
+
+
+def best(function):
+    timings = []
+    for _ in range(REPEATS):
+        begin = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - begin)
+    return min(timings), result
+
+
+def main():
+    print(f"{'expenses':>9}{'load ms':>9}{'search ms':>11}{'SQL ms':>9}{'totals ms':>11}{'SQL ms':>9}{'matches':>9}")
+    for size in SIZES:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            tag_ids = populate(db_path, size)
+            index = TagIndex(db_path)
+
+            begin = time.perf_counter()
+            index.totals(1)
+            loaded = time.perf_counter() - begin
+
+            search, found = best(lambda: index.query(1, EXPRESSION))
+            totals, _ = best(lambda: index.totals(1))
+
+            conn = connect(db_path)
+            params = {'work': tag_ids['work'], 'reimbursable': tag_ids['reimbursable'],
+                      'deductible': tag_ids['tax-deductible'], 'goa': tag_ids['trip-goa']}
+            sql_search, expected = best(lambda: conn.execute(SQL_SEARCH, params).fetchall())
+            sql_totals, _ = best(lambda: conn.execute(SQL_TOTALS).fetchall())
+            conn.close()
+            index.close()
+            assert sorted(row[0] for row in expected) == found.tolist()
+
+            print(f"{size:>9}{loaded * 1000:>9.0f}{search * 1000:>11.2f}{sql_search * 1000:>9.1f}"
+                  f"{totals * 1000:>11.2f}{sql_totals * 1000:>9.1f}{len(found):>9}")
+
+
+if __name__ == '__main__':
+    main()
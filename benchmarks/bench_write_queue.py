@@ -0,0 +1,62 @@
+# Writes per second for expense inserts: the old connect-and-commit-per-write
+# path versus the write queue in each durability mode.
+#
+#   python -m benchmarks.bench_write_queue [writes]
+import os
+import sys
+import tempfile
+import time
+
+from database import connect, init_database
+from write_queue import DURABILITY_MODES, WriteQueue
+
+INSERT_SQL = '''INSERT INTO Expenses (user_id, category_id, date, amount, description)
+                VALUES (?, ?, ?, ?, ?)'''
+
+
+def expense_params(i):
+    return (1, i % 5 + 1, f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 10.0 + i % 100, f'Expense {i}')
+
+
+def bench_connect_per_write(db_path, writes):
+    start = time.perf_counter()
+    for i in range(writes):
+        conn = connect(db_path)
+        conn.execute(INSERT_SQL, expense_params(i))
+        conn.commit()
+        conn.close()
+    return time.perf_counter() - start
+
+
+def bench_queue(db_path, writes, durability):
+    queue = WriteQueue(db_path, latency_ms=50, durability=durability)
+    start = time.perf_counter()
+    for i in range(writes):
+        queue.submit(INSERT_SQL, expense_params(i))
+    queue.flush()
+    elapsed = time.perf_counter() - start
+    batches = queue.batches_committed
+    queue.close()
+    return elapsed, batches
+
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'mode':<20}{'writes':>8}{'commits':>10}{'seconds':>10}{'writes/s':>12}")
+
+        db_path = os.path.join(tmp, 'baseline.db')
+        init_database(db_path)
+        elapsed = bench_connect_per_write(db_path, writes)
+        print(f"{'connect-per-write':<20}{writes:>8}{writes:>10}{elapsed:>10.3f}{writes / elapsed:>12.0f}")
+
+        for mode in DURABILITY_MODES:
+            db_path = os.path.join(tmp, f'{mode}.db')
+            init_database(db_path)
+            elapsed, batches = bench_queue(db_path, writes, mode)
+            print(f"{'queue/' + mode:<20}{writes:>8}{batches:>10}{elapsed:>10.3f}{writes / elapsed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from currency import day_rate_sql, month_rate_sql
+from database import DB_PATH, connect
+
+PERIODS = ('weekly', 'monthly', 'yearly')
+
+# Fractions of a limit at which the user is warned
+THRESHOLDS = (0.8, 1.0)
+
+
+class BudgetStatus(NamedTuple):
+    budget_id: object
+    category_id: object
+    category_name: str
+    period: str
+    period_key: str
+    limit_amount: float
+    spent: float
+
+
+class BudgetAlert(NamedTuple):
+    status: BudgetStatus
+    threshold: float
+
+
+def period_key(period, day):
+    if period == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    if period == 'monthly':
+        return day.strftime('%Y-%m')
+    return day.strftime('%Y')
+
+
+def crossed_threshold(before, after, limit):
+    # Highest threshold that this change pushed the total over, if any
+    crossed = None
+    for threshold in THRESHOLDS:
+        if before < limit * threshold <= after:
+            crossed = threshold
+    return crossed
+
+
+class BudgetEngine:
+    # Running totals for the current week, month and year of one user,
+    # broken down by category. They are seeded from the MonthlyTotals rollup
+    # (and an index range scan for the current week) and then updated in
+    # O(1) per new expense, so alerts never re-sum the month. With conn the
+    # engine reads through that connection and leaves it open. With a
+    # watcher (watcher.DataVersionWatcher) the totals are reloaded once
+    # anyone else has written to the file, except while an insert begun
+    # here has not been recorded yet, which would then be counted twice.
+    def __init__(self, user_id, opener=None, conn=None, watcher=None):
+        self.user_id = user_id
+        self.opener = opener or (lambda: connect(DB_PATH))
+        self.conn = conn
+        self.watcher = watcher
+        self.version = None
+        self.pending = 0
+        self.loaded = False
+
+    def invalidate(self):
+        self.loaded = False
+
+    def ensure_loaded(self, today=None):
+        today = today or date.today()
+        stale = self.watcher is not None and not self.pending and self.watcher.read_version() != self.version
+        if not self.loaded or self.today != today or stale:
+            self.load(today)
+
+    def begin(self):
+        # An expense is about to be inserted; record() or cancel() follows
+        self.ensure_loaded()
+        self.pending += 1
+
+    def cancel(self):
+        # The insert failed
+        if self.pending:
+            self.pending -= 1
+
+    def load(self, today=None):
+        self.today = today or date.today()
+        # Read first, so a write during the load shows up as a change
+        if self.watcher is not None:
+            self.version = self.watcher.read_version()
+        self.keys = {period: period_key(period, self.today) for period in PERIODS}
+        self.totals = {}
+
+        conn = self.conn or self.opener()
+        cursor = conn.cursor()
+
+        month = self.keys['monthly']
+        cursor.execute(f'''SELECT t.category_id, SUM(t.total * {month_rate_sql('t')}) FROM MonthlyTotals t
+                           WHERE t.user_id = ? AND t.month = ?
+                           GROUP BY t.category_id''', (self.user_id, month))
+        self._seed('monthly', cursor.fetchall())
+
+        year = self.keys['yearly']
+        cursor.execute(f'''SELECT t.category_id, SUM(t.total * {month_rate_sql('t')}) FROM MonthlyTotals t
+                           WHERE t.user_id = ? AND t.month BETWEEN ? AND ?
+                           GROUP BY t.category_id''', (self.user_id, f'{year}-01', f'{year}-12'))
+        self._seed('yearly', cursor.fetchall())
+
+        week_start = self.today - timedelta(days=self.today.weekday())
+        cursor.execute(f'''SELECT e.category_id, SUM(e.amount * {day_rate_sql('e')}) FROM Expenses e
+                           WHERE e.user_id = ? AND e.date BETWEEN ? AND ?
+                           GROUP BY e.category_id''',
+                       (self.user_id, week_start.isoformat(), (week_start + timedelta(days=6)).isoformat()))
+        self._seed('weekly', cursor.fetchall())
+
+        # Recurring limits, plus the month-specific overall budget from Budgets
+        cursor.execute('''SELECT b.budget_id, b.category_id, COALESCE(c.category_name, 'All'), b.period, b.limit_amount
+                          FROM CategoryBudgets b
+                          LEFT JOIN Categories c ON b.category_id = c.category_id
+                          WHERE b.user_id = ?
+                          ORDER BY b.period, c.category_name''', (self.user_id,))
+        self.rules = list(cursor.fetchall())
+
+        cursor.execute('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?', (self.user_id, month))
+        monthly_budget = cursor.fetchone()
+        if monthly_budget:
+            self.rules.insert(0, (f'month-{month}', None, 'All', 'monthly', monthly_budget[0]))
+
+        if self.conn is None:
+            conn.close()
+        self.loaded = True
+
+    def _seed(self, period, rows):
+        key = self.keys[period]
+        overall = 0
+        for category_id, total in rows:
+            self.totals[(period, key, category_id)] = total or 0
+            overall += total or 0
+        self.totals[(period, key, None)] = overall
+
+    def spent(self, period, category_id=None):
+        self.ensure_loaded()
+        return self.totals.get((period, self.keys[period], category_id), 0)
+
+    def statuses(self):
+        self.ensure_loaded()
+        return [self._status(rule) for rule in self.rules]
+
+    def _status(self, rule):
+        budget_id, category_id, category_name, period, limit_amount = rule
+        return BudgetStatus(budget_id, category_id, category_name, period, self.keys[period],
+                            limit_amount, self.spent(period, category_id))
+
+    def record(self, category_id, expense_date, amount):
+        # Apply one new expense, amount in the reporting currency, and return
+        # the alerts it triggers
+        self.ensure_loaded()
+        if self.pending:
+            self.pending -= 1
+        if isinstance(expense_date, str):
+            expense_date = datetime.strptime(expense_date, '%Y-%m-%d').date()
+
+        alerts = []
+        for period in PERIODS:
+            key = period_key(period, expense_date)
+            if key != self.keys[period]:
+                continue
+
+            before = {}
+            for scope in (category_id, None):
+                before[scope] = self.totals.get((period, key, scope), 0)
+                self.totals[(period, key, scope)] = before[scope] + amount
+
+            for rule in self.rules:
+                rule_category = rule[1]
+                if rule[3] != period or rule_category not in (category_id, None):
+                    continue
+                threshold = crossed_threshold(before[rule_category], before[rule_category] + amount, rule[4])
+                if threshold is not None:
+                    alerts.append(BudgetAlert(self._status(rule), threshold))
+        return alerts
@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from database import DB_PATH, connect
+
+
+class CachedEngine:
+    # Common ground of the report engines: one connection, shared by the
+    # Tk thread and the engine's single background thread under a lock, and
+    # one cached result per user, reused until PRAGMA data_version shows
+    # that another connection has written. Subclasses add the computation
+    # and its *_async wrapper.
+    def __init__(self, db_path=DB_PATH, thread_name='engine'):
+        self.db_path = db_path
+        self._conn = None
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=thread_name)
+
+    def invalidate(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(user_id, None)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def _cached(self, user_id, params, build):
+        # build(user_id, *params), or the user's last result when it was
+        # built from the same params and nothing has been written since.
+        # The caller holds the lock.
+        version = self._connection().execute('PRAGMA data_version').fetchone()[0]
+        cached = self._cache.get(user_id)
+        if cached and cached[0] == version and cached[1] == params:
+            return cached[2]
+        result = build(user_id, *params)
+        self._cache[user_id] = (version, params, result)
+        return result
+
+    def _peek(self, user_id):
+        # The user's cached result however old, or None
+        cached = self._cache.get(user_id)
+        return cached[2] if cached else None
@@ -0,0 +1,118 @@
+from datetime import date, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from cached_engine import CachedEngine
+from currency import RateCache, month_rate_sql
+from database import DB_PATH
+
+# Ranges up to DAY_BIN_DAYS are drawn one cell per day (weekday x week),
+# up to WEEK_BIN_DAYS one cell per week (year x week), longer ones one cell
+# per month (year x month). The grid stays a few hundred cells either way.
+DAY_BIN_DAYS = 400
+WEEK_BIN_DAYS = 8 * 366
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+class CalendarGrid(NamedTuple):
+    start: date
+    end: date
+    binning: str
+    grid: np.ndarray
+    row_labels: tuple
+    column_labels: tuple
+    total: float
+
+
+def choose_binning(start, end):
+    days = (end - start).days + 1
+    if days <= DAY_BIN_DAYS:
+        return 'day'
+    if days <= WEEK_BIN_DAYS:
+        return 'week'
+    return 'month'
+
+
+def cell_index(days, binning, origin, first_year):
+    # (row, column) of each datetime64[D] in the grid; origin is the Monday
+    # on or before the start of the range
+    if binning == 'day':
+        offset = (days - origin).astype(int)
+        return offset % 7, offset // 7
+    years = days.astype('datetime64[Y]')
+    rows = years.astype(int) + 1970 - first_year
+    if binning == 'week':
+        return rows, np.minimum((days - years).astype(int) // 7, 52)
+    return rows, days.astype('datetime64[M]').astype(int) % 12
+
+
+def build_grid(start, end, days, totals, binning=None):
+    # days: datetime64[D] array, totals: spend on each of those days
+    binning = binning or choose_binning(start, end)
+    origin = np.datetime64(start - timedelta(days=start.weekday()), 'D')
+    span = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+
+    if binning == 'day':
+        shape = (7, (span[-1] - origin).astype(int) // 7 + 1)
+        rows = WEEKDAYS
+        columns = tuple(str(origin + 7 * week) for week in range(shape[1]))
+    else:
+        shape = (end.year - start.year + 1, 53 if binning == 'week' else 12)
+        rows = tuple(str(year) for year in range(start.year, end.year + 1))
+        columns = tuple(f'W{week + 1}' for week in range(53)) if binning == 'week' else MONTHS
+
+    # Cells outside the range stay NaN and are drawn blank
+    grid = np.full(shape, np.nan)
+    grid[cell_index(span, binning, origin, start.year)] = 0
+    if len(days):
+        np.add.at(grid, cell_index(days, binning, origin, start.year), totals)
+    return CalendarGrid(start, end, binning, grid, rows, columns, float(np.asarray(totals).sum()))
+
+
+class CalendarHeatmap(CachedEngine):
+    # Daily spending grids built from the DailyTotals rollup (one row per
+    # day with spending, not per expense) and binned with NumPy so that the
+    # report draws a single image whatever the range. Grids are cached per
+    # user and range until PRAGMA data_version changes.
+    def __init__(self, db_path=DB_PATH, rates=None):
+        super().__init__(db_path, 'calendar')
+        self.rates = rates or RateCache(db_path)
+
+    def grid(self, user_id, start, end):
+        # A range that starts after it ends (e.g. All Time with only future
+        # expenses) shows just its last day
+        start = min(start, end)
+        with self._lock:
+            return self._cached(user_id, (start, end), self._build)
+
+    def grid_async(self, user_id, start, end):
+        return self._executor.submit(self.grid, user_id, start, end)
+
+    def first_day(self, user_id):
+        with self._lock:
+            row = self._connection().execute('SELECT MIN(day) FROM DailyTotals WHERE user_id = ?', (user_id,)).fetchone()
+            return date.fromisoformat(row[0]) if row[0] else None
+
+    def _build(self, user_id, start, end):
+        binning = choose_binning(start, end)
+        cursor = self._conn.cursor()
+        if binning == 'month':
+            # Whole months come straight from the monthly rollup
+            cursor.execute(f'''SELECT t.month || '-01', SUM(t.total * {month_rate_sql('t')}) FROM MonthlyTotals t
+                               WHERE t.user_id = ? AND t.month BETWEEN ? AND ?
+                               GROUP BY t.month''', (user_id, start.isoformat()[:7], end.isoformat()[:7]))
+            rows = cursor.fetchall()
+            days = np.array([row[0] for row in rows], dtype='datetime64[D]')
+            totals = np.array([row[1] for row in rows], dtype=float)
+        else:
+            # Daily totals are converted at each day's rate, in one pass
+            cursor.execute('''SELECT day, currency, total FROM DailyTotals
+                              WHERE user_id = ? AND day BETWEEN ? AND ?''',
+                           (user_id, start.isoformat(), end.isoformat()))
+            rows = cursor.fetchall()
+            days = np.array([row[0] for row in rows], dtype='datetime64[D]')
+            totals = self.rates.convert([row[2] for row in rows], [row[1] for row in rows], days)
+        return build_grid(start, end, days, totals, binning)
@@ -0,0 +1,120 @@
+# Change data capture: triggers record every insert, update and delete on
+# the synced tables in ChangeLog, so two copies of the database can
+# exchange just the rows changed since they last met (sync.py). Each
+# database file has its own origin id; the log keeps only the latest entry
+# per row, stamped with a clock that never runs backwards, and sync
+# resolves conflicting edits by the highest (clock, origin).
+
+# table: (primary key, row key expression over NEW/OLD, columns whose
+# update is a change)
+CAPTURED_TABLES = {
+    'Categories': ('category_id', '{row}.uid', ('category_name',)),
+    'Expenses': ('expense_id', '{row}.uid',
+                 ('user_id', 'category_id', 'date', 'amount', 'description', 'currency', 'recurring_id')),
+    'Budgets': ('budget_id', "{row}.user_id || '|' || {row}.month", ('user_id', 'month', 'limit_amount')),
+}
+
+# Milliseconds since the epoch, but always past every logged clock,
+# including those received from other copies
+CLOCK_SQL = '''MAX(CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER),
+                   COALESCE((SELECT MAX(clock) FROM ChangeLog), 0) + 1)'''
+
+# Row ids for new rows. Categories are keyed by their first name (unless a
+# renamed category already holds it) so that copies which both add the
+# same category agree on it, and generated recurring expenses by schedule
+# and date for the same reason.
+NEW_UIDS = {
+    'Categories': ("CASE WHEN EXISTS (SELECT 1 FROM Categories c WHERE c.uid = 'category-' || NEW.category_name) "
+                   "THEN lower(hex(randomblob(16))) ELSE 'category-' || NEW.category_name END"),
+    'Expenses': ("CASE WHEN NEW.recurring_id IS NULL THEN lower(hex(randomblob(16))) "
+                 "ELSE 'recurring-' || NEW.recurring_id || '-' || NEW.date END"),
+}
+
+# Rows that existed before capture get ids every copy of the file agrees on
+LEGACY_UIDS = {
+    'Categories': ("CASE WHEN EXISTS (SELECT 1 FROM Categories c WHERE c.uid = 'category-' || Categories.category_name) "
+                   "THEN lower(hex(randomblob(16))) ELSE 'category-' || Categories.category_name END"),
+    'Expenses': "'expense-' || expense_id",
+}
+
+
+def init_changelog(cursor, tables):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ChangeLog (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL,
+            op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D')),
+            origin TEXT NOT NULL,
+            clock INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_changelog_row ON ChangeLog (table_name, row_key)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_changelog_clock ON ChangeLog (clock)')
+
+    # origin: this file's id; capture: '0' while a job moves rows without
+    # changing them (archiving, sharding)
+    cursor.execute('CREATE TABLE IF NOT EXISTS SyncMeta (key TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID')
+    cursor.execute("INSERT OR IGNORE INTO SyncMeta (key, value) VALUES ('origin', lower(hex(randomblob(8))))")
+    cursor.execute("INSERT OR IGNORE INTO SyncMeta (key, value) VALUES ('capture', '1')")
+
+    for table in tables:
+        primary_key, key_sql, columns = CAPTURED_TABLES[table]
+        if table in NEW_UIDS:
+            cursor.execute(f'PRAGMA table_info({table})')
+            if 'uid' not in [row[1] for row in cursor.fetchall()]:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN uid TEXT')
+            cursor.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS idx_{table.lower()}_uid ON {table} (uid)')
+            cursor.execute(f'UPDATE {table} SET uid = {LEGACY_UIDS[table]} WHERE uid IS NULL')
+        create_triggers(cursor, table, primary_key, key_sql, columns)
+
+
+def log_sql(table, key, op, condition='1'):
+    # Append an entry for one row and drop its older ones
+    capturing = f"{condition} AND (SELECT value FROM SyncMeta WHERE key = 'capture') = '1'"
+    return f'''
+            INSERT INTO ChangeLog (table_name, row_key, op, origin, clock)
+            SELECT '{table}', {key}, '{op}', (SELECT value FROM SyncMeta WHERE key = 'origin'), {CLOCK_SQL}
+            WHERE {capturing};
+            DELETE FROM ChangeLog
+            WHERE table_name = '{table}' AND row_key = {key} AND seq < (SELECT MAX(seq) FROM ChangeLog)
+              AND {capturing};'''
+
+
+def create_triggers(cursor, table, primary_key, key_sql, columns):
+    name = f'changelog_{table.lower()}'
+    new_key = key_sql.format(row='NEW')
+    old_key = key_sql.format(row='OLD')
+
+    # New rows get their uid first; NEW does not see it
+    assign_uid = ''
+    inserted_key = new_key
+    if table in NEW_UIDS:
+        assign_uid = f'''
+            UPDATE {table} SET uid = {NEW_UIDS[table]} WHERE {primary_key} = NEW.{primary_key} AND uid IS NULL;'''
+        inserted_key = f'(SELECT uid FROM {table} WHERE {primary_key} = NEW.{primary_key})'
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table}
+        BEGIN{assign_uid}{log_sql(table, inserted_key, 'I')}
+        END
+    ''')
+
+    # A changed row key (a budget moved to another month) is the old row
+    # deleted and a new one written
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {', '.join(columns)} ON {table}
+        BEGIN{log_sql(table, old_key, 'D', f'{old_key} IS NOT {new_key}')}{log_sql(table, new_key, 'U')}
+        END
+    ''')
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table}
+        BEGIN{log_sql(table, old_key, 'D')}
+        END
+    ''')
+
+
+def set_capture(conn, enabled, schema='main'):
+    # Call inside the job's transaction and switch back on before it commits
+    conn.execute(f"UPDATE {schema}.SyncMeta SET value = ? WHERE key = 'capture'", ('1' if enabled else '0',))
@@ -0,0 +1,567 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+from contextlib import closing, contextmanager
+from datetime import datetime
+
+from archive import ARCHIVE_KEEP_YEARS, all_expense_sources, archive_cutoff, fetch_expenses, purge_archives
+from database import (DB_PATH, REPORTING_CURRENCY, connect, init_database, is_currency_code, shard_path,
+                      shard_paths, user_db_path)
+
+# Command-line access to the expense database for scripts and cron jobs.
+# Only the standard library and the database module are imported up
+# front; report commands load their engines (and NumPy) when they run.
+# Writes are short transactions in WAL mode, so it is safe to run next to
+# an open desktop session, which picks the changes up through
+# PRAGMA data_version.
+
+# Rows per transaction when importing
+IMPORT_BATCH = 1000
+
+# Pages copied per step of an online backup; the database stays writable
+# between steps
+BACKUP_PAGES = 1024
+
+EXPENSE_COLUMNS = ('id', 'date', 'category', 'amount', 'currency', 'description')
+
+
+class CliError(Exception):
+    pass
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def valid_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise CliError(f"Invalid date (expected YYYY-MM-DD): {value}")
+
+
+def write_rows(columns, rows, output_format, output=None):
+    # Rows are written as they are fetched, so output starts at once and
+    # memory stays flat however many rows there are
+    output = output or sys.stdout
+    if output_format == 'json':
+        for row in rows:
+            output.write(json.dumps(dict(zip(columns, row))) + '\n')
+    else:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    output.flush()
+
+
+def find_user(cursor, email):
+    cursor.execute('SELECT user_id, name, is_admin FROM Users WHERE email = ?', (email,))
+    user = cursor.fetchone()
+    if user is None:
+        raise CliError(f"No user with email {email}")
+    return user
+
+
+def user_database(conn, args, email):
+    # (user id, database holding the user's rows): their shard when storage
+    # is sharded, else the catalog itself
+    user_id = find_user(conn.cursor(), email)[0]
+    return user_id, user_db_path(args.db, user_id, shard_paths(args.db))
+
+
+@contextmanager
+def user_connection(conn, args, email):
+    user_id, db_path = user_database(conn, args, email)
+    user_conn = connect(db_path)
+    try:
+        yield user_id, user_conn
+    finally:
+        user_conn.close()
+
+
+def all_databases(args):
+    return shard_paths(args.db) or [args.db]
+
+
+def category_ids(cursor):
+    cursor.execute('SELECT category_name, category_id FROM Categories')
+    return {name.lower(): category_id for name, category_id in cursor.fetchall()}
+
+
+def find_category(categories, name):
+    category_id = categories.get(name.strip().lower())
+    if category_id is None:
+        raise CliError(f"Unknown category: {name}")
+    return category_id
+
+
+def parse_amount(value):
+    try:
+        amount = float(value)
+    except ValueError:
+        raise CliError(f"Invalid amount: {value}")
+    if amount <= 0:
+        raise CliError(f"Amount must be positive: {value}")
+    return amount
+
+
+def parse_currency(value):
+    currency = (value or REPORTING_CURRENCY).strip().upper()
+    if not is_currency_code(currency):
+        raise CliError(f"Invalid currency: {value}")
+    return currency
+
+
+# Expenses
+
+def cmd_add(conn, args):
+    with user_connection(conn, args, args.user) as (user_id, conn):
+        cursor = conn.cursor()
+        category_id = find_category(category_ids(cursor), args.category)
+        cursor.execute('''INSERT INTO Expenses (user_id, category_id, date, amount, description, currency)
+                          VALUES (?, ?, ?, ?, ?, ?)''',
+                       (user_id, category_id, valid_date(args.date), parse_amount(args.amount),
+                        args.description, parse_currency(args.currency)))
+        conn.commit()
+    print(cursor.lastrowid)
+
+
+def cmd_import(conn, args):
+    # CSV with a header row: date, category, amount and optionally currency
+    # and description. Each batch is its own short write transaction. On a
+    # bad row every row before it is written and the error names its line,
+    # so the same file can be imported again with --from-line once fixed.
+    categories = category_ids(conn.cursor())
+    try:
+        source = sys.stdin if args.file == '-' else open(args.file, newline='', encoding='utf-8')
+    except OSError as e:
+        raise CliError(f"Cannot read {args.file}: {e.strerror}")
+    imported = 0
+    batch = []
+    with user_connection(conn, args, args.user) as (user_id, conn), source:
+        reader = csv.DictReader(source)
+        missing = {'date', 'category', 'amount'} - set(reader.fieldnames or ())
+        if missing:
+            raise CliError(f"Missing columns: {', '.join(sorted(missing))}")
+
+        for line_number, row in enumerate(reader, 2):
+            if line_number < args.from_line:
+                continue
+            try:
+                batch.append((user_id, find_category(categories, row['category']), valid_date(row['date']),
+                              parse_amount(row['amount']), row.get('description') or '',
+                              parse_currency(row.get('currency'))))
+            except CliError as e:
+                if batch:
+                    imported += insert_batch(conn, batch)
+                raise CliError(f"Line {line_number}: {e} ({imported} rows imported; "
+                               f"resume with --from-line {line_number})")
+
+            if len(batch) >= IMPORT_BATCH:
+                imported += insert_batch(conn, batch)
+                batch = []
+        if batch:
+            imported += insert_batch(conn, batch)
+    print(f"{imported} expenses imported", file=sys.stderr)
+
+
+def insert_batch(conn, batch):
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description, currency)
+                        VALUES (?, ?, ?, ?, ?, ?)''', batch)
+    conn.commit()
+    return len(batch)
+
+
+def cmd_list(conn, args):
+    user_id, db_path = user_database(conn, args, args.user)
+    with closing(connect(db_path)) as conn:
+        list_expenses(conn, db_path, user_id, args)
+
+
+def list_expenses(conn, db_path, user_id, args):
+    cursor = conn.cursor()
+    filters = ['e.user_id = ?']
+    params = [user_id]
+    if args.date_from:
+        filters.append('e.date >= ?')
+        params.append(valid_date(args.date_from))
+    if args.date_to:
+        filters.append('e.date <= ?')
+        params.append(valid_date(args.date_to))
+    if args.category:
+        filters.append('e.category_id = ?')
+        params.append(find_category(category_ids(cursor), args.category))
+    limit = ''
+    if args.limit:
+        limit = 'LIMIT ?'
+        params.append(args.limit)
+
+    # Archived years are read too when --from reaches into them
+    rows = fetch_expenses(conn, db_path, f'''SELECT e.expense_id, e.date, c.category_name, e.amount, e.currency,
+                                                         e.description
+                                                  FROM {{expenses}} e
+                                                  JOIN Categories c ON e.category_id = c.category_id
+                                                  WHERE {' AND '.join(filters)}
+                                                  ORDER BY e.date DESC, e.expense_id DESC {limit}''',
+                          params, args.date_from, args.date_to, key=lambda row: (row[1], row[0]), limit=args.limit)
+    write_rows(EXPENSE_COLUMNS, rows, args.format)
+
+
+def cmd_delete(conn, args):
+    placeholders = ', '.join('?' * len(args.ids))
+    with user_connection(conn, args, args.user) as (user_id, conn):
+        cursor = conn.execute(f'DELETE FROM Expenses WHERE user_id = ? AND expense_id IN ({placeholders})',
+                              [user_id] + args.ids)
+        conn.commit()
+    print(f"{cursor.rowcount} expenses deleted", file=sys.stderr)
+
+
+# Reports, in the reporting currency
+
+def cmd_report(conn, args):
+    user_id, db_path = user_database(conn, args, args.user)
+    with closing(connect(db_path)) as conn:
+        write_report(conn, db_path, user_id, args)
+
+
+def write_report(conn, db_path, user_id, args):
+    from currency import month_rate_sql
+
+    cursor = conn.cursor()
+    rate = month_rate_sql('t')
+
+    if args.kind == 'monthly':
+        columns = ('month', 'total', 'count')
+        cursor.execute(f'''SELECT t.month, SUM(t.total * {rate}), SUM(t.count) FROM MonthlyTotals t
+                           WHERE t.user_id = ?
+                           GROUP BY t.month
+                           ORDER BY t.month''', (user_id,))
+        rows = cursor
+    elif args.kind == 'yearly':
+        columns = ('year', 'total', 'count')
+        cursor.execute(f'''SELECT substr(t.month, 1, 4) AS year, SUM(t.total * {rate}), SUM(t.count)
+                           FROM MonthlyTotals t
+                           WHERE t.user_id = ?
+                           GROUP BY year
+                           ORDER BY year''', (user_id,))
+        rows = cursor
+    elif args.kind == 'category':
+        columns = ('category', 'total', 'count')
+        cursor.execute(f'''SELECT c.category_name, SUM(t.total * {rate}) AS total, SUM(t.count) FROM MonthlyTotals t
+                           JOIN Categories c ON t.category_id = c.category_id
+                           WHERE t.user_id = ?
+                           GROUP BY c.category_id
+                           ORDER BY total DESC''', (user_id,))
+        rows = cursor
+    elif args.kind == 'trends':
+        from trends import TrendAnalyzer, TrendRow
+
+        analyzer = TrendAnalyzer(db_path)
+        try:
+            rows = analyzer.trends(user_id)
+        finally:
+            analyzer.close()
+        columns = TrendRow._fields
+    else:
+        from forecast import CategoryForecast, Forecaster
+
+        forecaster = Forecaster(db_path)
+        try:
+            rows = forecaster.forecast(user_id).categories
+        finally:
+            forecaster.close()
+        columns = CategoryForecast._fields
+
+    write_rows(columns, rows, args.format)
+
+
+# Admin jobs
+
+def all_expenses(args):
+    # Every database and its archives in turn, streamed
+    from currency import day_rate_sql
+
+    for db_path in all_databases(args):
+        with closing(connect(db_path)) as conn:
+            for source in all_expense_sources(conn, db_path):
+                yield from conn.execute(f'''SELECT e.expense_id, u.name, c.category_name, e.date, e.amount, e.currency,
+                                                   e.amount * {day_rate_sql('e')}, e.description
+                                            FROM {source} e
+                                            JOIN Users u ON e.user_id = u.user_id
+                                            JOIN Categories c ON e.category_id = c.category_id''')
+
+
+def cmd_export(conn, args):
+    if args.table == 'expenses':
+        columns = ('expense_id', 'user', 'category', 'date', 'amount', 'currency',
+                   f'amount_{REPORTING_CURRENCY.lower()}', 'description')
+        rows = all_expenses(args)
+    else:
+        columns = ('user_id', 'name', 'email', 'registration_date')
+        rows = conn.execute('SELECT user_id, name, email, registration_date FROM Users')
+
+    if args.output:
+        with open(args.output, 'w', newline='', encoding='utf-8') as output:
+            write_rows(columns, rows, args.format, output)
+        print(f"Exported to {args.output}", file=sys.stderr)
+    else:
+        write_rows(columns, rows, args.format)
+
+
+def cmd_backup(conn, args):
+    # Copied through SQLite so pages still in the WAL are included; the
+    # copy runs in steps so a running session is never blocked for long.
+    # Shards are copied alongside under the backup's name.
+    backup_name = args.output or f'expense_tracker_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
+    targets = [(args.db, backup_name)] + [(path, shard_path(backup_name, shard))
+                                          for shard, path in enumerate(shard_paths(args.db))]
+    for source, target in targets:
+        with closing(connect(source)) as source_conn, closing(sqlite3.connect(target)) as backup_conn:
+            source_conn.backup(backup_conn, pages=BACKUP_PAGES, sleep=0.005)
+        print(target)
+
+
+def cmd_clear_expenses(conn, args):
+    if not args.yes:
+        raise CliError("This deletes ALL expenses from the system; pass --yes to confirm")
+    deleted = 0
+    for db_path in all_databases(args):
+        with closing(connect(db_path)) as conn:
+            deleted += conn.execute('DELETE FROM Expenses').rowcount
+            conn.execute('DELETE FROM Reports')
+            conn.execute('DELETE FROM ExpenseTags')
+            # Saved views stay, emptied with the archives
+            conn.execute('DELETE FROM SavedViewRows')
+            conn.execute('DELETE FROM SavedViewTotals')
+            conn.commit()
+        purge_archives(db_path)
+    print(f"{deleted} expenses deleted", file=sys.stderr)
+
+
+def cmd_archive(conn, args):
+    from shards import ShardMap
+
+    if args.keep_years < 1:
+        raise CliError("Keep at least 1 year")
+    shard_map = ShardMap(args.db)
+    try:
+        moved = shard_map.archive(archive_cutoff(args.keep_years))
+    finally:
+        shard_map.close()
+    print(f"{moved} expenses archived", file=sys.stderr)
+
+
+def read_password():
+    # From stdin so that it never shows up in the process list or history
+    password = sys.stdin.readline().rstrip('\n')
+    if len(password) < 6:
+        raise CliError("Password must be at least 6 characters")
+    return password
+
+
+def cmd_users(conn, args):
+    cursor = conn.cursor()
+    if args.action == 'list':
+        counts = {}
+        for db_path in all_databases(args):
+            with closing(connect(db_path)) as shard:
+                for user_id, count in shard.execute('SELECT user_id, SUM(count) FROM MonthlyTotals GROUP BY user_id'):
+                    counts[user_id] = counts.get(user_id, 0) + count
+        cursor.execute('SELECT user_id, name, email, is_admin, registration_date FROM Users ORDER BY user_id')
+        write_rows(('id', 'name', 'email', 'is_admin', 'registration_date', 'expenses'),
+                   (row + (counts.get(row[0], 0),) for row in cursor), args.format)
+        return
+
+    if args.action == 'add':
+        try:
+            cursor.execute('INSERT INTO Users (name, email, password, is_admin) VALUES (?, ?, ?, ?)',
+                           (args.name, args.email, hash_password(read_password()), int(args.admin)))
+        except sqlite3.IntegrityError:
+            raise CliError(f"Email already registered: {args.email}")
+        conn.commit()
+        print(cursor.lastrowid)
+        return
+
+    user_id = find_user(cursor, args.email)[0]
+    if args.action == 'set-admin':
+        cursor.execute('UPDATE Users SET is_admin = ? WHERE user_id = ?', (int(args.value == 'on'), user_id))
+    elif args.action == 'reset-password':
+        cursor.execute('UPDATE Users SET password = ? WHERE user_id = ?', (hash_password(read_password()), user_id))
+    else:
+        if not args.yes:
+            raise CliError("This deletes the user and all their data; pass --yes to confirm")
+        db_path = user_database(conn, args, args.email)[1]
+        from shards import delete_user_rows
+
+        with closing(connect(db_path)) as user_conn:
+            delete_user_rows(user_conn, user_id)
+            user_conn.commit()
+        purge_archives(db_path, user_id)
+        cursor.execute('DELETE FROM Users WHERE user_id = ?', (user_id,))
+    conn.commit()
+
+
+def cmd_shard(conn, args):
+    from shards import enable_sharding
+
+    if args.count < 2:
+        raise CliError("Use at least 2 shards")
+    conn.close()
+    try:
+        enable_sharding(args.db, args.count)
+    except ValueError as e:
+        raise CliError(str(e))
+    for path in shard_paths(args.db):
+        print(path)
+
+
+def cmd_sync(conn, args):
+    from sync import new_origin, sync_databases
+
+    conn.close()
+    if args.new_origin:
+        new_origin(args.db)
+        print("New origin set; this copy can now sync with the one it was copied from", file=sys.stderr)
+        return
+    if not args.other:
+        raise CliError("Give the database to sync with, or --new-origin")
+    if not os.path.exists(args.other):
+        raise CliError(f"No such database: {args.other}")
+    try:
+        stats = sync_databases(args.db, args.other)
+    except ValueError as e:
+        raise CliError(str(e))
+    print(f"{stats.received} changes received, {stats.sent} sent, {stats.conflicts} conflicts, "
+          f"{stats.skipped} skipped", file=sys.stderr)
+
+
+def cmd_maintenance(conn, args):
+    from maintenance import MAINTENANCE_INTERVALS, DatabaseMaintenance
+
+    conn.close()
+    maintenance = DatabaseMaintenance(args.db)
+    try:
+        if args.all:
+            maintenance.request(*MAINTENANCE_INTERVALS)
+        done = maintenance.run(deep=args.deep)
+    finally:
+        maintenance.close()
+    write_rows(('file', 'task', 'result'), done, args.format)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="Expense tracker command-line interface")
+    parser.add_argument('--db', default=DB_PATH, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def command(name, handler, help_text):
+        sub = commands.add_parser(name, help=help_text)
+        sub.set_defaults(handler=handler)
+        return sub
+
+    def with_format(sub):
+        sub.add_argument('--format', choices=('csv', 'json'), default='csv',
+                         help="CSV with a header row, or one JSON object per line")
+        return sub
+
+    sub = command('add', cmd_add, "add one expense")
+    sub.add_argument('--user', required=True, help="user email")
+    sub.add_argument('--date', default=datetime.now().strftime('%Y-%m-%d'))
+    sub.add_argument('--category', required=True)
+    sub.add_argument('--amount', required=True)
+    sub.add_argument('--currency', default=REPORTING_CURRENCY)
+    sub.add_argument('--description', default='')
+
+    sub = command('import', cmd_import, "import expenses from CSV (date,category,amount[,currency][,description])")
+    sub.add_argument('--user', required=True, help="user email")
+    sub.add_argument('file', help="CSV file, or - for stdin")
+    sub.add_argument('--from-line', type=int, default=2,
+                     help="skip the rows before this line, to resume an import that stopped at a bad row")
+
+    sub = with_format(command('list', cmd_list, "list expenses, newest first"))
+    sub.add_argument('--user', required=True, help="user email")
+    sub.add_argument('--from', dest='date_from')
+    sub.add_argument('--to', dest='date_to')
+    sub.add_argument('--category')
+    sub.add_argument('--limit', type=int)
+
+    sub = command('delete', cmd_delete, "delete expenses by id")
+    sub.add_argument('--user', required=True, help="user email")
+    sub.add_argument('ids', type=int, nargs='+')
+
+    sub = with_format(command('report', cmd_report, f"spending report in {REPORTING_CURRENCY}"))
+    sub.add_argument('kind', choices=('monthly', 'yearly', 'category', 'trends', 'forecast'))
+    sub.add_argument('--user', required=True, help="user email")
+
+    sub = with_format(command('export', cmd_export, "export all expenses or users"))
+    sub.add_argument('table', choices=('expenses', 'users'))
+    sub.add_argument('--output', help="file to write (default: stdout)")
+
+    sub = command('backup', cmd_backup, "online backup of the database")
+    sub.add_argument('--output', help="backup file (default: expense_tracker_backup_<timestamp>.db)")
+
+    sub = command('clear-expenses', cmd_clear_expenses, "delete every expense in the system")
+    sub.add_argument('--yes', action='store_true')
+
+    sub = command('archive', cmd_archive, "move old expenses into yearly archive files")
+    sub.add_argument('--keep-years', type=int, default=ARCHIVE_KEEP_YEARS,
+                     help="recent years kept in the live database (default: %(default)s)")
+
+    sub = command('shard', cmd_shard, "split per-user data into shard databases (run with the app closed)")
+    sub.add_argument('--count', type=int, required=True)
+
+    sub = with_format(command('maintenance', cmd_maintenance, "run the database maintenance tasks that are due"))
+    sub.add_argument('--all', action='store_true', help="run every task, due or not")
+    sub.add_argument('--deep', action='store_true',
+                     help="also truncate the WAL and rebuild files with much free space (locks out writers)")
+
+    sub = command('sync', cmd_sync, "exchange changes with another copy of the database")
+    sub.add_argument('other', nargs='?', help="the other copy's database file")
+    sub.add_argument('--new-origin', action='store_true',
+                     help="give a copied database file its own identity before its first sync")
+
+    users = command('users', cmd_users, "user administration").add_subparsers(dest='action', required=True)
+    with_format(users.add_parser('list'))
+    sub = users.add_parser('add', help="new password is read from stdin")
+    sub.add_argument('name')
+    sub.add_argument('email')
+    sub.add_argument('--admin', action='store_true')
+    sub = users.add_parser('set-admin')
+    sub.add_argument('email')
+    sub.add_argument('value', choices=('on', 'off'))
+    users.add_parser('reset-password', help="new password is read from stdin").add_argument('email')
+    sub = users.add_parser('delete')
+    sub.add_argument('email')
+    sub.add_argument('--yes', action='store_true')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        init_database(args.db)
+        conn = connect(args.db)
+        try:
+            args.handler(conn, args)
+        finally:
+            conn.close()
+    except CliError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+    except sqlite3.Error as e:
+        print(f"database error: {e}", file=sys.stderr)
+        return 1
+    except BrokenPipeError:
+        # Output piped into head and the like; stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
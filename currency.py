@@ -0,0 +1,155 @@
+import csv
+import threading
+
+import numpy as np
+
+from database import DB_PATH, REPORTING_CURRENCY, connect, is_currency_code
+
+# Rates are loaded in chunks so that very large files stream through
+RATE_BATCH = 10000
+
+
+def month_rate_sql(alias):
+    # Rate for a rollup row (alias with currency and month columns): the
+    # month's average rate, else the latest earlier month, else the earliest
+    # known month. Each lookup is a seek on the MonthlyRates primary key.
+    return f'''(CASE WHEN {alias}.currency = '{REPORTING_CURRENCY}' THEN 1 ELSE COALESCE(
+                (SELECT r.rate FROM MonthlyRates r WHERE r.currency = {alias}.currency AND r.month <= {alias}.month
+                 ORDER BY r.month DESC LIMIT 1),
+                (SELECT r.rate FROM MonthlyRates r WHERE r.currency = {alias}.currency ORDER BY r.month LIMIT 1),
+                1) END)'''
+
+
+def day_rate_sql(alias, date_column='date'):
+    # Rate for an expense row: the rate on its date or the latest before it
+    return f'''(CASE WHEN {alias}.currency = '{REPORTING_CURRENCY}' THEN 1 ELSE COALESCE(
+                (SELECT f.rate FROM FxRates f WHERE f.currency = {alias}.currency AND f.date <= {alias}.{date_column}
+                 ORDER BY f.date DESC LIMIT 1),
+                (SELECT f.rate FROM FxRates f WHERE f.currency = {alias}.currency ORDER BY f.date LIMIT 1),
+                1) END)'''
+
+
+def refresh_monthly_rates(cursor, currencies):
+    placeholders = ', '.join('?' * len(currencies))
+    cursor.execute(f'DELETE FROM MonthlyRates WHERE currency IN ({placeholders})', list(currencies))
+    cursor.execute(f'''INSERT INTO MonthlyRates (currency, month, rate)
+                       SELECT currency, substr(date, 1, 7), AVG(rate) FROM FxRates
+                       WHERE currency IN ({placeholders})
+                       GROUP BY currency, substr(date, 1, 7)''', list(currencies))
+
+
+def load_rates_csv(conn, path):
+    # CSV columns: date (YYYY-MM-DD), currency (ISO code), rate (reporting
+    # currency units per unit). A header row is skipped; existing rates for
+    # the same date and currency are replaced.
+    cursor = conn.cursor()
+    currencies = set()
+    loaded = 0
+    batch = []
+    with open(path, newline='', encoding='utf-8') as rates_file:
+        for line_number, row in enumerate(csv.reader(rates_file), 1):
+            if not row or (line_number == 1 and row[0].strip().lower() == 'date'):
+                continue
+            try:
+                day, currency, rate = row[0].strip(), row[1].strip().upper(), float(row[2])
+                np.datetime64(day, 'D')
+            except (IndexError, ValueError):
+                raise ValueError(f"Invalid rate on line {line_number}: {','.join(row)}")
+            if not is_currency_code(currency) or rate <= 0:
+                raise ValueError(f"Invalid rate on line {line_number}: {','.join(row)}")
+
+            currencies.add(currency)
+            batch.append((currency, day, rate))
+            if len(batch) >= RATE_BATCH:
+                cursor.executemany('INSERT OR REPLACE INTO FxRates (currency, date, rate) VALUES (?, ?, ?)', batch)
+                loaded += len(batch)
+                batch = []
+
+    if batch:
+        cursor.executemany('INSERT OR REPLACE INTO FxRates (currency, date, rate) VALUES (?, ?, ?)', batch)
+        loaded += len(batch)
+    if currencies:
+        refresh_monthly_rates(cursor, currencies)
+    conn.commit()
+    return loaded
+
+
+class RateCache:
+    # Every daily rate held in memory as one sorted date array and one rate
+    # array per currency, so converting any number of amounts is a
+    # searchsorted per currency instead of a query per row. Reloaded only
+    # when MonthlyRates (refreshed on every load) has changed.
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._version = None
+        self._fingerprint = None
+        self._rates = {}
+        self._lock = threading.Lock()
+
+    def currencies(self):
+        self._refresh()
+        rates = self._rates
+        return [REPORTING_CURRENCY] + sorted(c for c in rates if c != REPORTING_CURRENCY)
+
+    def convert(self, amounts, currencies, dates):
+        # amounts, currencies and dates ('YYYY-MM-DD' or datetime64) as
+        # arrays; returns the amounts in the reporting currency. Dates before
+        # the first known rate use the first rate; unknown currencies are
+        # left as they are, as in the SQL lookups. Other threads may reload
+        # the rates meanwhile, so the current set is read once.
+        self._refresh()
+        rates_by_currency = self._rates
+        amounts = np.asarray(amounts, dtype=float)
+        currencies = np.asarray(currencies)
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        converted = amounts.copy()
+        for currency in np.unique(currencies):
+            if currency not in rates_by_currency:
+                continue
+            rate_dates, rates = rates_by_currency[currency]
+            mask = currencies == currency
+            index = np.maximum(np.searchsorted(rate_dates, dates[mask], side='right') - 1, 0)
+            converted[mask] = amounts[mask] * rates[index]
+        return converted
+
+    def rate(self, currency, day):
+        return float(self.convert([1.0], [currency], [day])[0])
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+            self._fingerprint = None
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _refresh(self):
+        with self._lock:
+            if self._conn is None:
+                self._conn = connect(self.db_path, check_same_thread=False)
+
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._version:
+                return
+            self._version = version
+
+            fingerprint = self._conn.execute('SELECT COUNT(*), TOTAL(rate) FROM MonthlyRates').fetchone()
+            if fingerprint == self._fingerprint:
+                return
+            self._fingerprint = fingerprint
+
+            # Built aside and swapped in whole, for readers without the lock
+            rows = self._conn.execute('SELECT currency, date, rate FROM FxRates ORDER BY currency, date').fetchall()
+            loaded = {}
+            if rows:
+                currencies, dates, rates = zip(*rows)
+                currencies = np.array(currencies)
+                dates = np.array(dates, dtype='datetime64[D]')
+                rates = np.array(rates, dtype=float)
+                starts = np.flatnonzero(np.r_[True, currencies[1:] != currencies[:-1]])
+                for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+                    loaded[str(currencies[start])] = (dates[start:end], rates[start:end])
+            self._rates = loaded
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import NamedTuple
+
+from cached_engine import CachedEngine
+from currency import month_rate_sql
+from database import DB_PATH
+
+
+class DashboardSnapshot(NamedTuple):
+    month: str
+    total_expenses: float
+    month_expenses: float
+    transaction_count: int
+    budget_limit: float
+    recent: tuple
+
+
+class DashboardProvider(CachedEngine):
+    # All four stat cards come from one pass over the MonthlyTotals rollup
+    # (a handful of rows per month, however many expenses there are) and the
+    # recent list is a LIMIT 10 walk of idx_expenses_user_date. Snapshots are
+    # cached per user and reused until PRAGMA data_version says something
+    # has been written.
+    def __init__(self, db_path=DB_PATH):
+        super().__init__(db_path, 'dashboard')
+
+    def snapshot(self, user_id, month=None):
+        month = month or datetime.now().strftime('%Y-%m')
+        with self._lock:
+            return self._cached(user_id, (month,), self._load)
+
+    def snapshot_async(self, user_id, month=None):
+        return self._executor.submit(self.snapshot, user_id, month)
+
+    def _load(self, user_id, month):
+        cursor = self._conn.cursor()
+
+        cursor.execute(f'''SELECT COALESCE(SUM(t.total * {month_rate_sql('t')}), 0),
+                                  COALESCE(SUM(CASE WHEN t.month = ? THEN t.total * {month_rate_sql('t')} END), 0),
+                                  COALESCE(SUM(t.count), 0),
+                                  (SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?)
+                           FROM MonthlyTotals t
+                           WHERE t.user_id = ?''', (month, user_id, month, user_id))
+        total_expenses, month_expenses, transaction_count, budget_limit = cursor.fetchone()
+
+        cursor.execute('''SELECT e.expense_id, e.date, c.category_name, e.amount, e.description, e.currency
+                          FROM Expenses e
+                          JOIN Categories c ON e.category_id = c.category_id
+                          WHERE e.user_id = ?
+                          ORDER BY e.date DESC LIMIT 10''', (user_id,))
+        recent = tuple(cursor.fetchall())
+
+        return DashboardSnapshot(month, total_expenses, month_expenses, transaction_count,
+                                 budget_limit or 0, recent)
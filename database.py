@@ -0,0 +1,401 @@
+import re
+import sqlite3
+import hashlib
+
+from changelog import init_changelog
+from rollups import init_rollups
+
+DB_PATH = 'expense_tracker.db'
+
+# In sharded mode (see shards.py) per-user tables live in <name>.shard<N>.db
+# files next to the catalog <name>.db, which keeps Users, Categories and the
+# exchange rates
+SHARD_FILE = re.compile(r'^(.*)\.shard\d+\.db$')
+
+# Amounts are stored in their own currency and converted to this one for
+# totals, budgets and reports; FxRates are quoted in it
+REPORTING_CURRENCY = 'INR'
+
+
+def connect(db_path=DB_PATH, **kwargs):
+    conn = sqlite3.connect(db_path, timeout=10, **kwargs)
+    catalog = catalog_path(db_path)
+    if catalog:
+        # A shard has no Users, Categories or rate tables of its own, so
+        # unqualified names fall through to the attached catalog
+        conn.execute('ATTACH DATABASE ? AS catalog', (catalog,))
+    return conn
+
+
+def is_currency_code(code):
+    # ISO 4217 style: three letters, already upper-cased by the caller
+    return len(code) == 3 and code.isalpha()
+
+
+def catalog_path(db_path):
+    match = SHARD_FILE.match(str(db_path))
+    return f'{match.group(1)}.db' if match else None
+
+
+def shard_path(db_path, shard):
+    base = db_path[:-3] if db_path.endswith('.db') else db_path
+    return f'{base}.shard{shard}.db'
+
+
+def shard_paths(db_path=DB_PATH):
+    # Shards registered in the catalog; empty unless storage is sharded
+    conn = connect(db_path)
+    shards = [row[0] for row in conn.execute('SELECT shard_id FROM Shards ORDER BY shard_id')]
+    conn.close()
+    return [shard_path(db_path, shard) for shard in shards]
+
+
+def user_db_path(db_path, user_id, paths):
+    # The database holding a user's rows: their shard, or the catalog itself
+    return paths[user_id % len(paths)] if paths else db_path
+
+
+def add_column(cursor, table, column, definition):
+    # Lightweight migration for databases created by older versions
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+# Database Setup
+def init_database(db_path=DB_PATH):
+    conn = connect(db_path)
+    cursor = conn.cursor()
+
+    # New files release free pages in small steps (maintenance.py); only
+    # takes effect before the first table is created
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
+    # WAL lets readers run next to the write queue and makes
+    # synchronous=NORMAL safe for group commits
+    cursor.execute('PRAGMA journal_mode=WAL')
+
+    init_catalog_tables(cursor)
+    init_user_tables(cursor)
+
+    conn.commit()
+    conn.close()
+
+    # Shards get the same per-user tables and migrations
+    for path in shard_paths(db_path):
+        init_shard(path)
+
+
+def init_shard(db_path):
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    init_user_tables(cursor)
+    conn.commit()
+    conn.close()
+
+
+# Users, categories, exchange rates and the default rows
+def init_catalog_tables(cursor):
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Users (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0,
+            registration_date DATE DEFAULT CURRENT_DATE
+        )
+    ''')
+
+    # Orders the user table sorts by (paging.py)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_name ON Users (name)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_registration ON Users (registration_date)')
+
+    # Categories table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Categories (
+            category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category_name TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    # Daily exchange rates, in reporting currency units per unit of currency
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS FxRates (
+            currency TEXT NOT NULL,
+            date DATE NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, date)
+        ) WITHOUT ROWID
+    ''')
+
+    # Monthly average of FxRates, used to convert the monthly rollups
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS MonthlyRates (
+            currency TEXT NOT NULL,
+            month TEXT NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (currency, month)
+        ) WITHOUT ROWID
+    ''')
+
+    # Storage shards; empty unless sharding has been enabled (shards.py)
+    cursor.execute('CREATE TABLE IF NOT EXISTS Shards (shard_id INTEGER PRIMARY KEY)')
+
+    # How far into each other database file's change log sync has read (sync.py)
+    cursor.execute('CREATE TABLE IF NOT EXISTS SyncPeers (origin TEXT PRIMARY KEY, seq INTEGER NOT NULL) WITHOUT ROWID')
+
+    # Insert default categories
+    default_categories = ['Food', 'Travel', 'Shopping', 'Bills', 'Others']
+    for category in default_categories:
+        cursor.execute('INSERT OR IGNORE INTO Categories (category_name) VALUES (?)', (category,))
+
+    # Create admin user if not exists
+    admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
+    cursor.execute('INSERT OR IGNORE INTO Users (name, email, password, is_admin) VALUES (?, ?, ?, ?)',
+                   ('Admin', 'admin@expense.com', admin_pass, 1))
+
+    # Change capture for sync
+    init_changelog(cursor, ('Categories',))
+
+
+# Tables holding per-user rows
+def init_user_tables(cursor):
+    # Expenses table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Expenses (
+            expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            date DATE NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            FOREIGN KEY (category_id) REFERENCES Categories (category_id)
+        )
+    ''')
+
+    # Currency of each amount
+    add_column(cursor, 'Expenses', 'currency', f"TEXT NOT NULL DEFAULT '{REPORTING_CURRENCY}'")
+
+    # Expenses generated from a recurring schedule; at most one per schedule and date
+    add_column(cursor, 'Expenses', 'recurring_id', 'INTEGER')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_recurring
+                      ON Expenses (recurring_id, date) WHERE recurring_id IS NOT NULL''')
+
+    # Per-user listings are always filtered by user and ordered by date
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON Expenses (user_id, date)')
+
+    # The other orders the expense table sorts by (paging.py); by category
+    # the rows are read category by category, by date within each
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_amount ON Expenses (user_id, amount)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON Expenses (user_id, category_id, date)')
+
+    # Aggregate rollups maintained by triggers
+    init_rollups(cursor)
+
+    # Years whose expenses were moved to archive files (archive.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ArchivedYears (
+            year INTEGER PRIMARY KEY,
+            expense_count INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Files attached to expenses, stored by content hash next to the
+    # database (attachments.py). Not tied to Expenses by a foreign key, as
+    # archived expenses keep theirs.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Attachments (
+            attachment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expense_id INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_expense ON Attachments (expense_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_attachments_sha256 ON Attachments (sha256)')
+
+    # Last run of each maintenance task on this file (maintenance.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Maintenance (
+            task TEXT PRIMARY KEY,
+            last_run REAL NOT NULL,
+            duration_ms INTEGER NOT NULL,
+            note TEXT
+        ) WITHOUT ROWID
+    ''')
+
+    # Reports table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Reports (
+            report_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_amount REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id)
+        )
+    ''')
+
+    # Budgets table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Budgets (
+            budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            limit_amount REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            UNIQUE(user_id, month)
+        )
+    ''')
+
+    # Recurring weekly/monthly/yearly limits; category_id NULL means "all categories"
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS CategoryBudgets (
+            budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_id INTEGER,
+            period TEXT NOT NULL CHECK (period IN ('weekly', 'monthly', 'yearly')),
+            limit_amount REAL NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            FOREIGN KEY (category_id) REFERENCES Categories (category_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_category_budgets_user ON CategoryBudgets (user_id)')
+
+    # Recurring expense schedules; next_date is the next occurrence to generate
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS RecurringExpenses (
+            recurring_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL CHECK (frequency IN ('weekly', 'monthly', 'yearly')),
+            day INTEGER NOT NULL,
+            start_date DATE NOT NULL,
+            end_date DATE,
+            next_date DATE NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            FOREIGN KEY (category_id) REFERENCES Categories (category_id)
+        )
+    ''')
+    add_column(cursor, 'RecurringExpenses', 'currency', f"TEXT NOT NULL DEFAULT '{REPORTING_CURRENCY}'")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurring_next_date ON RecurringExpenses (next_date)')
+
+    # Free-form tags, any number per expense (tags.py). ExpenseTags carries
+    # user_id so a user's pairs are one range of its key.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Tags (
+            tag_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            UNIQUE(user_id, name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpenseTags (
+            user_id INTEGER NOT NULL,
+            tag_id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, tag_id, expense_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expense_tags_expense ON ExpenseTags (expense_id)')
+
+    # Deleting an expense drops its tags; archiving (capture off) keeps them
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_untag AFTER DELETE ON Expenses
+        WHEN (SELECT value FROM SyncMeta WHERE key = 'capture') = '1'
+        BEGIN
+            DELETE FROM ExpenseTags WHERE expense_id = old.expense_id;
+        END
+    ''')
+
+    # Saved date and category filters (saved_views.py); NULL bounds are open
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SavedViews (
+            view_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            date_from DATE,
+            date_to DATE,
+            category_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES Users (user_id),
+            UNIQUE(user_id, name)
+        )
+    ''')
+
+    # Each view's matching expenses and its spending per month and currency,
+    # kept current by the triggers below like the rollups
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SavedViewRows (
+            view_id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (view_id, expense_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_saved_view_rows_expense ON SavedViewRows (expense_id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS SavedViewTotals (
+            view_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (view_id, month, currency)
+        ) WITHOUT ROWID
+    ''')
+
+    # A row joins every view of its user whose filter it matches, and
+    # leaves the views it is in; archiving (capture off) keeps it in them
+    matches = '''v.user_id = NEW.user_id AND (v.date_from IS NULL OR NEW.date >= v.date_from)
+                 AND (v.date_to IS NULL OR NEW.date <= v.date_to)
+                 AND (v.category_id IS NULL OR v.category_id = NEW.category_id)'''
+    join_views = f'''
+            INSERT INTO SavedViewRows (view_id, expense_id, user_id)
+            SELECT v.view_id, NEW.expense_id, NEW.user_id FROM SavedViews v WHERE {matches};
+            INSERT INTO SavedViewTotals (view_id, month, currency, user_id, total, count)
+            SELECT v.view_id, substr(NEW.date, 1, 7), NEW.currency, NEW.user_id, NEW.amount, 1
+            FROM SavedViews v WHERE {matches}
+            ON CONFLICT (view_id, month, currency)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;'''
+    leave_views = '''
+            UPDATE SavedViewTotals SET total = total - OLD.amount, count = count - 1
+            WHERE view_id IN (SELECT view_id FROM SavedViewRows WHERE expense_id = OLD.expense_id)
+              AND month = substr(OLD.date, 1, 7) AND currency = OLD.currency;
+            DELETE FROM SavedViewTotals
+            WHERE view_id IN (SELECT view_id FROM SavedViewRows WHERE expense_id = OLD.expense_id)
+              AND month = substr(OLD.date, 1, 7) AND currency = OLD.currency AND count <= 0;
+            DELETE FROM SavedViewRows WHERE expense_id = OLD.expense_id;'''
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS saved_views_insert AFTER INSERT ON Expenses
+        BEGIN{join_views}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS saved_views_delete AFTER DELETE ON Expenses
+        WHEN (SELECT value FROM SyncMeta WHERE key = 'capture') = '1'
+        BEGIN{leave_views}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS saved_views_update
+        AFTER UPDATE OF user_id, category_id, date, amount, currency ON Expenses
+        BEGIN{leave_views}{join_views}
+        END
+    ''')
+
+    # Change capture for sync
+    init_changelog(cursor, ('Expenses', 'Budgets'))
@@ -1,88 +1,71 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from tkinter import font as tkfont
 import sqlite3
 import hashlib
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import calendar
+import json
+import os
+import re
+import time
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import pandas as pd
 
-# Database Setup
-def init_database():
-    conn = sqlite3.connect('expense_tracker.db')
-    cursor = conn.cursor()
-    
-    # Users table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Users (
-            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0,
-            registration_date DATE DEFAULT CURRENT_DATE
-        )
-    ''')
-    
-    # Categories table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Categories (
-            category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            category_name TEXT NOT NULL UNIQUE
-        )
-    ''')
-    
-    # Expenses table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Expenses (
-            expense_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            category_id INTEGER NOT NULL,
-            date DATE NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            FOREIGN KEY (user_id) REFERENCES Users (user_id),
-            FOREIGN KEY (category_id) REFERENCES Categories (category_id)
-        )
-    ''')
-    
-    # Reports table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Reports (
-            report_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            month TEXT NOT NULL,
-            total_amount REAL NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES Users (user_id)
-        )
-    ''')
-    
-    # Budgets table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Budgets (
-            budget_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            month TEXT NOT NULL,
-            limit_amount REAL NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES Users (user_id),
-            UNIQUE(user_id, month)
-        )
-    ''')
-    
-    # Insert default categories
-    default_categories = ['Food', 'Travel', 'Shopping', 'Bills', 'Others']
-    for category in default_categories:
-        cursor.execute('INSERT OR IGNORE INTO Categories (category_name) VALUES (?)', (category,))
-    
-    # Create admin user if not exists
-    admin_pass = hashlib.sha256('admin123'.encode()).hexdigest()
-    cursor.execute('INSERT OR IGNORE INTO Users (name, email, password, is_admin) VALUES (?, ?, ?, ?)',
-                   ('Admin', 'admin@expense.com', admin_pass, 1))
-    
-    conn.commit()
-    conn.close()
+from anomalies import AnomalyDetector
+from autocomplete import DescriptionIndex
+from archive import ARCHIVE_KEEP_YEARS, archive_cutoff, fetch_expenses, purge_archives
+from attachments import AttachmentStore
+from budgets import BudgetEngine, PERIODS
+from calendar_heatmap import CalendarHeatmap
+from currency import RateCache, load_rates_csv, month_rate_sql
+from dashboard import DashboardProvider
+from database import DB_PATH, REPORTING_CURRENCY, connect, init_database, is_currency_code, shard_path
+from events import ChangeBus, INSERTED, UPDATED, DELETED
+from forecast import Forecaster
+from maintenance import MAINTENANCE_INTERVALS, DatabaseMaintenance
+from paging import EXPENSE_SORTS, USER_SORTS, Pager, after, order_by
+from pivot import PivotEngine
+from trends import TrendAnalyzer, latest, overall
+from recurring import FREQUENCIES, add_schedule, generate_due
+from saved_views import VIEW_FILTER, delete_view, list_views, save_view
+from shards import ShardMap, delete_user_rows
+from tags import TagIndex
+from sync import DatabaseSync
+from watcher import DataVersionWatcher
+from write_queue import WriteQueue
+
+# Write-behind settings for expense inserts, edits and deletes
+WRITE_LATENCY_MS = 50
+WRITE_DURABILITY = 'normal'
+
+# How often change events are delivered to open views
+EVENT_PUMP_MS = 50
+
+# How often the dashboard checks the database for outside changes
+DASHBOARD_POLL_MS = 1000
+
+# Months shown in the pivot report
+PIVOT_MONTHS = 12
+
+# Months of history drawn in the trends chart
+TREND_MONTHS = 36
+
+# Ranges offered by the daily calendar report, in days (None = all history)
+CALENDAR_RANGES = (("Last 3 Months", 91), ("Last Year", 365), ("Last 5 Years", 5 * 365), ("All Time", None))
+
+# How often due recurring expenses are generated while the app is open
+RECURRING_CHECK_MS = 60 * 60 * 1000
+
+# Rows per page in the expense and user tables
+EXPENSE_PAGE_SIZE = 200
+USER_PAGE_SIZE = 200
+
+# Database maintenance runs once the user has been idle this long, checked
+# every MAINTENANCE_CHECK_MS; any key press or click stops it
+MAINTENANCE_IDLE_MS = 2 * 60 * 1000
+MAINTENANCE_CHECK_MS = 30 * 1000
 
 # Main Application Class
 class ExpenseTrackerApp:
@@ -95,6 +78,40 @@ class ExpenseTrackerApp:
         # Initialize database
         init_database()
         
+        # Expense mutations are group-committed by a background writer and
+        # announced to open views as row-level change events
+        self.change_bus = ChangeBus()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(EVENT_PUMP_MS, self.pump_events)
+        
+        # With sharded storage each user's rows live in their own shard;
+        # the writer and the per-user engines are reopened on it at login
+        self.shard_map = ShardMap(DB_PATH)
+        self.rates = RateCache(DB_PATH)
+        self.database_sync = DatabaseSync(DB_PATH)
+        self.db_path = None
+        self.open_storage(DB_PATH)
+        
+        # Unusually large expenses, scored incrementally as they are added
+        self.change_bus.subscribe('Expenses', self.track_anomalies)
+        
+        # Past descriptions for autocomplete, extended as expenses are added
+        self.change_bus.subscribe('Expenses', self.track_descriptions)
+        
+        # Running budget totals for the logged-in user. New expenses update
+        # them directly; any other change just marks them for a reload.
+        self.budget_engine = None
+        for table in ('Expenses', 'Budgets', 'CategoryBudgets'):
+            self.change_bus.subscribe(table, self.invalidate_budgets)
+        self.root.after(RECURRING_CHECK_MS, self.check_recurring)
+        
+        # Checkpoints, statistics and free-space reclaim in idle time
+        self.maintenance = DatabaseMaintenance(DB_PATH)
+        self.last_activity = time.monotonic()
+        for sequence in ('<KeyPress>', '<ButtonPress>', '<MouseWheel>'):
+            self.root.bind_all(sequence, self.note_activity, add='+')
+        self.root.after(MAINTENANCE_CHECK_MS, self.check_maintenance)
+        
         # Current user
         self.current_user = None
         self.is_admin = False
@@ -107,6 +124,184 @@ class ExpenseTrackerApp:
         # Show login screen
         self.show_login_screen()
     
+    def connect(self):
+        # Make queued writes visible before reading
+        self.write_queue.flush()
+        return connect(self.db_path)
+    
+    def open_storage(self, db_path):
+        if db_path == self.db_path:
+            return
+        if self.db_path is not None:
+            self.close_storage()
+        
+        self.db_path = db_path
+        self.write_queue = WriteQueue(db_path, latency_ms=WRITE_LATENCY_MS, durability=WRITE_DURABILITY,
+                                      bus=self.change_bus)
+        
+        # Cached dashboard statistics and spending forecasts, computed in the background
+        self.dashboard_provider = DashboardProvider(db_path)
+        self.forecaster = Forecaster(db_path)
+        self.pivot_engine = PivotEngine(db_path)
+        self.calendar_heatmap = CalendarHeatmap(db_path, rates=self.rates)
+        self.trend_analyzer = TrendAnalyzer(db_path)
+        self.anomaly_detector = AnomalyDetector(db_path, rates=self.rates)
+        self.description_index = DescriptionIndex(db_path)
+        self.attachment_store = AttachmentStore(db_path)
+        self.tag_index = TagIndex(db_path, rates=self.rates)
+        
+        # Tells the running budget totals about writes from outside the app
+        self.budget_watcher = DataVersionWatcher(db_path)
+    
+    def close_storage(self):
+        self.write_queue.close()
+        self.budget_watcher.close()
+        self.dashboard_provider.close()
+        self.forecaster.close()
+        self.pivot_engine.close()
+        self.calendar_heatmap.close()
+        self.trend_analyzer.close()
+        self.anomaly_detector.close()
+        self.description_index.close()
+        self.attachment_store.close()
+        self.tag_index.close()
+    
+    def pump_events(self):
+        self.change_bus.dispatch()
+        self.root.after(EVENT_PUMP_MS, self.pump_events)
+    
+    def note_activity(self, event=None):
+        self.last_activity = time.monotonic()
+        self.maintenance.interrupt()
+    
+    def check_maintenance(self):
+        if (time.monotonic() - self.last_activity) * 1000 >= MAINTENANCE_IDLE_MS:
+            self.maintenance.run_async()
+        self.root.after(MAINTENANCE_CHECK_MS, self.check_maintenance)
+    
+    def when_done(self, future, callback, on_error=None):
+        # Hand a background result back to the Tk thread once it is ready
+        if not future.done():
+            self.root.after(10, self.when_done, future, callback, on_error)
+        elif on_error is not None and future.exception() is not None:
+            on_error(future.exception())
+        else:
+            callback(future.result())
+    
+    def subscribe_view(self, widget, table, callback):
+        # Deliver change events to a view until its widget is destroyed
+        self.change_bus.subscribe(table, callback)
+        widget.bind('<Destroy>', lambda e: self.change_bus.unsubscribe(table, callback), add='+')
+    
+    def upsert_tree_rows(self, tree, rows, sort_column=None):
+        # rows are (iid, values, tags). Existing items are updated in place and
+        # new ones inserted; with sort_column the rows are placed by binary
+        # search so the column stays in descending order, ties newest (highest
+        # numeric iid) first as in the queries.
+        if sort_column is None:
+            for iid, values, tags in rows:
+                if tree.exists(iid):
+                    tree.item(iid, values=values, tags=tags)
+                else:
+                    tree.insert('', 'end', iid=iid, values=values, tags=tags)
+            return
+        
+        for iid, values, tags in rows:
+            if tree.exists(iid):
+                tree.detach(iid)
+        
+        column = tree['columns'].index(sort_column)
+        order = lambda iid, value: (value, int(iid) if str(iid).isdigit() else str(iid))
+        children = list(tree.get_children())
+        for iid, values, tags in rows:
+            key = order(iid, str(values[column]))
+            lo, hi = 0, len(children)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if order(children[mid], tree.set(children[mid], sort_column)) >= key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            
+            if tree.exists(iid):
+                tree.item(iid, values=values, tags=tags)
+                tree.move(iid, '', lo)
+            else:
+                tree.insert('', lo, iid=iid, values=values, tags=tags)
+            children.insert(lo, str(iid))
+    
+    def drop_tree_rows(self, tree, keys):
+        tree.delete(*[key for key in keys if tree.exists(key)])
+    
+    def generate_recurring(self):
+        # Catch up on every occurrence that came due while the app was closed
+        conn = self.connect()
+        inserted = generate_due(conn, self.current_user['id'])
+        conn.close()
+        
+        if inserted:
+            # These bypass check_budget_alert, so reseed the running totals
+            self.budget_engine.invalidate()
+            self.change_bus.publish('Expenses', INSERTED, tuple(inserted))
+        return inserted
+    
+    def check_recurring(self):
+        if self.current_user:
+            self.generate_recurring()
+        self.root.after(RECURRING_CHECK_MS, self.check_recurring)
+    
+    def invalidate_budgets(self, event):
+        if self.budget_engine and not (event.table == 'Expenses' and event.action == INSERTED):
+            self.budget_engine.invalidate()
+    
+    def track_anomalies(self, event):
+        if not self.current_user:
+            return
+        if event.action == INSERTED:
+            future = self.anomaly_detector.add_async(self.current_user['id'], event.keys)
+            self.when_done(future, lambda found: self.mark_anomalies([anomaly.expense_id for anomaly in found]))
+        else:
+            # Edits and deletes move the statistics; drop the model at once so
+            # flagged() no longer shows them
+            self.anomaly_detector.invalidate(self.current_user['id'])
+    
+    def track_descriptions(self, event):
+        if not self.current_user:
+            return
+        if event.action == INSERTED:
+            self.description_index.add_async(self.current_user['id'], event.keys)
+        else:
+            # Edits and deletes change the counts; rebuild in the background
+            self.description_index.invalidate(self.current_user['id'])
+            self.description_index.load_async(self.current_user['id'])
+    
+    def mark_anomalies(self, expense_ids):
+        # Highlight flagged rows in whichever expense lists are open
+        for tree_name in ('expense_tree', 'recent_tree'):
+            tree = getattr(self, tree_name, None)
+            if tree is None or not tree.winfo_exists():
+                continue
+            for expense_id in expense_ids:
+                if tree.exists(expense_id):
+                    tree.item(expense_id, tags=('anomaly',))
+    
+    def read_currency(self, entry):
+        # The code typed or picked in a currency box, or None once the user
+        # has been told it is invalid or declined to use one with no rates
+        currency = entry.get().strip().upper() or REPORTING_CURRENCY
+        if not is_currency_code(currency):
+            messagebox.showerror("Error", f"Invalid currency: {currency} (use a 3-letter code such as USD)")
+            return None
+        if currency not in self.rates.currencies() and not messagebox.askyesno(
+                "Warning", f"No exchange rates are loaded for {currency}, so reports will count it 1:1 with "
+                           f"{REPORTING_CURRENCY}. Save anyway?"):
+            return None
+        return currency
+    
+    def expense_amount_text(self, amount, currency):
+        # Single expenses are shown in their own currency
+        return f"{amount:.2f}" if currency == REPORTING_CURRENCY else f"{amount:.2f} {currency}"
+    
     def hash_password(self, password):
         return hashlib.sha256(password.encode()).hexdigest()
     
@@ -161,7 +356,7 @@ class ExpenseTrackerApp:
             messagebox.showerror("Error", "Please fill all fields")
             return
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM Users WHERE email = ? AND password = ?', (email, password))
@@ -170,6 +365,10 @@ class ExpenseTrackerApp:
         if user:
             self.current_user = {'id': user[0], 'name': user[1], 'email': user[2]}
             self.is_admin = user[4] == 1
+            self.open_storage(self.shard_map.path_for(user[0]))
+            self.budget_engine = BudgetEngine(user[0], opener=self.connect, watcher=self.budget_watcher)
+            self.description_index.load_async(user[0])
+            self.generate_recurring()
             self.show_dashboard()
         else:
             messagebox.showerror("Error", "Invalid credentials")
@@ -181,29 +380,134 @@ class ExpenseTrackerApp:
         to_date = self.filter_to_date.get()
         category = self.filter_category.get()
         
+        self.close_saved_view()
+        
         filter_parts = []
+        params = []
         
         if from_date:
-            filter_parts.append(f"AND e.date >= '{from_date}'")
+            filter_parts.append("AND e.date >= ?")
+            params.append(from_date)
         if to_date:
-            filter_parts.append(f"AND e.date <= '{to_date}'")
+            filter_parts.append("AND e.date <= ?")
+            params.append(to_date)
         if category and category != 'All':
-            filter_parts.append(f"AND c.category_name = '{category}'")
-        
-        filter_query = ' '.join(filter_parts)
-        self.load_expenses(filter_query)
+            filter_parts.append("AND c.category_name = ?")
+            params.append(category)
+        
+        def search(expense_ids=None):
+            # Tag searches are answered from the tag bitmaps; the matching
+            # ids are handed to the query as one JSON array
+            if expense_ids is not None:
+                filter_parts.append("AND e.expense_id IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps(expense_ids.tolist()))
+            self.load_expenses((' '.join(filter_parts), params), (from_date, to_date))
+        
+        tags = self.filter_tags.get().strip()
+        if tags:
+            self.when_done(self.tag_index.query_async(self.current_user['id'], tags), search,
+                           on_error=lambda e: messagebox.showerror("Error", str(e)))
+        else:
+            search()
     
     def reset_filters(self):
         self.filter_from_date.delete(0, tk.END)
         self.filter_to_date.delete(0, tk.END)
         self.filter_category.current(0)
+        self.filter_tags.delete(0, tk.END)
+        self.close_saved_view()
         self.load_expenses()
     
+    def load_saved_views(self):
+        conn = self.connect()
+        self.saved_views = {view.name: view for view in list_views(conn, self.current_user['id'])}
+        conn.close()
+        self.saved_view_box['values'] = list(self.saved_views)
+        if self.saved_view is not None:
+            self.saved_view = self.saved_views.get(self.saved_view.name)
+        self.show_saved_view_total()
+    
+    def show_saved_view_total(self):
+        view = self.saved_view
+        self.saved_view_total.config(text=f"{view.count} expenses, ₹{view.total:.2f}" if view else "")
+    
+    def open_saved_view(self):
+        view = self.saved_views.get(self.saved_view_box.get())
+        if view is None:
+            return
+        
+        # Show the view's filters, then list its materialized rows
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT category_name FROM Categories WHERE category_id = ?', (view.category_id,))
+        category = cursor.fetchone()
+        conn.close()
+        
+        self.filter_from_date.delete(0, tk.END)
+        self.filter_from_date.insert(0, view.date_from or '')
+        self.filter_to_date.delete(0, tk.END)
+        self.filter_to_date.insert(0, view.date_to or '')
+        self.filter_category.set(category[0] if category else 'All')
+        self.filter_tags.delete(0, tk.END)
+        
+        self.saved_view = view
+        self.show_saved_view_total()
+        # The view's total covers its archived rows, so its listing reaches them too
+        self.load_expenses((VIEW_FILTER, [view.view_id]), (view.date_from or '0000-01-01', view.date_to))
+    
+    def close_saved_view(self):
+        self.saved_view = None
+        self.saved_view_box.set('')
+        self.show_saved_view_total()
+    
+    def save_current_view(self):
+        name = simpledialog.askstring("Save View", "Name for the current date and category filters:",
+                                      initialvalue=self.saved_view.name if self.saved_view else '', parent=self.root)
+        if not name:
+            return
+        if self.filter_tags.get().strip():
+            messagebox.showinfo("Save View", "Tag filters are not saved with a view")
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        category = self.filter_category.get()
+        cursor.execute('SELECT category_id FROM Categories WHERE category_name = ?', (category,))
+        row = cursor.fetchone()
+        try:
+            save_view(conn, self.db_path, self.current_user['id'], name, self.filter_from_date.get().strip(),
+                      self.filter_to_date.get().strip(), row[0] if row and category != 'All' else None)
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        finally:
+            conn.close()
+        
+        self.load_saved_views()
+        self.saved_view_box.set(' '.join(name.split()))
+        self.open_saved_view()
+    
+    def delete_saved_view(self):
+        view = self.saved_views.get(self.saved_view_box.get())
+        if view is None:
+            messagebox.showwarning("Warning", "Please select a saved view to delete")
+            return
+        if not messagebox.askyesno("Confirm", f"Delete the saved view '{view.name}'?"):
+            return
+        
+        conn = self.connect()
+        delete_view(conn, self.current_user['id'], view.view_id)
+        conn.close()
+        self.saved_view_box.set('')
+        self.load_saved_views()
+        self.reset_filters()
+    
     def edit_expense(self):
         selected = self.expense_tree.selection()
         if not selected:
             messagebox.showwarning("Warning", "Please select an expense to edit")
             return
+        if self.archived_selected():
+            return
         
         item = self.expense_tree.item(selected[0])
         expense_id = item['values'][0]
@@ -211,12 +515,12 @@ class ExpenseTrackerApp:
         # Create edit dialog
         edit_window = tk.Toplevel(self.root)
         edit_window.title("Edit Expense")
-        edit_window.geometry("400x400")
+        edit_window.geometry("460x680")
         
         # Get current expense data
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''SELECT e.date, c.category_name, e.amount, e.description, e.category_id
+        cursor.execute('''SELECT e.date, c.category_name, e.amount, e.description, e.category_id, e.currency
                          FROM Expenses e
                          JOIN Categories c ON e.category_id = c.category_id
                          WHERE e.expense_id = ?''', (expense_id,))
@@ -245,10 +549,24 @@ class ExpenseTrackerApp:
         amount_entry.insert(0, current_data[2])
         amount_entry.grid(row=2, column=1, pady=5, padx=5)
         
-        tk.Label(edit_window, text="Description:").grid(row=3, column=0, sticky='ne', pady=5, padx=5)
+        tk.Label(edit_window, text="Currency:").grid(row=3, column=0, sticky='e', pady=5, padx=5)
+        currency_menu = ttk.Combobox(edit_window, values=self.rates.currencies(), width=18)
+        currency_menu.set(current_data[5])
+        currency_menu.grid(row=3, column=1, pady=5, padx=5)
+        
+        tk.Label(edit_window, text="Description:").grid(row=4, column=0, sticky='ne', pady=5, padx=5)
         desc_text = tk.Text(edit_window, width=20, height=4)
         desc_text.insert('1.0', current_data[3] or '')
-        desc_text.grid(row=3, column=1, pady=5, padx=5)
+        desc_text.grid(row=4, column=1, pady=5, padx=5)
+        
+        tk.Label(edit_window, text="Tags:").grid(row=5, column=0, sticky='e', pady=5, padx=5)
+        tags_entry = tk.Entry(edit_window, width=20)
+        tags_entry.insert(0, ' '.join(self.tag_index.expense_tags(expense_id)))
+        tags_entry.grid(row=5, column=1, pady=5, padx=5)
+        
+        # Receipts are attached and removed straight away, not on Save
+        tk.Label(edit_window, text="Receipts:").grid(row=6, column=0, sticky='ne', pady=5, padx=5)
+        self.receipt_panel(edit_window, expense_id).grid(row=6, column=1, pady=5, padx=5, sticky='w')
         
         # Save function
         def save_changes():
@@ -257,50 +575,246 @@ class ExpenseTrackerApp:
                 new_category = category_var.get()
                 new_amount = float(amount_entry.get())
                 new_desc = desc_text.get('1.0', tk.END).strip()
+                new_currency = self.read_currency(currency_menu)
+                if new_currency is None:
+                    return
+                new_tags = [tag for tag in re.split(r'[\s,]+', tags_entry.get()) if tag]
                 
                 category_id = category_map[new_category]
                 
-                conn = sqlite3.connect('expense_tracker.db')
-                cursor = conn.cursor()
-                cursor.execute('''UPDATE Expenses 
-                                SET date = ?, category_id = ?, amount = ?, description = ?
+                future = self.write_queue.submit('''UPDATE Expenses 
+                                SET date = ?, category_id = ?, amount = ?, description = ?, currency = ?
                                 WHERE expense_id = ?''',
-                              (new_date, category_id, new_amount, new_desc, expense_id))
-                conn.commit()
-                conn.close()
-                
-                messagebox.showinfo("Success", "Expense updated successfully!")
-                edit_window.destroy()
-                self.load_expenses()
+                              (new_date, category_id, new_amount, new_desc, new_currency, expense_id),
+                              event=('Expenses', UPDATED, (expense_id,)))
                 
             except Exception as e:
                 messagebox.showerror("Error", str(e))
+                return
+            
+            # Confirmed once the write commits; on failure the dialog stays open
+            def saved(result):
+                self.when_done(self.tag_index.set_tags_async(self.current_user['id'], expense_id, new_tags),
+                               lambda result: None, on_error=lambda e: messagebox.showerror("Error", str(e)))
+                messagebox.showinfo("Success", "Expense updated successfully!")
+                edit_window.destroy()
+            
+            self.when_done(future, saved, on_error=lambda e: messagebox.showerror("Error", str(e)))
         
         # Buttons
         button_frame = tk.Frame(edit_window)
-        button_frame.grid(row=4, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=7, column=0, columnspan=2, pady=20)
         
         tk.Button(button_frame, text="Save", command=save_changes, bg='#4CAF50', fg='white', padx=20).pack(side=tk.LEFT, padx=5)
         tk.Button(button_frame, text="Cancel", command=edit_window.destroy, bg='#f44336', fg='white', padx=20).pack(side=tk.LEFT, padx=5)
     
+    def receipt_panel(self, parent, expense_id):
+        # The expense's attachments, a thumbnail of the selected one (made in
+        # the background the first time) and buttons to attach, open, save
+        # a copy of and remove them
+        panel = tk.Frame(parent)
+        receipt_list = tk.Listbox(panel, width=30, height=4)
+        receipt_list.pack(anchor='w')
+        preview = tk.Label(panel, text="")
+        preview.pack(anchor='w', pady=5)
+        receipts = []
+        
+        def selected():
+            selection = receipt_list.curselection()
+            return receipts[selection[0]] if selection else None
+        
+        def refresh():
+            receipts[:] = self.attachment_store.list(expense_id)
+            receipt_list.delete(0, tk.END)
+            for attachment in receipts:
+                receipt_list.insert(tk.END, f"{attachment.file_name} ({attachment.size / 1024:.0f} KB)")
+            show_preview()
+        
+        def show_preview(event=None):
+            attachment = selected()
+            preview.config(image='', text="")
+            preview.image = None
+            if attachment is None:
+                return
+            
+            def shown(path):
+                if not preview.winfo_exists() or selected() != attachment:
+                    return
+                if path is None:
+                    preview.config(text="No preview")
+                    return
+                preview.image = tk.PhotoImage(file=path)
+                preview.config(image=preview.image)
+            
+            self.when_done(self.attachment_store.thumbnail_async(attachment), shown)
+        
+        def attach():
+            paths = filedialog.askopenfilenames(parent=parent, title="Attach receipts",
+                                                filetypes=[("Images and PDFs", "*.jpg *.jpeg *.png *.gif *.webp *.pdf"),
+                                                           ("All files", "*.*")])
+            if paths:
+                self.when_done(self.attachment_store.add_async(expense_id, paths),
+                               lambda added: panel.winfo_exists() and refresh(),
+                               on_error=lambda e: messagebox.showerror("Error", f"Could not attach: {e}", parent=parent))
+        
+        def open_receipt():
+            attachment = selected()
+            if attachment:
+                self.attachment_store.open(attachment)
+        
+        def save_copy():
+            attachment = selected()
+            if not attachment:
+                return
+            path = filedialog.asksaveasfilename(parent=parent, initialfile=attachment.file_name)
+            if path:
+                self.attachment_store.copy_to(attachment, path)
+        
+        def remove():
+            attachment = selected()
+            if attachment and messagebox.askyesno("Confirm", f"Remove {attachment.file_name}?", parent=parent):
+                self.attachment_store.remove(attachment.attachment_id)
+                refresh()
+        
+        receipt_list.bind('<<ListboxSelect>>', show_preview)
+        receipt_list.bind('<Double-Button-1>', lambda e: open_receipt())
+        
+        buttons = tk.Frame(panel)
+        buttons.pack(anchor='w')
+        for text, command in (("Attach…", attach), ("Open", open_receipt), ("Save Copy", save_copy), ("Remove", remove)):
+            tk.Button(buttons, text=text, command=command).pack(side=tk.LEFT, padx=2)
+        
+        refresh()
+        return panel
+    
     def delete_expense(self):
         selected = self.expense_tree.selection()
         if not selected:
             messagebox.showwarning("Warning", "Please select an expense to delete")
             return
+        if self.archived_selected():
+            return
+        
+        if len(selected) == 1:
+            prompt = "Are you sure you want to delete this expense?"
+        else:
+            prompt = f"Are you sure you want to delete {len(selected)} expenses?"
         
-        if messagebox.askyesno("Confirm", "Are you sure you want to delete this expense?"):
-            item = self.expense_tree.item(selected[0])
-            expense_id = item['values'][0]
+        if messagebox.askyesno("Confirm", prompt):
+            expense_ids = self.selected_expense_ids()
+            placeholders = ', '.join('?' * len(expense_ids))
             
-            conn = sqlite3.connect('expense_tracker.db')
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM Expenses WHERE expense_id = ?', (expense_id,))
-            conn.commit()
-            conn.close()
+            # One set-based statement, committed as a single transaction
+            future = self.write_queue.submit(f'DELETE FROM Expenses WHERE user_id = ? AND expense_id IN ({placeholders})',
+                                             [self.current_user['id']] + expense_ids,
+                                             event=('Expenses', DELETED, expense_ids))
+            self.when_done(future,
+                           lambda result: messagebox.showinfo("Success",
+                                                              f"{len(expense_ids)} expense(s) deleted successfully!"),
+                           on_error=lambda e: messagebox.showerror("Error", str(e)))
+    
+    def selected_expense_ids(self):
+        return [self.expense_tree.item(item)['values'][0] for item in self.expense_tree.selection()]
+    
+    def archived_selected(self):
+        # Archived expenses are read-only
+        if any(self.expense_tree.tag_has('archived', item) for item in self.expense_tree.selection()):
+            messagebox.showinfo("Archived", "Archived expenses cannot be changed")
+            return True
+        return False
+    
+    def bulk_add_tag(self):
+        selected = self.expense_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select the expenses to tag")
+            return
+        
+        existing = ', '.join(self.tag_index.names(self.current_user['id'])) or "none yet"
+        tag = simpledialog.askstring("Add Tag", f"Tag for {len(selected)} expense(s)\n(existing: {existing}):",
+                                     parent=self.root)
+        if not tag:
+            return
+        self.when_done(self.tag_index.add_tag_async(self.current_user['id'], self.selected_expense_ids(), tag),
+                       lambda result: messagebox.showinfo("Success", f"Tagged {len(selected)} expense(s)"),
+                       on_error=lambda e: messagebox.showerror("Error", str(e)))
+    
+    def bulk_change_category(self):
+        selected = self.expense_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select the expenses to recategorize")
+            return
+        if self.archived_selected():
+            return
+        
+        expense_ids = self.selected_expense_ids()
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT category_id, category_name FROM Categories')
+        categories = cursor.fetchall()
+        conn.close()
+        
+        category_map = {cat[1]: cat[0] for cat in categories}
+        
+        # Category picker dialog
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Change Category")
+        dialog.geometry("350x150")
+        
+        tk.Label(dialog, text=f"New category for {len(selected)} expense(s):").grid(row=0, column=0, columnspan=2, pady=10, padx=10)
+        category_var = tk.StringVar()
+        category_menu = ttk.Combobox(dialog, textvariable=category_var,
+                                     values=[cat[1] for cat in categories], state='readonly', width=25)
+        category_menu.grid(row=1, column=0, columnspan=2, pady=5, padx=10)
+        if categories:
+            category_menu.current(0)
+        
+        def apply_category():
+            new_category = category_var.get()
+            if not new_category:
+                return
+            
+            placeholders = ', '.join('?' * len(expense_ids))
+            future = self.write_queue.submit(f'''UPDATE Expenses SET category_id = ?
+                                              WHERE user_id = ? AND expense_id IN ({placeholders})''',
+                                             [category_map[new_category], self.current_user['id']] + expense_ids,
+                                             event=('Expenses', UPDATED, expense_ids))
             
-            messagebox.showinfo("Success", "Expense deleted successfully!")
-            self.load_expenses()
+            def moved(result):
+                dialog.destroy()
+                messagebox.showinfo("Success", f"{len(expense_ids)} expense(s) moved to {new_category}")
+            
+            self.when_done(future, moved, on_error=lambda e: messagebox.showerror("Error", str(e)))
+        
+        button_frame = tk.Frame(dialog)
+        button_frame.grid(row=2, column=0, columnspan=2, pady=15)
+        
+        tk.Button(button_frame, text="Apply", command=apply_category, bg='#4CAF50', fg='white', padx=20).pack(side=tk.LEFT, padx=5)
+        tk.Button(button_frame, text="Cancel", command=dialog.destroy, bg='#f44336', fg='white', padx=20).pack(side=tk.LEFT, padx=5)
+    
+    def bulk_shift_date(self):
+        selected = self.expense_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select the expenses to shift")
+            return
+        if self.archived_selected():
+            return
+        
+        days = simpledialog.askinteger("Shift Date",
+                                       f"Shift {len(selected)} expense(s) by how many days?\n(Use a negative number to move them earlier)")
+        if not days:
+            return
+        
+        expense_ids = self.selected_expense_ids()
+        placeholders = ', '.join('?' * len(expense_ids))
+        future = self.write_queue.submit(f'''UPDATE Expenses SET date = date(date, ?)
+                                          WHERE user_id = ? AND expense_id IN ({placeholders})''',
+                                         [f'{days:+d} days', self.current_user['id']] + expense_ids,
+                                         event=('Expenses', UPDATED, expense_ids))
+        self.when_done(future,
+                       lambda result: messagebox.showinfo("Success",
+                                                          f"{len(expense_ids)} expense(s) shifted by {days} day(s)"),
+                       on_error=lambda e: messagebox.showerror("Error", str(e)))
     
     def show_categories(self):
         for widget in self.content_frame.winfo_children():
@@ -350,7 +864,8 @@ class ExpenseTrackerApp:
         tk.Button(action_frame, text="Delete Selected", command=self.delete_category, bg='#e74c3c', fg='white',
                  font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
         
-        # Load categories
+        # Load categories and keep them current from change events
+        self.subscribe_view(self.category_tree, 'Categories', self.apply_category_changes)
         self.load_categories()
     
     def load_categories(self):
@@ -358,17 +873,36 @@ class ExpenseTrackerApp:
         for item in self.category_tree.get_children():
             self.category_tree.delete(item)
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''SELECT c.category_id, c.category_name, COUNT(e.expense_id) as expense_count
-                         FROM Categories c
-                         LEFT JOIN Expenses e ON c.category_id = e.category_id
-                         GROUP BY c.category_id''')
+        cursor.execute('SELECT category_id, category_name FROM Categories')
+        categories = cursor.fetchall()
+        conn.close()
         
-        for row in cursor.fetchall():
-            self.category_tree.insert('', 'end', values=row)
+        # Counted over every shard, archived expenses included
+        usage = self.shard_map.category_usage()
+        for category_id, category_name in categories:
+            self.category_tree.insert('', 'end', iid=category_id,
+                                      values=(category_id, category_name, usage[category_id][0]))
+    
+    def apply_category_changes(self, event):
+        if event.action == DELETED:
+            self.drop_tree_rows(self.category_tree, event.keys)
+            return
         
+        conn = self.connect()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(event.keys))
+        cursor.execute(f'SELECT category_id, category_name FROM Categories WHERE category_id IN ({placeholders})',
+                       event.keys)
+        categories = cursor.fetchall()
         conn.close()
+        
+        usage = self.shard_map.category_usage()
+        rows = [(category_id, (category_id, category_name, usage[category_id][0]), ())
+                for category_id, category_name in categories]
+        
+        self.upsert_tree_rows(self.category_tree, rows)
     
     def add_category(self):
         category_name = self.new_category_entry.get().strip()
@@ -378,15 +912,15 @@ class ExpenseTrackerApp:
             return
         
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self.connect()
             cursor = conn.cursor()
             cursor.execute('INSERT INTO Categories (category_name) VALUES (?)', (category_name,))
             conn.commit()
             conn.close()
             
+            self.change_bus.publish('Categories', INSERTED, (cursor.lastrowid,))
             messagebox.showinfo("Success", "Category added successfully!")
             self.new_category_entry.delete(0, tk.END)
-            self.load_categories()
             
         except sqlite3.IntegrityError:
             messagebox.showerror("Error", "Category already exists")
@@ -405,15 +939,15 @@ class ExpenseTrackerApp:
         
         if new_name and new_name != current_name:
             try:
-                conn = sqlite3.connect('expense_tracker.db')
+                conn = self.connect()
                 cursor = conn.cursor()
                 cursor.execute('UPDATE Categories SET category_name = ? WHERE category_id = ?', 
                               (new_name, category_id))
                 conn.commit()
                 conn.close()
                 
+                self.change_bus.publish('Categories', UPDATED, (category_id,))
                 messagebox.showinfo("Success", "Category updated successfully!")
-                self.load_categories()
                 
             except sqlite3.IntegrityError:
                 messagebox.showerror("Error", "Category name already exists")
@@ -426,21 +960,26 @@ class ExpenseTrackerApp:
         
         item = self.category_tree.item(selected[0])
         category_id = item['values'][0]
-        expense_count = item['values'][2]
         
+        # Read afresh from every shard, not from the table on screen
+        self.write_queue.flush()
+        expense_count, references = self.shard_map.category_usage()[category_id]
         if expense_count > 0:
             messagebox.showerror("Error", "Cannot delete category with existing expenses")
             return
+        if references > 0:
+            messagebox.showerror("Error", "Cannot delete category used by recurring expenses or budgets")
+            return
         
         if messagebox.askyesno("Confirm", "Are you sure you want to delete this category?"):
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self.connect()
             cursor = conn.cursor()
             cursor.execute('DELETE FROM Categories WHERE category_id = ?', (category_id,))
             conn.commit()
             conn.close()
             
+            self.change_bus.publish('Categories', DELETED, (category_id,))
             messagebox.showinfo("Success", "Category deleted successfully!")
-            self.load_categories()
     
     def show_reports(self):
         for widget in self.content_frame.winfo_children():
@@ -457,12 +996,20 @@ class ExpenseTrackerApp:
         tk.Label(options_frame, text="Report Type:", font=self.normal_font, bg='#ecf0f1').pack(side=tk.LEFT, padx=5)
         
         self.report_type = tk.StringVar(value="monthly")
-        report_types = [("Monthly", "monthly"), ("Yearly", "yearly"), ("By Category", "category")]
+        report_types = [("Monthly", "monthly"), ("Yearly", "yearly"), ("By Category", "category"),
+                        ("Category x Month", "pivot"), ("Daily Calendar", "calendar"), ("Trends", "trends"),
+                        ("By Tag", "tags")]
         
         for text, value in report_types:
             tk.Radiobutton(options_frame, text=text, variable=self.report_type, value=value,
                           font=self.normal_font, bg='#ecf0f1').pack(side=tk.LEFT, padx=10)
         
+        # Range for the daily calendar
+        self.calendar_range = ttk.Combobox(options_frame, values=[name for name, days in CALENDAR_RANGES],
+                                           font=self.normal_font, width=14, state='readonly')
+        self.calendar_range.pack(side=tk.LEFT, padx=10)
+        self.calendar_range.current(1)
+        
         tk.Button(options_frame, text="Generate Report", command=self.generate_report, bg='#3498db', fg='white',
                  font=self.normal_font, padx=20).pack(side=tk.LEFT, padx=20)
         
@@ -481,6 +1028,14 @@ class ExpenseTrackerApp:
             self.generate_monthly_report()
         elif report_type == "yearly":
             self.generate_yearly_report()
+        elif report_type == "pivot":
+            self.generate_pivot_report()
+        elif report_type == "calendar":
+            self.generate_calendar_report()
+        elif report_type == "trends":
+            self.generate_trend_report()
+        elif report_type == "tags":
+            self.generate_tag_report()
         else:
             self.generate_category_report()
     
@@ -489,15 +1044,15 @@ class ExpenseTrackerApp:
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
         fig.patch.set_facecolor('white')
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get monthly data
-        cursor.execute('''SELECT strftime('%Y-%m', date) as month, SUM(amount) as total
-                         FROM Expenses
-                         WHERE user_id = ?
-                         GROUP BY month
-                         ORDER BY month DESC
+        cursor.execute(f'''SELECT t.month, SUM(t.total * {month_rate_sql('t')}) as total
+                         FROM MonthlyTotals t
+                         WHERE t.user_id = ?
+                         GROUP BY t.month
+                         ORDER BY t.month DESC
                          LIMIT 12''', (self.current_user['id'],))
         
         monthly_data = cursor.fetchall()
@@ -547,13 +1102,13 @@ class ExpenseTrackerApp:
         fig, ax = plt.subplots(figsize=(10, 6))
         fig.patch.set_facecolor('white')
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get yearly data
-        cursor.execute('''SELECT strftime('%Y', date) as year, SUM(amount) as total
-                         FROM Expenses
-                         WHERE user_id = ?
+        cursor.execute(f'''SELECT substr(t.month, 1, 4) as year, SUM(t.total * {month_rate_sql('t')}) as total
+                         FROM MonthlyTotals t
+                         WHERE t.user_id = ?
                          GROUP BY year
                          ORDER BY year''', (self.current_user['id'],))
         
@@ -583,14 +1138,14 @@ class ExpenseTrackerApp:
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
         fig.patch.set_facecolor('white')
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get category data
-        cursor.execute('''SELECT c.category_name, SUM(e.amount) as total
-                         FROM Expenses e
-                         JOIN Categories c ON e.category_id = c.category_id
-                         WHERE e.user_id = ?
+        cursor.execute(f'''SELECT c.category_name, SUM(t.total * {month_rate_sql('t')}) as total
+                         FROM MonthlyTotals t
+                         JOIN Categories c ON t.category_id = c.category_id
+                         WHERE t.user_id = ?
                          GROUP BY c.category_id
                          ORDER BY total DESC''', (self.current_user['id'],))
         
@@ -620,108 +1175,705 @@ class ExpenseTrackerApp:
         canvas.draw()
         canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
     
-    def show_budget(self):
+    def generate_tag_report(self):
+        # Totals come from the tag bitmaps, off the Tk thread
+        self.write_queue.flush()
+        self.when_done(self.tag_index.totals_async(self.current_user['id']), self.render_tag_report)
+    
+    def render_tag_report(self, totals):
+        if not self.report_frame.winfo_exists():
+            return
+        for widget in self.report_frame.winfo_children():
+            widget.destroy()
+        if not totals:
+            tk.Label(self.report_frame, text="No tagged expenses yet. Select expenses in View Expenses and use Add Tag.",
+                     font=self.normal_font, bg='white').pack(pady=40)
+            return
+        
+        fig, ax = plt.subplots(figsize=(12, 5))
+        fig.patch.set_facecolor('white')
+        
+        tags = list(totals)
+        amounts = [total for total, count in totals.values()]
+        ax.barh(tags, amounts, color='#16a085')
+        ax.invert_yaxis()
+        ax.set_xlabel('Amount (₹)')
+        ax.set_title('Expenses by Tag (an expense counts under each of its tags)')
+        for i, (total, count) in enumerate(totals.values()):
+            ax.text(total, i, f' ₹{total:.2f} ({count})', va='center')
+        
+        canvas = FigureCanvasTkAgg(fig, self.report_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    
+    def generate_pivot_report(self):
+        # The matrix is built off the Tk thread and cached until the next write
+        self.write_queue.flush()
+        self.when_done(self.pivot_engine.matrix_async(self.current_user['id']), self.render_pivot_report)
+    
+    def render_pivot_report(self, matrix):
+        if not self.report_frame.winfo_exists():
+            return
+        for widget in self.report_frame.winfo_children():
+            widget.destroy()
+        
+        matrix = matrix.last(PIVOT_MONTHS)
+        self.pivot_matrix = matrix
+        if not matrix.months:
+            tk.Label(self.report_frame, text="No expenses to report", font=self.normal_font, bg='white').pack(pady=20)
+            return
+        
+        # Heatmap: one image for the whole matrix
+        fig, ax = plt.subplots(figsize=(12, 4))
+        fig.patch.set_facecolor('white')
+        image = ax.imshow(matrix.totals, aspect='auto', cmap='YlOrRd')
+        ax.set_xticks(range(len(matrix.months)))
+        ax.set_xticklabels([m[-2:] + '/' + m[:4] for m in matrix.months], rotation=45)
+        ax.set_yticks(range(len(matrix.category_names)))
+        ax.set_yticklabels(matrix.category_names)
+        ax.set_title('Spending by Category and Month (click a cell for details)')
+        fig.colorbar(image, ax=ax, label='Amount (₹)')
+        fig.tight_layout()
+        
+        canvas = FigureCanvasTkAgg(fig, self.report_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        canvas.mpl_connect('button_press_event', lambda event: self.pivot_heatmap_click(event, ax))
+        
+        # Table, sorted by clicking a column heading
+        table_frame = tk.Frame(self.report_frame, bg='white')
+        table_frame.pack(fill=tk.X, pady=10)
+        
+        columns = ('Category',) + tuple(m[-2:] + '/' + m[:4] for m in matrix.months) + ('Total',)
+        self.pivot_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=6)
+        for i, col in enumerate(columns):
+            self.pivot_tree.heading(col, text=col, command=lambda i=i: self.sort_pivot_table(i))
+            self.pivot_tree.column(col, width=120 if i == 0 else 70, anchor='w' if i == 0 else 'e')
+        
+        scrollbar = ttk.Scrollbar(table_frame, orient=tk.HORIZONTAL, command=self.pivot_tree.xview)
+        self.pivot_tree.configure(xscrollcommand=scrollbar.set)
+        self.pivot_tree.pack(fill=tk.X)
+        scrollbar.pack(fill=tk.X)
+        self.pivot_tree.bind('<Double-1>', self.pivot_table_click)
+        
+        self.pivot_sort = (None, True)
+        self.fill_pivot_table()
+    
+    def fill_pivot_table(self):
+        for item in self.pivot_tree.get_children():
+            self.pivot_tree.delete(item)
+        
+        matrix = self.pivot_matrix
+        row_totals = matrix.totals.sum(axis=1)
+        for row in matrix.order(*self.pivot_sort):
+            values = [matrix.category_names[row]] + [f"{v:.2f}" for v in matrix.totals[row]] + [f"{row_totals[row]:.2f}"]
+            self.pivot_tree.insert('', 'end', iid=row, values=values)
+    
+    def sort_pivot_table(self, heading):
+        # Heading 0 is the category name and the last one the row total
+        months = len(self.pivot_matrix.months)
+        column = -1 if heading == 0 else None if heading == months + 1 else heading - 1
+        current, descending = self.pivot_sort
+        self.pivot_sort = (column, not descending if column == current else column != -1)
+        self.fill_pivot_table()
+    
+    def pivot_heatmap_click(self, event, ax):
+        if event.inaxes is not ax or event.xdata is None:
+            return
+        row, column = int(round(event.ydata)), int(round(event.xdata))
+        if 0 <= row < len(self.pivot_matrix.category_ids) and 0 <= column < len(self.pivot_matrix.months):
+            self.show_pivot_drilldown(row, column)
+    
+    def pivot_table_click(self, event):
+        row = self.pivot_tree.identify_row(event.y)
+        # Empty when the click is past the last column
+        column_id = self.pivot_tree.identify_column(event.x)
+        if not row or not column_id:
+            return
+        column = int(column_id[1:]) - 2
+        if 0 <= column < len(self.pivot_matrix.months):
+            self.show_pivot_drilldown(int(row), column)
+    
+    def show_pivot_drilldown(self, row, column):
+        category_id, month = self.pivot_matrix.cell(row, column)
+        expenses = self.pivot_engine.expenses(self.current_user['id'], category_id, month)
+        
+        drill_window = tk.Toplevel(self.root)
+        drill_window.title(f"{self.pivot_matrix.category_names[row]} - {month}")
+        drill_window.geometry("600x400")
+        
+        columns = ('Date', 'Amount', 'Description')
+        tree = ttk.Treeview(drill_window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120 if col != 'Description' else 320)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        for expense_id, expense_date, amount, currency, description in expenses:
+            tree.insert('', 'end', iid=expense_id, values=(expense_date, self.expense_amount_text(amount, currency), description))
+        
+        tk.Label(drill_window, text=f"Total: ₹{self.pivot_matrix.totals[row, column]:.2f} "
+                                    f"({self.pivot_matrix.counts[row, column]} expenses)",
+                 font=self.normal_font).pack(pady=5)
+    
+    def generate_calendar_report(self):
+        user_id = self.current_user['id']
+        end = date.today()
+        days = dict(CALENDAR_RANGES)[self.calendar_range.get()]
+        start = end - timedelta(days=days - 1) if days else (self.calendar_heatmap.first_day(user_id) or end)
+        
+        self.write_queue.flush()
+        self.when_done(self.calendar_heatmap.grid_async(user_id, start, end), self.render_calendar_report)
+    
+    def render_calendar_report(self, calendar_grid):
+        if not self.report_frame.winfo_exists():
+            return
+        for widget in self.report_frame.winfo_children():
+            widget.destroy()
+        
+        # The whole range is one preaggregated image, however long it is
+        fig, ax = plt.subplots(figsize=(12, 4))
+        fig.patch.set_facecolor('white')
+        cmap = plt.get_cmap('Greens').copy()
+        cmap.set_bad('white')
+        image = ax.imshow(calendar_grid.grid, aspect='auto', cmap=cmap, interpolation='nearest')
+        
+        rows, columns = calendar_grid.row_labels, calendar_grid.column_labels
+        step = max(1, len(columns) // 12)
+        ax.set_xticks(range(0, len(columns), step))
+        ax.set_xticklabels(columns[::step], rotation=45)
+        ax.set_yticks(range(len(rows)))
+        ax.set_yticklabels(rows)
+        ax.set_title(f"Spending per {calendar_grid.binning}, {calendar_grid.start} to {calendar_grid.end}")
+        fig.colorbar(image, ax=ax, label='Amount (₹)')
+        fig.tight_layout()
+        
+        canvas = FigureCanvasTkAgg(fig, self.report_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        days = (calendar_grid.end - calendar_grid.start).days + 1
+        stats_text = f"Total: ₹{calendar_grid.total:.2f} over {days} days\n"
+        stats_text += f"Average per day: ₹{calendar_grid.total / days:.2f}"
+        tk.Label(self.report_frame, text=stats_text, font=self.normal_font, bg='white', justify='left').pack(pady=10)
+    
+    def generate_trend_report(self):
+        self.write_queue.flush()
+        self.when_done(self.trend_analyzer.trends_async(self.current_user['id']), self.render_trend_report)
+    
+    def render_trend_report(self, rows):
+        if not self.report_frame.winfo_exists():
+            return
+        for widget in self.report_frame.winfo_children():
+            widget.destroy()
+        
+        if not rows:
+            tk.Label(self.report_frame, text="No expenses to report", font=self.normal_font, bg='white').pack(pady=20)
+            return
+        
+        # Overall monthly totals with their rolling averages
+        history = overall(rows)[-TREND_MONTHS:]
+        positions = range(len(history))
+        fig, ax = plt.subplots(figsize=(12, 4))
+        fig.patch.set_facecolor('white')
+        ax.bar(positions, [row.total for row in history], color='#bdc3c7', label='Monthly total')
+        for field, label, color in (('rolling_3', '3-month average', '#3498db'),
+                                    ('rolling_6', '6-month average', '#2ecc71'),
+                                    ('rolling_12', '12-month average', '#e74c3c')):
+            ax.plot(positions, [getattr(row, field) if getattr(row, field) is not None else float('nan') for row in history],
+                    color=color, linewidth=2, label=label)
+        step = max(1, len(history) // 12)
+        ax.set_xticks(positions[::step])
+        ax.set_xticklabels([row.month[-2:] + '/' + row.month[:4] for row in history][::step], rotation=45)
+        ax.set_ylabel('Amount (₹)')
+        ax.set_title('Spending Trend')
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+        fig.tight_layout()
+        
+        canvas = FigureCanvasTkAgg(fig, self.report_frame)
+        canvas.draw()
+        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        
+        # Latest month per category
+        columns = ('Category', 'Month', 'Total', '3M Avg', '6M Avg', '12M Avg', 'vs Last Month',
+                   'vs Last Year', 'Year to Date', 'All Time')
+        tree = ttk.Treeview(self.report_frame, columns=columns, show='headings', height=6)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=100, anchor='w' if col == 'Category' else 'e')
+        tree.pack(fill=tk.X, pady=10)
+        
+        def amount(value, signed=False):
+            if value is None:
+                return '-'
+            return f"{value:+.2f}" if signed else f"{value:.2f}"
+        
+        for row in latest(rows):
+            tree.insert('', 'end', values=(row.category_name, row.month, amount(row.total), amount(row.rolling_3),
+                                           amount(row.rolling_6), amount(row.rolling_12),
+                                           amount(row.month_change, True), amount(row.year_change, True),
+                                           amount(row.year_to_date), amount(row.cumulative)))
+    
+    def show_budget(self):
+        for widget in self.content_frame.winfo_children():
+            widget.destroy()
+        
+        # Title
+        title_label = tk.Label(self.content_frame, text="Budget Management", font=self.title_font, bg='#ecf0f1')
+        title_label.pack(pady=20)
+        
+        forms_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
+        forms_frame.pack(pady=10)
+        
+        # Set budget frame
+        set_frame = tk.LabelFrame(forms_frame, text="Set Monthly Budget", font=self.heading_font, bg='white', padx=30, pady=20)
+        set_frame.pack(side=tk.LEFT, padx=10, fill=tk.Y)
+        
+        tk.Label(set_frame, text="Month (YYYY-MM):", font=self.normal_font, bg='white').grid(row=0, column=0, sticky='e', pady=5)
+        self.budget_month = tk.Entry(set_frame, font=self.normal_font, width=15)
+        self.budget_month.insert(0, datetime.now().strftime('%Y-%m'))
+        self.budget_month.grid(row=0, column=1, pady=5, padx=10)
+        
+        tk.Label(set_frame, text="Budget Limit (₹):", font=self.normal_font, bg='white').grid(row=1, column=0, sticky='e', pady=5)
+        self.budget_amount = tk.Entry(set_frame, font=self.normal_font, width=15)
+        self.budget_amount.grid(row=1, column=1, pady=5, padx=10)
+        
+        tk.Button(set_frame, text="Set Budget", command=self.set_budget, bg='#4CAF50', fg='white',
+                 font=self.normal_font, padx=20).grid(row=2, column=0, columnspan=2, pady=15)
+        
+        # Category / period limit frame
+        limit_frame = tk.LabelFrame(forms_frame, text="Set Category Limit", font=self.heading_font, bg='white', padx=30, pady=20)
+        limit_frame.pack(side=tk.LEFT, padx=10, fill=tk.Y)
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT category_id, category_name FROM Categories')
+        categories = cursor.fetchall()
+        conn.close()
+        
+        self.limit_category_map = {cat[1]: cat[0] for cat in categories}
+        self.limit_category_map['All'] = None
+        
+        tk.Label(limit_frame, text="Category:", font=self.normal_font, bg='white').grid(row=0, column=0, sticky='e', pady=5)
+        self.limit_category = ttk.Combobox(limit_frame, font=self.normal_font, width=13, state='readonly',
+                                           values=['All'] + [cat[1] for cat in categories])
+        self.limit_category.current(0)
+        self.limit_category.grid(row=0, column=1, pady=5, padx=10)
+        
+        tk.Label(limit_frame, text="Period:", font=self.normal_font, bg='white').grid(row=1, column=0, sticky='e', pady=5)
+        self.limit_period = ttk.Combobox(limit_frame, font=self.normal_font, width=13, state='readonly', values=PERIODS)
+        self.limit_period.current(1)
+        self.limit_period.grid(row=1, column=1, pady=5, padx=10)
+        
+        tk.Label(limit_frame, text="Limit (₹):", font=self.normal_font, bg='white').grid(row=2, column=0, sticky='e', pady=5)
+        self.limit_amount = tk.Entry(limit_frame, font=self.normal_font, width=15)
+        self.limit_amount.grid(row=2, column=1, pady=5, padx=10)
+        
+        limit_buttons = tk.Frame(limit_frame, bg='white')
+        limit_buttons.grid(row=3, column=0, columnspan=2, pady=10)
+        
+        tk.Button(limit_buttons, text="Set Limit", command=self.set_category_budget, bg='#4CAF50', fg='white',
+                 font=self.normal_font, padx=10).pack(side=tk.LEFT, padx=5)
+        
+        tk.Button(limit_buttons, text="Remove Selected", command=self.remove_category_budget, bg='#e74c3c', fg='white',
+                 font=self.normal_font, padx=10).pack(side=tk.LEFT, padx=5)
+        
+        # Budget overview
+        overview_frame = tk.LabelFrame(self.content_frame, text="Budget Overview", font=self.heading_font, bg='white', padx=20, pady=20)
+        overview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        # Create treeview
+        columns = ('Month', 'Budget', 'Expenses', 'Remaining', 'Status')
+        self.budget_tree = ttk.Treeview(overview_frame, columns=columns, show='headings', height=5)
+        
+        for col in columns:
+            self.budget_tree.heading(col, text=col)
+            self.budget_tree.column(col, width=120)
+        
+        # Scrollbar
+        scrollbar = ttk.Scrollbar(overview_frame, orient=tk.VERTICAL, command=self.budget_tree.yview)
+        self.budget_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.budget_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Current-period category limits
+        limits_frame = tk.LabelFrame(self.content_frame, text="Category Limits (current period)", font=self.heading_font, bg='white', padx=20, pady=20)
+        limits_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        columns = ('Period', 'Category', 'Budget', 'Expenses', 'Remaining', 'Status')
+        self.limit_tree = ttk.Treeview(limits_frame, columns=columns, show='headings', height=5)
+        
+        for col in columns:
+            self.limit_tree.heading(col, text=col)
+            self.limit_tree.column(col, width=110)
+        
+        scrollbar = ttk.Scrollbar(limits_frame, orient=tk.VERTICAL, command=self.limit_tree.yview)
+        self.limit_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.limit_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Month-end and year-end projections
+        forecast_frame = tk.LabelFrame(self.content_frame, text="Spending Forecast", font=self.heading_font, bg='white', padx=20, pady=20)
+        forecast_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        
+        columns = ('Category', 'Month to Date', 'Month-End', 'Monthly Limit', 'Year-End', 'Outlook')
+        self.forecast_tree = ttk.Treeview(forecast_frame, columns=columns, show='headings', height=5)
+        
+        for col in columns:
+            self.forecast_tree.heading(col, text=col)
+            self.forecast_tree.column(col, width=110)
+        
+        scrollbar = ttk.Scrollbar(forecast_frame, orient=tk.VERTICAL, command=self.forecast_tree.yview)
+        self.forecast_tree.configure(yscrollcommand=scrollbar.set)
+        
+        self.forecast_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Load budgets and keep them current from change events
+        self.subscribe_view(self.budget_tree, 'Budgets', self.apply_budget_changes)
+        for table in ('CategoryBudgets', 'Budgets'):
+            self.subscribe_view(self.limit_tree, table, lambda event: self.load_category_budgets())
+            self.subscribe_view(self.forecast_tree, table, lambda event: self.load_budget_forecast())
+        self.load_budgets()
+        self.load_category_budgets()
+        self.load_budget_forecast()
+    
+    def load_budget_forecast(self):
+        self.write_queue.flush()
+        self.when_done(self.forecaster.forecast_async(self.current_user['id']), self.render_budget_forecast)
+    
+    def render_budget_forecast(self, forecast):
+        if not self.forecast_tree.winfo_exists():
+            return
+        
+        rows = []
+        for item in forecast.categories:
+            if not item.month_to_date and not item.year_end:
+                continue
+            if item.month_limit and item.month_end > item.month_limit:
+                outlook, tag = "Likely over", 'over'
+            elif item.year_limit and item.year_end > item.year_limit:
+                outlook, tag = "Over for year", 'over'
+            else:
+                outlook, tag = "On track", 'within'
+            
+            limit = f'₹{item.month_limit:.2f}' if item.month_limit else '-'
+            rows.append((item.category_id, (item.category_name, f'₹{item.month_to_date:.2f}', f'₹{item.month_end:.2f}',
+                                            limit, f'₹{item.year_end:.2f}', outlook), (tag,)))
+        
+        budget = f'₹{forecast.month_budget:.2f}' if forecast.month_budget else '-'
+        over = forecast.month_budget and forecast.month_end > forecast.month_budget
+        rows.append(('total', ('Total', f'₹{forecast.month_to_date:.2f}', f'₹{forecast.month_end:.2f}', budget,
+                               f'₹{forecast.year_end:.2f}', "Likely over" if over else "On track"),
+                     ('over' if over else 'within',)))
+        
+        self.drop_tree_rows(self.forecast_tree, self.forecast_tree.get_children())
+        self.upsert_tree_rows(self.forecast_tree, rows)
+        self.forecast_tree.tag_configure('within', foreground='green')
+        self.forecast_tree.tag_configure('over', foreground='red')
+    
+    def set_budget(self):
+        month = self.budget_month.get()
+        try:
+            amount = float(self.budget_amount.get())
+            
+            if amount <= 0:
+                messagebox.showerror("Error", "Budget amount must be positive")
+                return
+            
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('INSERT OR REPLACE INTO Budgets (user_id, month, limit_amount) VALUES (?, ?, ?)',
+                          (self.current_user['id'], month, amount))
+            conn.commit()
+            conn.close()
+            
+            self.change_bus.publish('Budgets', UPDATED, (month,))
+            messagebox.showinfo("Success", "Budget set successfully!")
+            self.budget_amount.delete(0, tk.END)
+            
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid amount")
+    
+    def fetch_budget_rows(self, months=None):
+        conn = self.connect()
+        cursor = conn.cursor()
+        
+        # Get budgets with expenses from the monthly rollup
+        month_filter = ''
+        params = [self.current_user['id']]
+        if months is not None:
+            month_filter = f"AND b.month IN ({', '.join('?' * len(months))})"
+            params += list(months)
+        
+        cursor.execute(f'''SELECT b.month, b.limit_amount,
+                         COALESCE(SUM(m.total * {month_rate_sql('m')}), 0) as expenses
+                         FROM Budgets b
+                         LEFT JOIN MonthlyTotals m ON b.user_id = m.user_id 
+                             AND m.month = b.month
+                         WHERE b.user_id = ? {month_filter}
+                         GROUP BY b.month
+                         ORDER BY b.month DESC''', params)
+        rows = cursor.fetchall()
+        conn.close()
+        
+        # The current month is read from the same running totals the alerts use
+        current_month = datetime.now().strftime('%Y-%m')
+        return [(month, budget, self.budget_engine.spent('monthly') if month == current_month else expenses)
+                for month, budget, expenses in rows]
+    
+    def load_budgets(self):
+        # Clear tree
+        for item in self.budget_tree.get_children():
+            self.budget_tree.delete(item)
+        
+        for row in self.fetch_budget_rows():
+            month = row[0]
+            values, tags = self.budget_row(*row)
+            self.budget_tree.insert('', 'end', iid=month, values=values, tags=tags)
+        
+        # Configure tags
+        self.budget_tree.tag_configure('within', foreground='green')
+        self.budget_tree.tag_configure('over', foreground='red')
+    
+    def budget_row(self, month, budget, expenses):
+        remaining = budget - expenses
+        status = "Within Budget" if remaining >= 0 else "Over Budget"
+        
+        # Color code the row
+        tag = 'within' if remaining >= 0 else 'over'
+        return (month, f'₹{budget:.2f}', f'₹{expenses:.2f}', f'₹{remaining:.2f}', status), (tag,)
+    
+    def apply_budget_changes(self, event):
+        rows = [(row[0],) + self.budget_row(*row) for row in self.fetch_budget_rows(event.keys)]
+        self.upsert_tree_rows(self.budget_tree, rows, sort_column='Month')
+    
+    def load_category_budgets(self):
+        for item in self.limit_tree.get_children():
+            self.limit_tree.delete(item)
+        
+        for status in self.budget_engine.statuses():
+            remaining = status.limit_amount - status.spent
+            used = status.spent / status.limit_amount
+            if used >= 1.0:
+                state, tag = "Over Budget", 'over'
+            elif used >= 0.8:
+                state, tag = f"{used * 100:.0f}% used", 'warning'
+            else:
+                state, tag = "Within Budget", 'within'
+            
+            self.limit_tree.insert('', 'end', iid=status.budget_id, tags=(tag,),
+                                   values=(f'{status.period} ({status.period_key})', status.category_name,
+                                           f'₹{status.limit_amount:.2f}', f'₹{status.spent:.2f}',
+                                           f'₹{remaining:.2f}', state))
+        
+        self.limit_tree.tag_configure('within', foreground='green')
+        self.limit_tree.tag_configure('warning', foreground='#e67e22')
+        self.limit_tree.tag_configure('over', foreground='red')
+    
+    def set_category_budget(self):
+        category_id = self.limit_category_map[self.limit_category.get()]
+        period = self.limit_period.get()
+        try:
+            amount = float(self.limit_amount.get())
+            
+            if amount <= 0:
+                messagebox.showerror("Error", "Budget amount must be positive")
+                return
+            
+            # One limit per user, category and period
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM CategoryBudgets WHERE user_id = ? AND category_id IS ? AND period = ?',
+                          (self.current_user['id'], category_id, period))
+            cursor.execute('INSERT INTO CategoryBudgets (user_id, category_id, period, limit_amount) VALUES (?, ?, ?, ?)',
+                          (self.current_user['id'], category_id, period, amount))
+            conn.commit()
+            conn.close()
+            
+            self.change_bus.publish('CategoryBudgets', UPDATED, (cursor.lastrowid,))
+            messagebox.showinfo("Success", "Limit set successfully!")
+            self.limit_amount.delete(0, tk.END)
+            
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid amount")
+    
+    def remove_category_budget(self):
+        selected = self.limit_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a limit to remove")
+            return
+        
+        budget_id = selected[0]
+        if budget_id.startswith('month-'):
+            messagebox.showerror("Error", "Monthly budgets are managed in the Budget Overview")
+            return
+        
+        if messagebox.askyesno("Confirm", "Are you sure you want to remove this limit?"):
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM CategoryBudgets WHERE budget_id = ? AND user_id = ?',
+                          (budget_id, self.current_user['id']))
+            conn.commit()
+            conn.close()
+            
+            self.change_bus.publish('CategoryBudgets', DELETED, (budget_id,))
+    
+    def show_recurring(self):
         for widget in self.content_frame.winfo_children():
             widget.destroy()
         
         # Title
-        title_label = tk.Label(self.content_frame, text="Budget Management", font=self.title_font, bg='#ecf0f1')
+        title_label = tk.Label(self.content_frame, text="Recurring Expenses", font=self.title_font, bg='#ecf0f1')
         title_label.pack(pady=20)
         
-        # Set budget frame
-        set_frame = tk.LabelFrame(self.content_frame, text="Set Monthly Budget", font=self.heading_font, bg='white', padx=30, pady=20)
-        set_frame.pack(pady=10)
-        
-        tk.Label(set_frame, text="Month (YYYY-MM):", font=self.normal_font, bg='white').grid(row=0, column=0, sticky='e', pady=5)
-        self.budget_month = tk.Entry(set_frame, font=self.normal_font, width=15)
-        self.budget_month.insert(0, datetime.now().strftime('%Y-%m'))
-        self.budget_month.grid(row=0, column=1, pady=5, padx=10)
+        # Add schedule frame
+        add_frame = tk.LabelFrame(self.content_frame, text="New Recurring Expense", font=self.heading_font, bg='white', padx=20, pady=20)
+        add_frame.pack(pady=10)
         
-        tk.Label(set_frame, text="Budget Limit (₹):", font=self.normal_font, bg='white').grid(row=1, column=0, sticky='e', pady=5)
-        self.budget_amount = tk.Entry(set_frame, font=self.normal_font, width=15)
-        self.budget_amount.grid(row=1, column=1, pady=5, padx=10)
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('SELECT category_id, category_name FROM Categories')
+        categories = cursor.fetchall()
+        conn.close()
         
-        tk.Button(set_frame, text="Set Budget", command=self.set_budget, bg='#4CAF50', fg='white',
-                 font=self.normal_font, padx=20).grid(row=2, column=0, columnspan=2, pady=15)
+        self.recurring_category_map = {cat[1]: cat[0] for cat in categories}
         
-        # Budget overview
-        overview_frame = tk.LabelFrame(self.content_frame, text="Budget Overview", font=self.heading_font, bg='white', padx=20, pady=20)
-        overview_frame.pack(fill=tk.BOTH, expand=True, pady=10)
+        tk.Label(add_frame, text="Category:", font=self.normal_font, bg='white').grid(row=0, column=0, padx=5, pady=5)
+        self.recurring_category = ttk.Combobox(add_frame, values=[cat[1] for cat in categories],
+                                               font=self.normal_font, width=12, state='readonly')
+        self.recurring_category.grid(row=0, column=1, padx=5, pady=5)
+        if categories:
+            self.recurring_category.current(0)
+        
+        tk.Label(add_frame, text="Amount:", font=self.normal_font, bg='white').grid(row=0, column=2, padx=5, pady=5)
+        amount_frame = tk.Frame(add_frame, bg='white')
+        amount_frame.grid(row=0, column=3, padx=5, pady=5)
+        self.recurring_amount = tk.Entry(amount_frame, font=self.normal_font, width=8)
+        self.recurring_amount.pack(side=tk.LEFT)
+        self.recurring_currency = ttk.Combobox(amount_frame, values=self.rates.currencies(), font=self.normal_font, width=5)
+        self.recurring_currency.pack(side=tk.LEFT, padx=(5, 0))
+        self.recurring_currency.set(REPORTING_CURRENCY)
+        
+        tk.Label(add_frame, text="Frequency:", font=self.normal_font, bg='white').grid(row=0, column=4, padx=5, pady=5)
+        self.recurring_frequency = ttk.Combobox(add_frame, values=FREQUENCIES, font=self.normal_font, width=10, state='readonly')
+        self.recurring_frequency.grid(row=0, column=5, padx=5, pady=5)
+        self.recurring_frequency.current(1)
+        
+        tk.Label(add_frame, text="Description:", font=self.normal_font, bg='white').grid(row=1, column=0, padx=5, pady=5)
+        self.recurring_description = tk.Entry(add_frame, font=self.normal_font, width=30)
+        self.recurring_description.grid(row=1, column=1, columnspan=3, padx=5, pady=5, sticky='w')
+        
+        tk.Label(add_frame, text="Start Date:", font=self.normal_font, bg='white').grid(row=1, column=4, padx=5, pady=5)
+        self.recurring_start = tk.Entry(add_frame, font=self.normal_font, width=12)
+        self.recurring_start.grid(row=1, column=5, padx=5, pady=5)
+        self.recurring_start.insert(0, date.today().strftime('%Y-%m-%d'))
+        
+        tk.Button(add_frame, text="Add Schedule", command=self.add_recurring, bg='#4CAF50', fg='white',
+                 font=self.normal_font, padx=15).grid(row=2, column=0, columnspan=6, pady=10)
+        
+        # Schedules list
+        list_frame = tk.LabelFrame(self.content_frame, text="Schedules", font=self.heading_font, bg='white', padx=20, pady=20)
+        list_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
-        # Create treeview
-        columns = ('Month', 'Budget', 'Expenses', 'Remaining', 'Status')
-        self.budget_tree = ttk.Treeview(overview_frame, columns=columns, show='headings', height=10)
+        columns = ('Description', 'Category', 'Amount', 'Frequency', 'Next Due')
+        self.recurring_tree = ttk.Treeview(list_frame, columns=columns, show='headings', height=8)
         
         for col in columns:
-            self.budget_tree.heading(col, text=col)
-            self.budget_tree.column(col, width=120)
+            self.recurring_tree.heading(col, text=col)
+            self.recurring_tree.column(col, width=150)
         
-        # Scrollbar
-        scrollbar = ttk.Scrollbar(overview_frame, orient=tk.VERTICAL, command=self.budget_tree.yview)
-        self.budget_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.recurring_tree.yview)
+        self.recurring_tree.configure(yscrollcommand=scrollbar.set)
         
-        self.budget_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.recurring_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Load budgets
-        self.load_budgets()
+        # Action buttons
+        action_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
+        action_frame.pack(fill=tk.X, pady=10)
+        
+        tk.Button(action_frame, text="Delete Selected", command=self.delete_recurring, bg='#e74c3c', fg='white',
+                 font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
+        
+        tk.Button(action_frame, text="Generate Due Now", command=self.generate_recurring_now, bg='#3498db', fg='white',
+                 font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
+        
+        self.subscribe_view(self.recurring_tree, 'RecurringExpenses', lambda event: self.load_recurring())
+        self.load_recurring()
     
-    def set_budget(self):
-        month = self.budget_month.get()
+    def load_recurring(self):
+        for item in self.recurring_tree.get_children():
+            self.recurring_tree.delete(item)
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''SELECT r.recurring_id, r.description, c.category_name, r.amount, r.currency, r.frequency,
+                                 CASE WHEN r.end_date IS NOT NULL AND r.next_date > r.end_date THEN 'Ended' ELSE r.next_date END
+                          FROM RecurringExpenses r
+                          JOIN Categories c ON r.category_id = c.category_id
+                          WHERE r.user_id = ?
+                          ORDER BY r.next_date''', (self.current_user['id'],))
+        
+        for recurring_id, description, category, amount, currency, frequency, next_due in cursor.fetchall():
+            self.recurring_tree.insert('', 'end', iid=recurring_id,
+                                       values=(description, category, self.expense_amount_text(amount, currency),
+                                               frequency, next_due))
+        
+        conn.close()
+    
+    def add_recurring(self):
         try:
-            amount = float(self.budget_amount.get())
-            
+            amount = float(self.recurring_amount.get())
             if amount <= 0:
-                messagebox.showerror("Error", "Budget amount must be positive")
+                messagebox.showerror("Error", "Amount must be positive")
                 return
             
-            conn = sqlite3.connect('expense_tracker.db')
-            cursor = conn.cursor()
-            cursor.execute('INSERT OR REPLACE INTO Budgets (user_id, month, limit_amount) VALUES (?, ?, ?)',
-                          (self.current_user['id'], month, amount))
-            conn.commit()
-            conn.close()
+            currency = self.read_currency(self.recurring_currency)
+            if currency is None:
+                return
             
-            messagebox.showinfo("Success", "Budget set successfully!")
-            self.budget_amount.delete(0, tk.END)
-            self.load_budgets()
+            category_id = self.recurring_category_map[self.recurring_category.get()]
+            conn = self.connect()
+            recurring_id = add_schedule(conn, self.current_user['id'], category_id, amount,
+                                        self.recurring_description.get().strip(),
+                                        self.recurring_frequency.get(), self.recurring_start.get(),
+                                        currency=currency)
+            conn.close()
             
-        except ValueError:
-            messagebox.showerror("Error", "Please enter a valid amount")
-    
-    def load_budgets(self):
-        # Clear tree
-        for item in self.budget_tree.get_children():
-            self.budget_tree.delete(item)
-        
-        conn = sqlite3.connect('expense_tracker.db')
-        cursor = conn.cursor()
+        except (ValueError, KeyError):
+            messagebox.showerror("Error", "Please enter a valid amount and start date (YYYY-MM-DD)")
+            return
         
-        # Get budgets with expenses
-        cursor.execute('''SELECT b.month, b.limit_amount,
-                         COALESCE(SUM(e.amount), 0) as expenses
-                         FROM Budgets b
-                         LEFT JOIN Expenses e ON b.user_id = e.user_id 
-                             AND strftime('%Y-%m', e.date) = b.month
-                         WHERE b.user_id = ?
-                         GROUP BY b.month
-                         ORDER BY b.month DESC''', (self.current_user['id'],))
+        self.change_bus.publish('RecurringExpenses', INSERTED, (recurring_id,))
+        self.generate_recurring()
+        self.recurring_amount.delete(0, tk.END)
+        self.recurring_description.delete(0, tk.END)
+    
+    def delete_recurring(self):
+        selected = self.recurring_tree.selection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a schedule to delete")
+            return
         
-        for row in cursor.fetchall():
-            month, budget, expenses = row
-            remaining = budget - expenses
-            status = "Within Budget" if remaining >= 0 else "Over Budget"
+        # Expenses already generated stay; only future occurrences stop
+        if messagebox.askyesno("Confirm", "Stop this recurring expense? Expenses already added are kept."):
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM RecurringExpenses WHERE recurring_id = ? AND user_id = ?',
+                          (selected[0], self.current_user['id']))
+            conn.commit()
+            conn.close()
             
-            # Color code the row
-            tag = 'within' if remaining >= 0 else 'over'
-            self.budget_tree.insert('', 'end', values=(month, f'₹{budget:.2f}', f'₹{expenses:.2f}', 
-                                                      f'₹{remaining:.2f}', status), tags=(tag,))
-        
-        # Configure tags
-        self.budget_tree.tag_configure('within', foreground='green')
-        self.budget_tree.tag_configure('over', foreground='red')
-        
-        conn.close()
+            self.change_bus.publish('RecurringExpenses', DELETED, (selected[0],))
+    
+    def generate_recurring_now(self):
+        inserted = self.generate_recurring()
+        self.load_recurring()
+        messagebox.showinfo("Recurring Expenses", f"{len(inserted)} expense(s) added")
     
     def show_profile(self):
         for widget in self.content_frame.winfo_children():
@@ -736,7 +1888,7 @@ class ExpenseTrackerApp:
         info_frame.pack(pady=20)
         
         # Get user info
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT name, email, registration_date FROM Users WHERE user_id = ?', 
                       (self.current_user['id'],))
@@ -776,7 +1928,7 @@ class ExpenseTrackerApp:
             messagebox.showerror("Error", "Name cannot be empty")
             return
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Update password if provided
@@ -802,6 +1954,7 @@ class ExpenseTrackerApp:
         conn.commit()
         conn.close()
         
+        self.change_bus.publish('Users', UPDATED, (self.current_user['id'],))
         self.current_user['name'] = new_name
         messagebox.showinfo("Success", "Profile updated successfully!")
         self.update_password.delete(0, tk.END)
@@ -873,12 +2026,13 @@ class ExpenseTrackerApp:
         hashed_password = self.hash_password(password)
         
         try:
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self.connect()
             cursor = conn.cursor()
             cursor.execute('INSERT INTO Users (name, email, password) VALUES (?, ?, ?)',
                           (name, email, hashed_password))
             conn.commit()
             conn.close()
+            self.change_bus.publish('Users', INSERTED, (cursor.lastrowid,))
             messagebox.showinfo("Success", "Registration successful! Please login.")
             self.show_login_screen()
         except sqlite3.IntegrityError:
@@ -918,6 +2072,7 @@ class ExpenseTrackerApp:
             ("Categories", self.show_categories),
             ("Reports", self.show_reports),
             ("Budget", self.show_budget),
+            ("Recurring", self.show_recurring),
             ("Profile", self.show_profile),
         ]
         
@@ -953,48 +2108,31 @@ class ExpenseTrackerApp:
         stats_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
         stats_frame.pack(fill=tk.BOTH, expand=True)
         
-        # Get statistics
-        conn = sqlite3.connect('expense_tracker.db')
-        cursor = conn.cursor()
-        
-        # Total expenses
-        cursor.execute('SELECT SUM(amount) FROM Expenses WHERE user_id = ?', (self.current_user['id'],))
-        total_expenses = cursor.fetchone()[0] or 0
-        
-        # This month expenses
-        current_month = datetime.now().strftime('%Y-%m')
-        cursor.execute('''SELECT SUM(amount) FROM Expenses 
-                         WHERE user_id = ? AND strftime('%Y-%m', date) = ?''',
-                      (self.current_user['id'], current_month))
-        month_expenses = cursor.fetchone()[0] or 0
-        
-        # Number of transactions
-        cursor.execute('SELECT COUNT(*) FROM Expenses WHERE user_id = ?', (self.current_user['id'],))
-        transaction_count = cursor.fetchone()[0]
-        
-        # Budget check
-        cursor.execute('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?',
-                      (self.current_user['id'], current_month))
-        budget_result = cursor.fetchone()
-        budget_limit = budget_result[0] if budget_result else 0
-        
-        conn.close()
-        
-        # Create stat cards
-        stats = [
-            ("Total Expenses", f"₹{total_expenses:.2f}", '#3498db'),
-            ("This Month", f"₹{month_expenses:.2f}", '#2ecc71'),
-            ("Transactions", str(transaction_count), '#e74c3c'),
-            ("Budget Status", f"₹{month_expenses:.2f} / ₹{budget_limit:.2f}" if budget_limit > 0 else "No budget set", '#f39c12')
+        # Create stat cards; values are filled in by refresh_dashboard
+        cards = [
+            ("Total Expenses", '#3498db'),
+            ("This Month", '#2ecc71'),
+            ("Transactions", '#e74c3c'),
+            ("Budget Status", '#f39c12')
         ]
         
-        for i, (label, value, color) in enumerate(stats):
+        self.dashboard_cards = {}
+        for i, (label, color) in enumerate(cards):
             card = tk.Frame(stats_frame, bg=color, width=250, height=150)
             card.grid(row=i//2, column=i%2, padx=20, pady=20)
             card.pack_propagate(False)
             
             tk.Label(card, text=label, font=self.normal_font, bg=color, fg='white').pack(pady=20)
-            tk.Label(card, text=value, font=self.heading_font, bg=color, fg='white').pack()
+            self.dashboard_cards[label] = tk.Label(card, text='', font=self.heading_font, bg=color, fg='white')
+            self.dashboard_cards[label].pack()
+        
+        # Spending forecast
+        self.forecast_label = tk.Label(self.content_frame, text='', font=self.normal_font, bg='#ecf0f1', justify='left')
+        self.forecast_label.pack(pady=5)
+        
+        # Unusual expenses
+        self.anomaly_label = tk.Label(self.content_frame, text='', font=self.normal_font, bg='#ecf0f1', fg='#c0392b', justify='left')
+        self.anomaly_label.pack(pady=5)
         
         # Recent expenses
         recent_frame = tk.LabelFrame(self.content_frame, text="Recent Expenses", font=self.heading_font, bg='white', padx=20, pady=20)
@@ -1002,32 +2140,121 @@ class ExpenseTrackerApp:
         
         # Create treeview
         columns = ('Date', 'Category', 'Amount', 'Description')
-        tree = ttk.Treeview(recent_frame, columns=columns, show='headings', height=8)
+        self.recent_tree = ttk.Treeview(recent_frame, columns=columns, show='headings', height=8)
         
         for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=150)
+            self.recent_tree.heading(col, text=col)
+            self.recent_tree.column(col, width=150)
         
         # Scrollbar
-        scrollbar = ttk.Scrollbar(recent_frame, orient=tk.VERTICAL, command=tree.yview)
-        tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar = ttk.Scrollbar(recent_frame, orient=tk.VERTICAL, command=self.recent_tree.yview)
+        self.recent_tree.configure(yscrollcommand=scrollbar.set)
         
-        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.recent_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.recent_tree.tag_configure('anomaly', background='#fdebd0')
         
-        # Load recent expenses
-        conn = sqlite3.connect('expense_tracker.db')
-        cursor = conn.cursor()
-        cursor.execute('''SELECT e.date, c.category_name, e.amount, e.description
-                         FROM Expenses e
-                         JOIN Categories c ON e.category_id = c.category_id
-                         WHERE e.user_id = ?
-                         ORDER BY e.date DESC LIMIT 10''', (self.current_user['id'],))
+        self.dashboard_recent = []
+        self.refresh_dashboard()
         
-        for row in cursor.fetchall():
-            tree.insert('', 'end', values=row)
+        # Keep the dashboard live: poll PRAGMA data_version and refresh only
+        # when this or another session has committed something
+        self.dashboard_watcher = DataVersionWatcher(self.db_path)
+        self.dashboard_poll = self.root.after(DASHBOARD_POLL_MS, self.poll_dashboard)
+        self.recent_tree.bind('<Destroy>', lambda e: self.stop_dashboard_watch(), add='+')
+    
+    def poll_dashboard(self):
+        if self.dashboard_watcher.changed():
+            self.refresh_dashboard()
+        self.dashboard_poll = self.root.after(DASHBOARD_POLL_MS, self.poll_dashboard)
+    
+    def stop_dashboard_watch(self):
+        self.root.after_cancel(self.dashboard_poll)
+        self.dashboard_watcher.close()
+    
+    def refresh_dashboard(self):
+        # Queued writes first, then compute the snapshot off the Tk thread
+        self.write_queue.flush()
+        future = self.dashboard_provider.snapshot_async(self.current_user['id'])
+        self.when_done(future, self.render_dashboard)
+        self.when_done(self.forecaster.forecast_async(self.current_user['id']), self.render_dashboard_forecast)
+        self.when_done(self.anomaly_detector.anomalies_async(self.current_user['id']), self.render_dashboard_anomalies)
+    
+    def render_dashboard_anomalies(self, anomalies):
+        if not self.anomaly_label.winfo_exists():
+            return
         
-        conn.close()
+        # Most recent first; the full list is highlighted in View Expenses
+        latest = sorted(anomalies.values(), key=lambda anomaly: anomaly.date, reverse=True)
+        text = ''
+        if latest:
+            text = f"{len(latest)} unusual expense(s). Latest: " + ", ".join(
+                f"₹{anomaly.amount:.2f} on {anomaly.date} (usually ~₹{anomaly.median:.2f})" for anomaly in latest[:3])
+        if self.anomaly_label.cget('text') != text:
+            self.anomaly_label.config(text=text)
+        self.mark_anomalies([anomaly.expense_id for anomaly in latest])
+    
+    def render_dashboard_forecast(self, forecast):
+        if not self.forecast_label.winfo_exists():
+            return
+        
+        text = f"Projected month-end: ₹{forecast.month_end:.2f}"
+        if forecast.month_budget:
+            difference = forecast.month_end - forecast.month_budget
+            if difference > 0:
+                text += f" (over budget by ₹{difference:.2f})"
+            else:
+                text += f" (₹{-difference:.2f} under budget)"
+        
+        # Categories heading past their own monthly limit
+        over = [item.category_name for item in forecast.categories
+                if item.month_limit and item.month_end > item.month_limit]
+        if over:
+            text += f"\nLikely to exceed limit: {', '.join(over)}"
+        text += f"\nProjected year-end: ₹{forecast.year_end:.2f}"
+        
+        if self.forecast_label.cget('text') != text:
+            self.forecast_label.config(text=text)
+    
+    def render_dashboard(self, snapshot):
+        # The user may have navigated away while the snapshot was loading
+        if not self.recent_tree.winfo_exists():
+            return
+        
+        stats = {
+            "Total Expenses": f"₹{snapshot.total_expenses:.2f}",
+            "This Month": f"₹{snapshot.month_expenses:.2f}",
+            "Transactions": str(snapshot.transaction_count),
+            "Budget Status": (f"₹{snapshot.month_expenses:.2f} / ₹{snapshot.budget_limit:.2f}"
+                              if snapshot.budget_limit > 0 else "No budget set")
+        }
+        recent = [(str(expense_id), (expense_date, category, self.expense_amount_text(amount, currency), description))
+                  for expense_id, expense_date, category, amount, description, currency in snapshot.recent]
+        
+        # Only touch the cards whose value actually changed
+        for label, value in stats.items():
+            if self.dashboard_cards[label].cget('text') != value:
+                self.dashboard_cards[label].config(text=value)
+        
+        if recent == self.dashboard_recent:
+            return
+        
+        # Patch the recent list row by row instead of rebuilding it
+        old_rows = dict(self.dashboard_recent)
+        new_ids = {iid for iid, values in recent}
+        self.drop_tree_rows(self.recent_tree, [iid for iid in old_rows if iid not in new_ids])
+        for index, (iid, values) in enumerate(recent):
+            if iid not in old_rows:
+                self.recent_tree.insert('', index, iid=iid, values=values)
+                continue
+            if old_rows[iid] != values:
+                self.recent_tree.item(iid, values=values)
+            if self.recent_tree.index(iid) != index:
+                self.recent_tree.move(iid, '', index)
+        
+        self.dashboard_recent = recent
+        flagged = self.anomaly_detector.flagged(self.current_user['id'])
+        self.mark_anomalies([int(iid) for iid, values in recent if int(iid) in flagged])
     
     def show_add_expense(self):
         for widget in self.content_frame.winfo_children():
@@ -1051,7 +2278,7 @@ class ExpenseTrackerApp:
         tk.Label(form_frame, text="Category:", font=self.normal_font, bg='white').grid(row=1, column=0, sticky='e', pady=10)
         
         # Get categories
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT category_id, category_name FROM Categories')
         categories = cursor.fetchall()
@@ -1066,18 +2293,37 @@ class ExpenseTrackerApp:
             category_menu.current(0)
         
         # Amount
-        tk.Label(form_frame, text="Amount (₹):", font=self.normal_font, bg='white').grid(row=2, column=0, sticky='e', pady=10)
+        tk.Label(form_frame, text="Amount:", font=self.normal_font, bg='white').grid(row=2, column=0, sticky='e', pady=10)
         self.expense_amount = tk.Entry(form_frame, font=self.normal_font, width=25)
         self.expense_amount.grid(row=2, column=1, pady=10, padx=10)
         
+        # Currency; any code can be typed, the list shows those with rates
+        tk.Label(form_frame, text="Currency:", font=self.normal_font, bg='white').grid(row=3, column=0, sticky='e', pady=10)
+        self.expense_currency = ttk.Combobox(form_frame, values=self.rates.currencies(), font=self.normal_font, width=23)
+        self.expense_currency.grid(row=3, column=1, pady=10, padx=10)
+        self.expense_currency.set(REPORTING_CURRENCY)
+        
         # Description
-        tk.Label(form_frame, text="Description:", font=self.normal_font, bg='white').grid(row=3, column=0, sticky='e', pady=10)
+        tk.Label(form_frame, text="Description:", font=self.normal_font, bg='white').grid(row=4, column=0, sticky='e', pady=10)
         self.expense_description = tk.Text(form_frame, font=self.normal_font, width=25, height=4)
-        self.expense_description.grid(row=3, column=1, pady=10, padx=10)
+        self.expense_description.grid(row=4, column=1, pady=10, padx=10)
+        self.expense_description.bind('<KeyRelease>', self.suggest_descriptions)
+        self.expense_description.bind('<Down>', self.focus_suggestions)
+        
+        # Past descriptions starting with what is typed; picking one also
+        # fills in its usual category and last amount
+        self.description_suggestions = []
+        self.suggestion_list = tk.Listbox(form_frame, font=self.normal_font, width=40, height=5, activestyle='dotbox')
+        self.suggestion_list.grid(row=5, column=1, padx=10, sticky='w')
+        self.suggestion_list.grid_remove()
+        self.suggestion_list.bind('<Return>', self.apply_suggestion)
+        self.suggestion_list.bind('<Double-Button-1>', self.apply_suggestion)
+        self.suggestion_list.bind('<Escape>', lambda e: self.hide_suggestions())
+        self.description_index.load_async(self.current_user['id'])
         
         # Buttons
         button_frame = tk.Frame(form_frame, bg='white')
-        button_frame.grid(row=4, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=6, column=0, columnspan=2, pady=20)
         
         tk.Button(button_frame, text="Add Expense", command=self.add_expense, bg='#4CAF50', fg='white',
                  font=self.normal_font, padx=20, pady=5).pack(side=tk.LEFT, padx=10)
@@ -1099,61 +2345,123 @@ class ExpenseTrackerApp:
             # Validate date format
             datetime.strptime(expense_date, '%Y-%m-%d')
             
-            category_id = self.category_map[category]
-            
-            conn = sqlite3.connect('expense_tracker.db')
-            cursor = conn.cursor()
-            cursor.execute('''INSERT INTO Expenses (user_id, category_id, date, amount, description)
-                            VALUES (?, ?, ?, ?, ?)''',
-                          (self.current_user['id'], category_id, expense_date, amount, description))
-            conn.commit()
-            conn.close()
+            currency = self.read_currency(self.expense_currency)
+            if currency is None:
+                return
             
-            messagebox.showinfo("Success", "Expense added successfully!")
-            self.clear_expense_form()
+            category_id = self.category_map[category]
             
-            # Check budget
-            self.check_budget_alert()
+            # Seed the running budget totals before this expense is queued,
+            # and keep them until it has been recorded
+            self.budget_engine.begin()
+            try:
+                future = self.write_queue.submit('''INSERT INTO Expenses (user_id, category_id, date, amount, description, currency)
+                                VALUES (?, ?, ?, ?, ?, ?)''',
+                              (self.current_user['id'], category_id, expense_date, amount, description, currency),
+                              event=('Expenses', INSERTED, None))
+            except Exception:
+                self.budget_engine.cancel()
+                raise
             
         except ValueError as e:
             messagebox.showerror("Error", "Please enter valid data")
+            return
         except Exception as e:
             messagebox.showerror("Error", str(e))
+            return
+        
+        # Confirmed once the write commits; on failure the form keeps the entry
+        def added(result):
+            messagebox.showinfo("Success", "Expense added successfully!")
+            self.clear_expense_form()
+            
+            # Check budget, in the reporting currency
+            self.check_budget_alert(category_id, expense_date, amount * self.rates.rate(currency, expense_date))
+        
+        def failed(error):
+            self.budget_engine.cancel()
+            messagebox.showerror("Error", str(error))
+        
+        self.when_done(future, added, on_error=failed)
     
     def clear_expense_form(self):
         self.expense_date.delete(0, tk.END)
         self.expense_date.insert(0, date.today().strftime('%Y-%m-%d'))
         self.expense_amount.delete(0, tk.END)
         self.expense_description.delete('1.0', tk.END)
+        self.expense_currency.set(REPORTING_CURRENCY)
+        self.hide_suggestions()
     
-    def check_budget_alert(self):
-        current_month = datetime.now().strftime('%Y-%m')
+    def suggest_descriptions(self, event=None):
+        if event is not None and event.keysym in ('Down', 'Up', 'Return', 'Escape', 'Tab'):
+            return
+        text = self.expense_description.get('1.0', tk.END).strip()
+        self.description_suggestions = self.description_index.suggest(self.current_user['id'], text)
+        if not self.description_suggestions:
+            self.hide_suggestions()
+            return
         
-        conn = sqlite3.connect('expense_tracker.db')
-        cursor = conn.cursor()
+        names = {category_id: name for name, category_id in self.category_map.items()}
+        self.suggestion_list.delete(0, tk.END)
+        for suggestion in self.description_suggestions:
+            category = names.get(suggestion.category_id, '')
+            amount = self.expense_amount_text(suggestion.amount, suggestion.currency)
+            self.suggestion_list.insert(tk.END, f"{suggestion.description}  ({category}, {amount})")
+        self.suggestion_list.config(height=len(self.description_suggestions))
+        self.suggestion_list.grid()
+    
+    def focus_suggestions(self, event=None):
+        if self.description_suggestions:
+            self.suggestion_list.focus_set()
+            self.suggestion_list.selection_clear(0, tk.END)
+            self.suggestion_list.selection_set(0)
+            self.suggestion_list.activate(0)
+            return 'break'
+    
+    def apply_suggestion(self, event=None):
+        selection = self.suggestion_list.curselection()
+        if not selection:
+            return
+        suggestion = self.description_suggestions[selection[0]]
+        self.expense_description.delete('1.0', tk.END)
+        self.expense_description.insert('1.0', suggestion.description)
         
-        # Get budget limit
-        cursor.execute('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?',
-                      (self.current_user['id'], current_month))
-        budget_result = cursor.fetchone()
+        # The category it is usually filed under, if it still exists
+        for name, category_id in self.category_map.items():
+            if category_id == suggestion.category_id:
+                self.category_var.set(name)
         
-        if budget_result:
-            budget_limit = budget_result[0]
-            
-            # Get total expenses for the month
-            cursor.execute('''SELECT SUM(amount) FROM Expenses 
-                            WHERE user_id = ? AND strftime('%Y-%m', date) = ?''',
-                          (self.current_user['id'], current_month))
-            total_expenses = cursor.fetchone()[0] or 0
-            
-            if total_expenses > budget_limit:
-                messagebox.showwarning("Budget Alert", 
-                                     f"You have exceeded your budget!\nBudget: ₹{budget_limit:.2f}\nExpenses: ₹{total_expenses:.2f}")
-            elif total_expenses > budget_limit * 0.8:
-                messagebox.showwarning("Budget Warning", 
-                                     f"You have used {(total_expenses/budget_limit*100):.1f}% of your budget")
+        # The last amount, unless one was typed already
+        if not self.expense_amount.get().strip():
+            self.expense_amount.insert(0, f"{suggestion.amount:.2f}")
+            self.expense_currency.set(suggestion.currency or REPORTING_CURRENCY)
         
-        conn.close()
+        self.hide_suggestions()
+        self.expense_amount.focus_set()
+    
+    def hide_suggestions(self):
+        self.description_suggestions = []
+        self.suggestion_list.delete(0, tk.END)
+        self.suggestion_list.grid_remove()
+    
+    def check_budget_alert(self, category_id, expense_date, amount):
+        # Only the budgets this expense falls into are evaluated, against
+        # running totals, and only thresholds it crosses are reported
+        alerts = self.budget_engine.record(category_id, expense_date, amount)
+        if not alerts:
+            return
+        
+        messages = []
+        for status, threshold in alerts:
+            name = f"{status.period} {status.category_name}" if status.category_id else f"{status.period}"
+            if threshold >= 1.0:
+                messages.append(f"You have exceeded your {name} budget!\n"
+                                f"Budget: ₹{status.limit_amount:.2f}\nExpenses: ₹{status.spent:.2f}")
+            else:
+                messages.append(f"You have used {(status.spent/status.limit_amount*100):.1f}% of your {name} budget")
+        
+        title = "Budget Alert" if any(threshold >= 1.0 for status, threshold in alerts) else "Budget Warning"
+        messagebox.showwarning(title, "\n\n".join(messages))
     
     def show_view_expenses(self):
         for widget in self.content_frame.winfo_children():
@@ -1182,7 +2490,7 @@ class ExpenseTrackerApp:
         self.filter_category.pack(side=tk.LEFT, padx=5)
         
         # Load categories
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('SELECT category_name FROM Categories')
         categories = ['All'] + [cat[0] for cat in cursor.fetchall()]
@@ -1190,6 +2498,11 @@ class ExpenseTrackerApp:
         self.filter_category.current(0)
         conn.close()
         
+        # Tag filter, e.g. "trip-goa AND NOT reimbursable"
+        tk.Label(filter_frame, text="Tags:", font=self.normal_font, bg='#ecf0f1').pack(side=tk.LEFT, padx=5)
+        self.filter_tags = tk.Entry(filter_frame, font=self.normal_font, width=20)
+        self.filter_tags.pack(side=tk.LEFT, padx=5)
+        
         # Search button
         tk.Button(filter_frame, text="Search", command=self.search_expenses, bg='#3498db', fg='white',
                  font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
@@ -1197,20 +2510,42 @@ class ExpenseTrackerApp:
         tk.Button(filter_frame, text="Reset", command=self.reset_filters, bg='#95a5a6', fg='white',
                  font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=5)
         
+        # Saved views: the date and category filters under a name, with
+        # their results kept current in the database
+        views_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
+        views_frame.pack(fill=tk.X)
+        
+        tk.Label(views_frame, text="Saved View:", font=self.normal_font, bg='#ecf0f1').pack(side=tk.LEFT, padx=5)
+        self.saved_view_box = ttk.Combobox(views_frame, font=self.normal_font, width=20, state='readonly')
+        self.saved_view_box.pack(side=tk.LEFT, padx=5)
+        self.saved_view_box.bind('<<ComboboxSelected>>', lambda e: self.open_saved_view())
+        
+        tk.Button(views_frame, text="Save View", command=self.save_current_view, bg='#27ae60', fg='white',
+                 font=self.normal_font, padx=10).pack(side=tk.LEFT, padx=5)
+        tk.Button(views_frame, text="Delete View", command=self.delete_saved_view, bg='#e74c3c', fg='white',
+                 font=self.normal_font, padx=10).pack(side=tk.LEFT, padx=5)
+        
+        self.saved_view_total = tk.Label(views_frame, text="", font=self.normal_font, bg='#ecf0f1')
+        self.saved_view_total.pack(side=tk.LEFT, padx=10)
+        self.saved_view = None
+        self.load_saved_views()
+        
         # Table frame
         table_frame = tk.Frame(self.content_frame, bg='white')
         table_frame.pack(fill=tk.BOTH, expand=True, pady=10)
         
         # Create treeview
         columns = ('ID', 'Date', 'Category', 'Amount', 'Description')
-        self.expense_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15)
+        self.expense_tree = ttk.Treeview(table_frame, columns=columns, show='headings', height=15, selectmode='extended')
         
-        # Define headings
+        # Define headings; clicking Date, Category or Amount sorts by it
         self.expense_tree.heading('ID', text='ID')
         self.expense_tree.heading('Date', text='Date')
         self.expense_tree.heading('Category', text='Category')
-        self.expense_tree.heading('Amount', text='Amount (₹)')
+        self.expense_tree.heading('Amount', text='Amount')
         self.expense_tree.heading('Description', text='Description')
+        for col in EXPENSE_SORTS:
+            self.expense_tree.heading(col, command=lambda col=col: self.sort_expenses(col))
         
         # Column widths
         self.expense_tree.column('ID', width=50)
@@ -1225,6 +2560,12 @@ class ExpenseTrackerApp:
         
         self.expense_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.expense_tree.tag_configure('anomaly', background='#fdebd0')
+        self.expense_tree.tag_configure('archived', foreground='#7f8c8d')
+        
+        # Paging
+        self.expense_page_buttons, self.expense_page_label = self.page_controls(self.previous_expense_page,
+                                                                                self.next_expense_page)
         
         # Action buttons
         action_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
@@ -1236,56 +2577,243 @@ class ExpenseTrackerApp:
         tk.Button(action_frame, text="Delete Selected", command=self.delete_expense, bg='#e74c3c', fg='white',
                  font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
         
-        # Load expenses
+        tk.Button(action_frame, text="Change Category", command=self.bulk_change_category, bg='#9b59b6', fg='white',
+                 font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
+        
+        tk.Button(action_frame, text="Shift Date", command=self.bulk_shift_date, bg='#3498db', fg='white',
+                 font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
+        
+        tk.Button(action_frame, text="Add Tag", command=self.bulk_add_tag, bg='#16a085', fg='white',
+                 font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
+        
+        # Load expenses and keep them current from change events
+        self.expense_sort = ('Date', True)
+        self.expense_pager = Pager()
+        self.subscribe_view(self.expense_tree, 'Expenses', self.apply_expense_changes)
         self.load_expenses()
     
-    def load_expenses(self, filter_query=""):
+    def load_expenses(self, expense_filter=("", []), date_range=(None, None)):
+        # A new filter starts again from the first page
+        self.expense_filter = expense_filter
+        self.expense_date_range = date_range
+        self.expense_pager.reset()
+        self.load_expense_page()
+    
+    def load_expense_page(self):
         # Clear tree
         for item in self.expense_tree.get_children():
             self.expense_tree.delete(item)
         
-        conn = sqlite3.connect('expense_tracker.db')
-        cursor = conn.cursor()
+        column, descending = self.expense_sort
+        source, columns, first_descending = EXPENSE_SORTS[column]
+        filter_sql, filter_params = self.expense_filter
+        params = [self.current_user['id']] + filter_params
+        page_filter = ''
+        if self.expense_pager.start is not None:
+            page_filter, page_params = after(columns, descending, self.expense_pager.start)
+            page_filter = 'AND ' + page_filter
+            params += page_params
+        
+        conn = self.connect()
+        
+        # One page in the chosen order, read through its index; archived
+        # years are read too when the From date reaches them
+        query = f'''SELECT e.expense_id, e.date, c.category_name, e.amount, e.description, e.currency, {{archived}}
+                   FROM {source}
+                   WHERE e.user_id = ? {filter_sql} {page_filter}
+                   {order_by(columns, descending)}
+                   LIMIT ?'''
+        
+        positions = {'e.expense_id': 0, 'e.date': 1, 'c.category_name': 2, 'e.amount': 3}
+        key = lambda row: tuple(row[positions[column]] for column in columns)
+        rows = fetch_expenses(conn, self.db_path, query, params + [EXPENSE_PAGE_SIZE + 1], *self.expense_date_range,
+                              key=key, limit=EXPENSE_PAGE_SIZE + 1, reverse=descending)
+        
+        # One row more than a page tells whether there is a next one
+        self.expense_page_end = key(rows[EXPENSE_PAGE_SIZE - 1]) if len(rows) > EXPENSE_PAGE_SIZE else None
+        rows = rows[:EXPENSE_PAGE_SIZE]
+        self.show_page(self.expense_page_buttons, self.expense_page_label, self.expense_pager, self.expense_page_end)
+        self.show_sort(self.expense_tree, EXPENSE_SORTS, self.expense_sort)
+        
+        for row in rows:
+            expense_id, date, category, amount, description, currency, archived = row
+            self.expense_tree.insert('', 'end', iid=expense_id,
+                values=(expense_id, date, category, self.expense_amount_text(amount, currency), description),
+                tags=('archived',) if archived else ())
+        
+        conn.close()
+        
+        # Highlight unusual expenses once the detector has scored the history
+        future = self.anomaly_detector.anomalies_async(self.current_user['id'])
+        self.when_done(future, lambda anomalies: self.mark_anomalies(list(anomalies)))
+    
+    def apply_expense_changes(self, event):
+        # The triggers have already moved the open view's running total
+        if self.saved_view is not None:
+            self.load_saved_views()
+        
+        if event.action == DELETED:
+            self.drop_tree_rows(self.expense_tree, event.keys)
+            return
+        
+        # A changed row may move to another page of the other orders, so
+        # those re-read their page
+        if self.expense_sort != ('Date', True) or self.expense_pager.number > 1:
+            self.load_expense_page()
+            return
         
-        # Build query
-        query = '''SELECT e.expense_id, e.date, c.category_name, e.amount, e.description
+        # Re-read only the changed rows, through the active filter
+        conn = self.connect()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(event.keys))
+        filter_sql, filter_params = self.expense_filter
+        query = f'''SELECT e.expense_id, e.date, c.category_name, e.amount, e.description, e.currency
                    FROM Expenses e
                    JOIN Categories c ON e.category_id = c.category_id
-                   WHERE e.user_id = ? {filters}
+                   WHERE e.user_id = ? AND e.expense_id IN ({placeholders}) {filter_sql}
                    ORDER BY e.date DESC'''
-        query = query.format(filters=filter_query)
-        
-        cursor.execute(query, (self.current_user['id'],))
-        rows = cursor.fetchall()
+        cursor.execute(query, [self.current_user['id']] + list(event.keys) + filter_params)
+        flagged = self.anomaly_detector.flagged(self.current_user['id'])
+        rows = [(expense_id, (expense_id, date, category, self.expense_amount_text(amount, currency), description),
+                 ('anomaly',) if expense_id in flagged else ())
+                for expense_id, date, category, amount, description, currency in cursor.fetchall()]
+        conn.close()
         
-        for row in rows:
-            expense_id, date, category, amount, description = row
-            self.expense_tree.insert('', 'end',
-                values=(expense_id, date, category, f"{amount:.2f}", description))
+        # A row now past the end of a full page belongs to a later one
+        if self.expense_page_end is not None and any((row[1][1], row[0]) < self.expense_page_end for row in rows):
+            self.load_expense_page()
+            return
         
-        conn.close()
+        # Rows that no longer match the filter drop out of the view
+        matched = {str(row[0]) for row in rows}
+        self.drop_tree_rows(self.expense_tree, [key for key in event.keys if str(key) not in matched])
+        self.upsert_tree_rows(self.expense_tree, rows, sort_column='Date')
+        
+        # New rows push the oldest ones on to the next page, which then
+        # starts after the last row still shown
+        children = self.expense_tree.get_children()
+        if len(children) > EXPENSE_PAGE_SIZE:
+            self.expense_tree.delete(*children[EXPENSE_PAGE_SIZE:])
+            last = children[EXPENSE_PAGE_SIZE - 1]
+            self.expense_page_end = (self.expense_tree.item(last, 'values')[1], int(last))
+            self.show_page(self.expense_page_buttons, self.expense_page_label, self.expense_pager, self.expense_page_end)
+    
+    def sort_expenses(self, column):
+        # A new column starts in its natural order; clicking it again reverses it
+        current, descending = self.expense_sort
+        self.expense_sort = (column, not descending if column == current else EXPENSE_SORTS[column][2])
+        self.expense_pager.reset()
+        self.load_expense_page()
+    
+    def next_expense_page(self):
+        if self.expense_page_end is not None:
+            self.expense_pager.next(self.expense_page_end)
+            self.load_expense_page()
+    
+    def previous_expense_page(self):
+        self.expense_pager.previous()
+        self.load_expense_page()
+    
+    def page_controls(self, previous, next):
+        # Previous / Next buttons and the page number, below a paged table
+        page_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
+        page_frame.pack(fill=tk.X)
+        
+        previous_button = tk.Button(page_frame, text="◀ Previous", command=previous, bg='#95a5a6', fg='white',
+                                    font=self.normal_font, padx=10)
+        previous_button.pack(side=tk.LEFT, padx=10)
+        label = tk.Label(page_frame, text='', font=self.normal_font, bg='#ecf0f1')
+        label.pack(side=tk.LEFT, padx=10)
+        next_button = tk.Button(page_frame, text="Next ▶", command=next, bg='#95a5a6', fg='white',
+                                font=self.normal_font, padx=10)
+        next_button.pack(side=tk.LEFT, padx=10)
+        return (previous_button, next_button), label
+    
+    def show_page(self, buttons, label, pager, page_end):
+        previous_button, next_button = buttons
+        previous_button.config(state=tk.NORMAL if pager.number > 1 else tk.DISABLED)
+        next_button.config(state=tk.NORMAL if page_end is not None else tk.DISABLED)
+        label.config(text=f"Page {pager.number}")
+    
+    def show_sort(self, tree, sorts, sort):
+        # Arrow on the sorted column's heading
+        column, descending = sort
+        for col in sorts:
+            tree.heading(col, text=col + ((" ▼" if descending else " ▲") if col == column else ""))
     
     def load_users(self):
         # Clear tree
         for item in self.user_tree.get_children():
             self.user_tree.delete(item)
         
-        conn = sqlite3.connect('expense_tracker.db')
+        column, descending = self.user_sort
+        columns = USER_SORTS[column][0]
+        params = []
+        page_filter = ''
+        if self.user_pager.start is not None:
+            page_filter, params = after(columns, descending, self.user_pager.start)
+            page_filter = 'WHERE ' + page_filter
+        
+        conn = self.connect()
         cursor = conn.cursor()
+        cursor.execute(f'''SELECT user_id, name, email, is_admin, registration_date FROM Users
+                         {page_filter}
+                         {order_by(columns, descending)}
+                         LIMIT ?''', params + [USER_PAGE_SIZE + 1])
+        users = cursor.fetchall()
+        conn.close()
         
-        # Get users with expense statistics
-        cursor.execute('''SELECT u.user_id, u.name, u.email, u.is_admin, u.registration_date,
-                         COALESCE(SUM(e.amount), 0) as total_expenses
-                         FROM Users u
-                         LEFT JOIN Expenses e ON u.user_id = e.user_id
-                         GROUP BY u.user_id''')
+        positions = {'user_id': 0, 'name': 1, 'email': 2, 'registration_date': 4}
+        last = users[USER_PAGE_SIZE - 1] if len(users) > USER_PAGE_SIZE else None
+        self.user_page_end = tuple(last[positions[column]] for column in columns) if last else None
+        users = users[:USER_PAGE_SIZE]
+        self.show_page(self.user_page_buttons, self.user_page_label, self.user_pager, self.user_page_end)
+        self.show_sort(self.user_tree, USER_SORTS, self.user_sort)
         
-        for row in cursor.fetchall():
-            user_id, name, email, is_admin, reg_date, total_expenses = row
-            admin_status = "Yes" if is_admin else "No"
-            self.user_tree.insert('', 'end', values=(user_id, name, email, admin_status, reg_date, f"₹{total_expenses:.2f}"))
+        # Expense totals are summed from every shard's rollup in parallel
+        def fill(stats):
+            if self.user_tree.winfo_exists():
+                self.upsert_tree_rows(self.user_tree, [(row[0], self.user_row(*row, stats.user_totals.get(row[0], (0, 0))[0]), ())
+                                                       for row in users])
         
+        self.when_done(self.shard_map.admin_stats_async(), fill)
+    
+    def user_row(self, user_id, name, email, is_admin, reg_date, total_expenses):
+        admin_status = "Yes" if is_admin else "No"
+        return (user_id, name, email, admin_status, reg_date, f"₹{total_expenses:.2f}")
+    
+    def apply_user_changes(self, event):
+        if event.action == DELETED:
+            self.drop_tree_rows(self.user_tree, event.keys)
+            return
+        
+        conn = self.connect()
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(event.keys))
+        cursor.execute(f'''SELECT user_id, name, email, is_admin, registration_date FROM Users
+                         WHERE user_id IN ({placeholders})''', event.keys)
+        users = cursor.fetchall()
         conn.close()
+        
+        totals = self.shard_map.user_totals([row[0] for row in users])
+        rows = [(row[0], self.user_row(*row, totals[row[0]]), ()) for row in users]
+        
+        self.upsert_tree_rows(self.user_tree, rows)
+    
+    def sort_users(self, column):
+        current, descending = self.user_sort
+        self.user_sort = (column, not descending if column == current else USER_SORTS[column][1])
+        self.user_pager.reset()
+        self.load_users()
+    
+    def next_user_page(self):
+        if self.user_page_end is not None:
+            self.user_pager.next(self.user_page_end)
+            self.load_users()
+    
+    def previous_user_page(self):
+        self.user_pager.previous()
+        self.load_users()
     
     def toggle_admin_status(self):
         selected = self.user_tree.selection()
@@ -1306,14 +2834,14 @@ class ExpenseTrackerApp:
         action = "grant" if new_admin else "remove"
         
         if messagebox.askyesno("Confirm", f"Are you sure you want to {action} admin privileges for {user_name}?"):
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self.connect()
             cursor = conn.cursor()
             cursor.execute('UPDATE Users SET is_admin = ? WHERE user_id = ?', (int(new_admin), user_id))
             conn.commit()
             conn.close()
             
+            self.change_bus.publish('Users', UPDATED, (user_id,))
             messagebox.showinfo("Success", f"Admin status updated for {user_name}")
-            self.load_users()
     
     def show_manage_users(self):
         if not self.is_admin:
@@ -1338,6 +2866,8 @@ class ExpenseTrackerApp:
         for col in columns:
             self.user_tree.heading(col, text=col)
             self.user_tree.column(col, width=120)
+        for col in USER_SORTS:
+            self.user_tree.heading(col, command=lambda col=col: self.sort_users(col))
         
         # Scrollbar
         scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.user_tree.yview)
@@ -1346,6 +2876,9 @@ class ExpenseTrackerApp:
         self.user_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
+        # Paging
+        self.user_page_buttons, self.user_page_label = self.page_controls(self.previous_user_page, self.next_user_page)
+        
         # Action buttons
         action_frame = tk.Frame(self.content_frame, bg='#ecf0f1')
         action_frame.pack(fill=tk.X, pady=10)
@@ -1359,7 +2892,10 @@ class ExpenseTrackerApp:
         tk.Button(action_frame, text="Reset Password", command=self.reset_user_password, bg='#3498db', fg='white',
                  font=self.normal_font, padx=15).pack(side=tk.LEFT, padx=10)
         
-        # Load users
+        # Load users and keep them current from change events
+        self.user_sort = ('ID', False)
+        self.user_pager = Pager()
+        self.subscribe_view(self.user_tree, 'Users', self.apply_user_changes)
         self.load_users()
     
     def delete_user(self):
@@ -1376,20 +2912,18 @@ class ExpenseTrackerApp:
             return
         
         if messagebox.askyesno("Confirm", "Are you sure? This will delete all user data including expenses."):
-            conn = sqlite3.connect('expense_tracker.db')
-            cursor = conn.cursor()
-            
-            # Delete user's expenses first
-            cursor.execute('DELETE FROM Expenses WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM Reports WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM Budgets WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM Users WHERE user_id = ?', (user_id,))
-            
+            # The user's rows live in their own shard
+            self.write_queue.flush()
+            conn = self.shard_map.connect_for(user_id)
+            delete_user_rows(conn, user_id)
+            conn.execute('DELETE FROM Users WHERE user_id = ?', (user_id,))
             conn.commit()
             conn.close()
+            purge_archives(self.shard_map.path_for(user_id), user_id)
+            self.maintenance.request('analyze', 'vacuum')
             
+            self.change_bus.publish('Users', DELETED, (user_id,))
             messagebox.showinfo("Success", "User deleted successfully")
-            self.load_users()
     
     def reset_user_password(self):
         selected = self.user_tree.selection()
@@ -1410,7 +2944,7 @@ class ExpenseTrackerApp:
             
             hashed_password = self.hash_password(new_password)
             
-            conn = sqlite3.connect('expense_tracker.db')
+            conn = self.connect()
             cursor = conn.cursor()
             cursor.execute('UPDATE Users SET password = ? WHERE user_id = ?', (hashed_password, user_id))
             conn.commit()
@@ -1434,55 +2968,62 @@ class ExpenseTrackerApp:
         stats_frame = tk.LabelFrame(self.content_frame, text="System Statistics", font=self.heading_font, bg='white', padx=30, pady=20)
         stats_frame.pack(pady=20)
         
-        conn = sqlite3.connect('expense_tracker.db')
+        conn = self.connect()
         cursor = conn.cursor()
         
         # Get statistics
-        cursor.execute('SELECT COUNT(*) FROM Users')
-        total_users = cursor.fetchone()[0]
+        cursor.execute('SELECT user_id, name, is_admin FROM Users')
+        users = cursor.fetchall()
+        user_names = {user_id: name for user_id, name, is_admin in users}
+        admin_users = sum(1 for user_id, name, is_admin in users if is_admin == 1)
+        
+        cursor.execute('SELECT category_id, category_name FROM Categories')
+        category_names = dict(cursor.fetchall())
         
-        cursor.execute('SELECT COUNT(*) FROM Users WHERE is_admin = 1')
-        admin_users = cursor.fetchone()[0]
+        conn.close()
         
-        cursor.execute('SELECT COUNT(*) FROM Expenses')
-        total_expenses = cursor.fetchone()[0]
+        stats_label = tk.Label(stats_frame, text="Loading statistics...", font=self.normal_font, bg='white', justify='left')
+        stats_label.pack()
         
-        cursor.execute('SELECT SUM(amount) FROM Expenses')
-        total_amount = cursor.fetchone()[0] or 0
+        # Expense figures come from every shard's rollup, summed in parallel
+        def render(stats):
+            if not stats_label.winfo_exists():
+                return
+            top_user = max(stats.user_totals.items(), key=lambda item: item[1][1], default=None)
+            top_category = max(stats.category_counts.items(), key=lambda item: item[1], default=None)
+            
+            # Display statistics
+            stats_text = f"""
+        Total Users: {len(users)}
+        Admin Users: {admin_users}
+        Total Transactions: {stats.expense_count}
+        Total Amount: ₹{stats.total_amount:.2f}
+        Total Categories: {len(category_names)}
+        Most Active User: {user_names.get(top_user[0], 'N/A') if top_user else 'N/A'} ({top_user[1][1] if top_user else 0} transactions)
+        Most Used Category: {category_names.get(top_category[0], 'N/A') if top_category else 'N/A'} ({top_category[1] if top_category else 0} transactions)
+        """
+            stats_label.config(text=stats_text)
         
-        cursor.execute('SELECT COUNT(*) FROM Categories')
-        total_categories = cursor.fetchone()[0]
+        self.write_queue.flush()
+        self.when_done(self.shard_map.admin_stats_async(), render)
         
-        cursor.execute('''SELECT u.name, COUNT(e.expense_id) as count
-                         FROM Users u
-                         LEFT JOIN Expenses e ON u.user_id = e.user_id
-                         GROUP BY u.user_id
-                         ORDER BY count DESC
-                         LIMIT 1''')
-        top_user = cursor.fetchone()
+        # Maintenance: file sizes, free space and when each task last ran
+        maintenance_frame = tk.LabelFrame(self.content_frame, text="Database Maintenance", font=self.heading_font,
+                                          bg='white', padx=30, pady=20)
+        maintenance_frame.pack(pady=20)
         
-        cursor.execute('''SELECT c.category_name, COUNT(e.expense_id) as count
-                         FROM Categories c
-                         LEFT JOIN Expenses e ON c.category_id = e.category_id
-                         GROUP BY c.category_id
-                         ORDER BY count DESC
-                         LIMIT 1''')
-        top_category = cursor.fetchone()
+        maintenance_label = tk.Label(maintenance_frame, text="Loading...", font=self.normal_font, bg='white',
+                                     justify='left')
+        maintenance_label.pack()
         
-        conn.close()
+        def render_maintenance(file_stats):
+            if maintenance_label.winfo_exists():
+                maintenance_label.config(text=self.maintenance_summary(file_stats))
         
-        # Display statistics
-        stats_text = f"""
-        Total Users: {total_users}
-        Admin Users: {admin_users}
-        Total Transactions: {total_expenses}
-        Total Amount: ₹{total_amount:.2f}
-        Total Categories: {total_categories}
-        Most Active User: {top_user[0] if top_user else 'N/A'} ({top_user[1] if top_user else 0} transactions)
-        Most Used Category: {top_category[0] if top_category else 'N/A'} ({top_category[1] if top_category else 0} transactions)
-        """
+        self.when_done(self.maintenance.stats_async(), render_maintenance)
         
-        tk.Label(stats_frame, text=stats_text, font=self.normal_font, bg='white', justify='left').pack()
+        tk.Button(maintenance_frame, text="Run Maintenance Now", command=self.run_maintenance, bg='#34495e', fg='white',
+                 font=self.normal_font, padx=20, pady=10).pack(pady=5)
         
         # Database operations
         db_frame = tk.LabelFrame(self.content_frame, text="Database Operations", font=self.heading_font, bg='white', padx=30, pady=20)
@@ -1494,25 +3035,56 @@ class ExpenseTrackerApp:
         tk.Button(db_frame, text="Backup Database", command=self.backup_database, bg='#3498db', fg='white',
                  font=self.normal_font, padx=20, pady=10).pack(pady=5)
         
+        tk.Button(db_frame, text="Archive Old Expenses", command=self.archive_old_expenses, bg='#7f8c8d', fg='white',
+                 font=self.normal_font, padx=20, pady=10).pack(pady=5)
+        
+        tk.Button(db_frame, text="Sync With Another Copy", command=self.sync_with_copy, bg='#16a085', fg='white',
+                 font=self.normal_font, padx=20, pady=10).pack(pady=5)
+        
+        tk.Button(db_frame, text="Load Exchange Rates (CSV)", command=self.load_fx_rates, bg='#9b59b6', fg='white',
+                 font=self.normal_font, padx=20, pady=10).pack(pady=5)
+        
         tk.Button(db_frame, text="Clear All Expenses", command=self.clear_all_expenses, bg='#e74c3c', fg='white',
                  font=self.normal_font, padx=20, pady=10).pack(pady=5)
     
+    def maintenance_summary(self, file_stats):
+        def ago(finished):
+            minutes = int((time.time() - finished) // 60)
+            if minutes < 60:
+                return f"{minutes} min ago"
+            if minutes < 48 * 60:
+                return f"{minutes // 60} h ago"
+            return f"{minutes // (24 * 60)} days ago"
+        
+        lines = []
+        for stats in file_stats:
+            size_mb = stats.size / (1024 * 1024)
+            wal_mb = stats.wal_size / (1024 * 1024)
+            free = stats.freelist_count / stats.page_count * 100 if stats.page_count else 0
+            lines.append(f"{os.path.basename(stats.path)}: {size_mb:.1f} MB + {wal_mb:.1f} MB WAL, "
+                         f"{free:.0f}% free pages, auto-vacuum {stats.auto_vacuum}")
+            runs = []
+            for task in MAINTENANCE_INTERVALS:
+                last = stats.last_runs.get(task)
+                runs.append(f"{task} {ago(last[0])} ({last[2]})" if last else f"{task} never")
+            lines.append("    " + ", ".join(runs))
+        return "\n".join(lines)
+    
+    def run_maintenance(self):
+        # Every task now, still in the background and still stopped by input
+        self.maintenance.request(*MAINTENANCE_INTERVALS)
+        self.when_done(self.maintenance.run_async(),
+                       lambda done: (messagebox.showinfo("Success", f"{len(done)} maintenance task(s) run"),
+                                     self.show_admin_panel()))
+    
     def export_data(self):
         try:
-            conn = sqlite3.connect('expense_tracker.db')
-            
-            # Export expenses
-            expenses_df = pd.read_sql_query('''
-                SELECT e.expense_id, u.name as user, c.category_name as category, 
-                       e.date, e.amount, e.description
-                FROM Expenses e
-                JOIN Users u ON e.user_id = u.user_id
-                JOIN Categories c ON e.category_id = c.category_id
-            ''', conn)
-            
-            expenses_df.to_csv('expenses_export.csv', index=False)
+            # Export expenses, every shard in parallel
+            self.write_queue.flush()
+            self.shard_map.export_expenses('expenses_export.csv')
             
             # Export users
+            conn = self.connect()
             users_df = pd.read_sql_query('SELECT user_id, name, email, registration_date FROM Users', conn)
             users_df.to_csv('users_export.csv', index=False)
             
@@ -1522,13 +3094,71 @@ class ExpenseTrackerApp:
         except Exception as e:
             messagebox.showerror("Error", str(e))
     
+    def archive_old_expenses(self):
+        years = simpledialog.askinteger("Archive Old Expenses", "Keep how many recent years in the live database?",
+                                        initialvalue=ARCHIVE_KEEP_YEARS, minvalue=1)
+        if not years:
+            return
+        
+        cutoff = archive_cutoff(years)
+        if not messagebox.askyesno("Confirm", f"Move all expenses dated before {cutoff} to the yearly archives?\n"
+                                              "Totals and reports are unchanged; archived expenses become read-only."):
+            return
+        
+        # Runs in the background, every shard in parallel
+        self.write_queue.flush()
+        self.when_done(self.shard_map.archive_async(cutoff),
+                       lambda moved: messagebox.showinfo("Success", f"{moved} expense(s) archived"))
+    
+    def sync_with_copy(self):
+        # Two-way exchange of the changes made on either side since the last sync
+        path = filedialog.askopenfilename(title="Other copy of the database",
+                                          filetypes=[("SQLite databases", "*.db"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        def synced(stats):
+            messagebox.showinfo("Success", f"{stats.received} change(s) received, {stats.sent} sent\n"
+                                           f"{stats.conflicts} conflict(s) resolved, {stats.skipped} skipped")
+            self.show_admin_panel()
+        
+        self.write_queue.flush()
+        self.when_done(self.database_sync.sync_async(path), synced,
+                       lambda error: messagebox.showerror("Error", str(error)))
+    
+    def load_fx_rates(self):
+        # date,currency,rate rows; rate is in reporting currency per unit
+        path = filedialog.askopenfilename(title="Exchange rates CSV", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        try:
+            conn = self.connect()
+            loaded = load_rates_csv(conn, path)
+            conn.close()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", str(e))
+            return
+        
+        self.rates.invalidate()
+        messagebox.showinfo("Success", f"{loaded} exchange rates loaded")
+    
     def backup_database(self):
         try:
-            import shutil
             from datetime import datetime
             
             backup_name = f'expense_tracker_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
-            shutil.copy2('expense_tracker.db', backup_name)
+            
+            # Copy through SQLite so pages still in the WAL are included;
+            # shards are copied alongside under the backup's name
+            self.write_queue.flush()
+            for source, target in [(DB_PATH, backup_name)] + [(path, shard_path(backup_name, shard))
+                                                              for shard, path in enumerate(self.shard_map.paths)]:
+                conn = connect(source)
+                backup_conn = sqlite3.connect(target)
+                conn.backup(backup_conn)
+                backup_conn.close()
+                conn.close()
             messagebox.showinfo("Success", f"Database backed up as {backup_name}")
             
         except Exception as e:
@@ -1537,18 +3167,49 @@ class ExpenseTrackerApp:
     def clear_all_expenses(self):
         if messagebox.askyesno("Confirm", "Are you sure? This will delete ALL expenses from the system!"):
             if messagebox.askyesno("Double Confirm", "This action cannot be undone. Continue?"):
-                conn = sqlite3.connect('expense_tracker.db')
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM Expenses')
-                cursor.execute('DELETE FROM Reports')
-                conn.commit()
+                # The logged-in user's rows are announced on the change bus so
+                # budgets, anomalies, autocomplete and open pages drop them;
+                # the other users' caches see PRAGMA data_version move
+                conn = self.connect()
+                expense_ids = [row[0] for row in conn.execute('SELECT expense_id FROM Expenses WHERE user_id = ?',
+                                                              (self.current_user['id'],))]
                 conn.close()
+                for db_path in self.shard_map.all_paths():
+                    conn = connect(db_path)
+                    cursor = conn.cursor()
+                    cursor.execute('DELETE FROM Expenses')
+                    cursor.execute('DELETE FROM Reports')
+                    cursor.execute('DELETE FROM ExpenseTags')
+                    # Saved views stay, emptied with the archives
+                    cursor.execute('DELETE FROM SavedViewRows')
+                    cursor.execute('DELETE FROM SavedViewTotals')
+                    conn.commit()
+                    conn.close()
+                    purge_archives(db_path)
+                self.tag_index.invalidate()
+                self.change_bus.publish('Expenses', DELETED, expense_ids)
+                self.maintenance.request('analyze', 'vacuum')
                 messagebox.showinfo("Success", "All expenses cleared")
     
     def logout(self):
+        # Don't leave the user's last entries sitting in the queue
+        self.write_queue.flush()
         self.current_user = None
         self.is_admin = False
         self.show_login_screen()
+        
+        # Every task while nobody is logged in; each still stops as soon as
+        # someone starts typing at the login screen
+        self.maintenance.request(*MAINTENANCE_INTERVALS)
+        self.maintenance.run_async()
+    
+    def on_close(self):
+        self.close_storage()
+        self.rates.close()
+        self.shard_map.close()
+        self.database_sync.close()
+        self.maintenance.close()
+        self.root.destroy()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,39 @@
+import threading
+from collections import defaultdict, deque, namedtuple
+
+INSERTED = 'inserted'
+UPDATED = 'updated'
+DELETED = 'deleted'
+
+# A row-level change: which table, what happened, and the primary keys touched
+ChangeEvent = namedtuple('ChangeEvent', ['table', 'action', 'keys'])
+
+
+class ChangeBus:
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._queue = deque()
+        self._lock = threading.Lock()
+
+    def subscribe(self, table, callback):
+        self._subscribers[table].append(callback)
+        return callback
+
+    def unsubscribe(self, table, callback):
+        if callback in self._subscribers[table]:
+            self._subscribers[table].remove(callback)
+
+    def publish(self, table, action, keys):
+        # Safe to call from the write queue thread; delivery happens in dispatch()
+        with self._lock:
+            self._queue.append(ChangeEvent(table, action, tuple(keys)))
+
+    def dispatch(self):
+        with self._lock:
+            events = list(self._queue)
+            self._queue.clear()
+
+        for event in events:
+            for callback in list(self._subscribers[event.table]):
+                callback(event)
+        return len(events)
@@ -0,0 +1,218 @@
+import calendar
+from datetime import date
+from typing import NamedTuple
+
+import numpy as np
+
+from cached_engine import CachedEngine
+from currency import day_rate_sql, month_rate_sql
+from database import DB_PATH
+from recurring import monthly_equivalent, pending_this_month
+
+# A (category, description, amount) seen in this many of the last
+# RECURRING_LOOKBACK complete months is treated as a recurring charge
+RECURRING_LOOKBACK = 3
+RECURRING_MIN_MONTHS = 3
+
+
+class CategoryForecast(NamedTuple):
+    category_id: int
+    category_name: str
+    month_to_date: float
+    month_end: float
+    year_to_date: float
+    year_end: float
+    month_limit: object
+    year_limit: object
+
+
+class Forecast(NamedTuple):
+    month: str
+    categories: tuple
+    month_to_date: float
+    month_end: float
+    year_to_date: float
+    year_end: float
+    month_budget: object
+
+
+def month_index(month):
+    # 'YYYY-MM' -> months since year 0, so months can be used as array offsets
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def month_start(index):
+    return f'{index // 12:04d}-{index % 12 + 1:02d}-01'
+
+
+def project(matrix, current, day_fraction, pending_recurring, recurring_monthly):
+    # matrix: (months, categories) spend history ending with the current month
+    # Returns month-end and rest-of-year projections per category.
+    history = matrix[:-1]
+    months = history.shape[0]
+    categories = matrix.shape[1]
+    month_to_date = matrix[-1]
+
+    # Discretionary spend only: recurring charges are added back explicitly
+    discretionary = np.clip(history - recurring_monthly, 0, None)
+
+    # Seasonal profile: mean spend for each calendar month across past years
+    calendar_month = (np.arange(current - months, current) % 12)
+    seasonal_sum = np.zeros((12, categories))
+    seasonal_count = np.zeros(12)
+    np.add.at(seasonal_sum, calendar_month, discretionary)
+    np.add.at(seasonal_count, calendar_month, 1)
+
+    trailing = discretionary[-12:].mean(axis=0) if months else np.zeros(categories)
+    seasonal = np.where(seasonal_count[:, None] > 0,
+                        seasonal_sum / np.maximum(seasonal_count, 1)[:, None],
+                        trailing)
+
+    # Blend the run-rate with the seasonal norm, trusting the run-rate more
+    # as the month goes on; recurring charges still to come are added as-is
+    posted_recurring = recurring_monthly - pending_recurring
+    month_to_date_discretionary = np.clip(month_to_date - posted_recurring, 0, None)
+    run_rate = month_to_date_discretionary / day_fraction
+    expected = day_fraction * run_rate + (1 - day_fraction) * seasonal[current % 12]
+    month_end = month_to_date + np.maximum(expected - month_to_date_discretionary, 0) + pending_recurring
+
+    # Rest of the year: seasonal discretionary spend plus recurring charges
+    remaining = np.arange(current + 1, (current // 12 + 1) * 12) % 12
+    rest_of_year = seasonal[remaining].sum(axis=0) + recurring_monthly * len(remaining)
+    return month_end, rest_of_year
+
+
+class Forecaster(CachedEngine):
+    # Month-end and year-end projections per category, computed with NumPy
+    # over the MonthlyTotals rollup and cached per user until the next write.
+    def __init__(self, db_path=DB_PATH):
+        super().__init__(db_path, 'forecast')
+
+    def forecast(self, user_id, today=None):
+        today = today or date.today()
+        with self._lock:
+            return self._cached(user_id, (today,), self._compute)
+
+    def forecast_async(self, user_id, today=None):
+        return self._executor.submit(self.forecast, user_id, today)
+
+    def _compute(self, user_id, today):
+        cursor = self._conn.cursor()
+        month = today.strftime('%Y-%m')
+        current = month_index(month)
+
+        cursor.execute('SELECT category_id, category_name FROM Categories ORDER BY category_id')
+        categories = cursor.fetchall()
+        column = {category_id: i for i, (category_id, name) in enumerate(categories)}
+
+        # Spend history as a (months, categories) matrix
+        cursor.execute(f'''SELECT t.month, t.category_id, t.total * {month_rate_sql('t')} FROM MonthlyTotals t
+                           WHERE t.user_id = ? AND t.month <= ?''', (user_id, month))
+        rows = cursor.fetchall()
+        schedules = self._schedules(cursor, user_id, today)
+
+        # A category deleted while rollups or schedules still use it keeps
+        # its own column, so no spending is lost from the totals
+        for category_id in sorted(({row[1] for row in rows} | {row[0] for row in schedules}) - set(column)):
+            column[category_id] = len(categories)
+            categories.append((category_id, f'Deleted category {category_id}'))
+
+        first = min((month_index(row[0]) for row in rows), default=current)
+        matrix = np.zeros((current - first + 1, len(categories)))
+        if rows:
+            months, category_ids, totals = zip(*rows)
+            np.add.at(matrix,
+                      (np.array([month_index(m) for m in months]) - first,
+                       np.array([column[c] for c in category_ids])),
+                      np.array(totals))
+
+        pending_recurring, recurring_monthly = self._recurring(cursor, user_id, current, column)
+        pending_scheduled, scheduled_monthly = self._scheduled(schedules, today, column)
+        pending_recurring += pending_scheduled
+        recurring_monthly += scheduled_monthly
+
+        days_in_month = calendar.monthrange(today.year, today.month)[1]
+        month_end, rest_of_year = project(matrix, current, today.day / days_in_month,
+                                          pending_recurring, recurring_monthly)
+
+        year_rows = matrix[max(0, matrix.shape[0] - today.month):]
+        year_to_date = year_rows.sum(axis=0)
+        year_end = year_to_date - matrix[-1] + month_end + rest_of_year
+
+        limits = self._limits(cursor, user_id, month)
+        results = tuple(
+            CategoryForecast(category_id, name, float(matrix[-1, i]), float(month_end[i]),
+                             float(year_to_date[i]), float(year_end[i]),
+                             limits.get((category_id, 'monthly')), limits.get((category_id, 'yearly')))
+            for i, (category_id, name) in enumerate(categories)
+        )
+
+        month_budget = limits.get((None, 'monthly'))
+        return Forecast(month, results, float(matrix[-1].sum()), float(month_end.sum()),
+                        float(year_to_date.sum()), float(year_end.sum()), month_budget)
+
+    def _recurring(self, cursor, user_id, current, column):
+        # Charges that repeat with the same description and amount every month;
+        # expenses generated from a schedule are covered by _scheduled instead
+        categories = len(column)
+        start = current - RECURRING_LOOKBACK
+        cursor.execute(f'''SELECT e.category_id, e.description, e.amount, e.currency, substr(e.date, 1, 7),
+                                  e.amount * {day_rate_sql('e')}
+                           FROM Expenses e
+                           WHERE e.user_id = ? AND e.date >= ? AND e.date < ? AND e.recurring_id IS NULL''',
+                       (user_id, month_start(start), month_start(current + 1)))
+        # Not a category first seen after the rollups were read
+        rows = [row for row in cursor.fetchall() if row[0] in column]
+        if not rows:
+            return np.zeros(categories), np.zeros(categories)
+
+        # Matched on the original amount; weighted by the converted one
+        category_ids, descriptions, original, currencies, months, amounts = zip(*rows)
+        keys = np.array([f'{c}\x1f{d}\x1f{a:.2f}{cur}'
+                         for c, d, a, cur in zip(category_ids, descriptions, original, currencies)])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        offsets = np.array([month_index(m) for m in months]) - start
+
+        seen = np.zeros((len(unique_keys), RECURRING_LOOKBACK + 1), dtype=bool)
+        seen[inverse, offsets] = True
+        recurring = seen[:, :RECURRING_LOOKBACK].sum(axis=1) >= RECURRING_MIN_MONTHS
+        pending = recurring & ~seen[:, RECURRING_LOOKBACK]
+
+        first_row = np.zeros(len(unique_keys), dtype=int)
+        first_row[inverse[::-1]] = np.arange(len(rows))[::-1]
+        key_column = np.array([column[c] for c in category_ids])[first_row]
+        key_amount = np.array(amounts)[first_row]
+
+        recurring_monthly = np.bincount(key_column, weights=key_amount * recurring, minlength=categories)
+        pending_recurring = np.bincount(key_column, weights=key_amount * pending, minlength=categories)
+        return pending_recurring, recurring_monthly
+
+    def _schedules(self, cursor, user_id, today):
+        cursor.execute(f'''SELECT r.category_id, r.amount * {day_rate_sql('r', 'next_date')}, r.frequency, r.day,
+                                  r.next_date, r.end_date
+                           FROM RecurringExpenses r
+                           WHERE r.user_id = ? AND (r.end_date IS NULL OR r.end_date >= ?)''',
+                       (user_id, today.isoformat()))
+        return cursor.fetchall()
+
+    def _scheduled(self, schedules, today, column):
+        # Explicit schedules: occurrences still due this month and their
+        # average monthly cost
+        categories = len(column)
+        pending = np.zeros(categories)
+        monthly = np.zeros(categories)
+        for category_id, amount, frequency, day, next_date, end_date in schedules:
+            pending[column[category_id]] += amount * pending_this_month(frequency, day, next_date, today, end_date)
+            monthly[column[category_id]] += monthly_equivalent(frequency, amount)
+        return pending, monthly
+
+    def _limits(self, cursor, user_id, month):
+        cursor.execute('''SELECT category_id, period, limit_amount FROM CategoryBudgets
+                          WHERE user_id = ? AND period IN ('monthly', 'yearly')''', (user_id,))
+        limits = {(category_id, period): limit for category_id, period, limit in cursor.fetchall()}
+
+        cursor.execute('SELECT limit_amount FROM Budgets WHERE user_id = ? AND month = ?', (user_id, month))
+        monthly_budget = cursor.fetchone()
+        if monthly_budget:
+            limits[(None, 'monthly')] = monthly_budget[0]
+        return limits
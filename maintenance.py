@@ -0,0 +1,228 @@
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from attachments import collect_garbage
+from database import DB_PATH, connect, shard_paths
+
+# Background upkeep of the database files (the catalog and any shards):
+# WAL checkpoints, PRAGMA optimize, ANALYZE, removing receipt files no
+# expense refers to any more and returning free pages to the file system.
+# The app runs it while the user is idle and at logout. Every step is
+# short, gives up at once when the app holds the lock, and stops between
+# steps when the user becomes active again; whatever was left is still due
+# next time. The steps that lock out writers for as long as they take, a
+# full VACUUM and truncating the WAL, only run from cli.py maintenance
+# --deep.
+
+# Task: seconds between runs. The checkpoint goes last, so that it also
+# moves the pages the other tasks wrote out of the WAL.
+MAINTENANCE_INTERVALS = {
+    'optimize': 60 * 60,
+    'analyze': 7 * 24 * 60 * 60,
+    'attachments': 24 * 60 * 60,
+    'vacuum': 24 * 60 * 60,
+    'checkpoint': 10 * 60,
+}
+
+# Free pages released per incremental vacuum step, each in its own short
+# write transaction
+VACUUM_STEP_PAGES = 256
+
+# Files created before incremental auto-vacuum are rebuilt once, by a deep
+# run, when at least this share of them is free pages
+VACUUM_REBUILD_FREE = 0.1
+
+# Rows ANALYZE samples per index; keeps it to milliseconds on large tables
+ANALYSIS_LIMIT = 1000
+
+# How long a step waits for a lock held by the app before giving up
+BUSY_TIMEOUT_MS = 100
+
+# Pause between steps, so queued writes get the lock in between
+STEP_PAUSE = 0.02
+
+AUTO_VACUUM_MODES = ('none', 'full', 'incremental')
+
+
+class FileStats(NamedTuple):
+    path: str
+    size: int
+    wal_size: int
+    page_size: int
+    page_count: int
+    freelist_count: int
+    auto_vacuum: str
+    last_runs: dict
+
+
+class Interrupted(Exception):
+    pass
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def last_runs(conn):
+    # {task: (finished at, duration in ms, note)}
+    return {task: (finished, duration, note) for task, finished, duration, note in
+            conn.execute('SELECT task, last_run, duration_ms, note FROM main.Maintenance')}
+
+
+def file_stats(path):
+    conn = connect(path)
+    try:
+        page_size = conn.execute('PRAGMA main.page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA main.page_count').fetchone()[0]
+        freelist_count = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+        auto_vacuum = AUTO_VACUUM_MODES[conn.execute('PRAGMA main.auto_vacuum').fetchone()[0]]
+        return FileStats(path, file_size(path), file_size(f'{path}-wal'), page_size, page_count, freelist_count,
+                         auto_vacuum, last_runs(conn))
+    finally:
+        conn.close()
+
+
+class DatabaseMaintenance:
+    # Runs the due tasks on every database file on one background thread.
+    # interrupt() stops a run between steps; request() makes tasks due now,
+    # e.g. after a bulk delete.
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._requested = set()
+        self._interrupt = threading.Event()
+        self._running = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='maintenance')
+
+    def paths(self):
+        return [self.db_path] + shard_paths(self.db_path)
+
+    def request(self, *tasks):
+        with self._lock:
+            self._requested.update(tasks)
+
+    def interrupt(self):
+        self._interrupt.set()
+
+    def run(self, deep=False):
+        # deep (cli.py maintenance --deep, with the app closed): every task
+        # regardless of its interval, a full checkpoint, and the one-time
+        # rebuild of bloated legacy files.
+        # Returns [(path, task, note)] for the tasks that ran.
+        self._interrupt.clear()
+        with self._lock:
+            requested = set(self._requested)
+        done = []
+        locked = set()
+        try:
+            for path in self.paths():
+                conn = connect(path)
+                conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+                try:
+                    runs = last_runs(conn)
+                    for task, interval in MAINTENANCE_INTERVALS.items():
+                        last = runs.get(task)
+                        if not (deep or task in requested or last is None or time.time() - last[0] >= interval):
+                            continue
+                        note = self.run_task(conn, task, deep)
+                        if note is None:
+                            locked.add(task)
+                        else:
+                            done.append((path, task, note))
+                finally:
+                    conn.close()
+        except Interrupted:
+            return done
+        with self._lock:
+            self._requested -= requested - locked
+        return done
+
+    def run_async(self):
+        # At most one run queued at a time; tasks requested meanwhile are
+        # left for the next one
+        with self._lock:
+            if self._running is None or self._running.done():
+                self._running = self._executor.submit(self.run)
+            return self._running
+
+    def run_task(self, conn, task, deep):
+        # The task's note, or None when it could not get the lock this time
+        started = time.perf_counter()
+        try:
+            note = getattr(self, task)(conn, deep)
+            conn.execute('''INSERT INTO main.Maintenance (task, last_run, duration_ms, note) VALUES (?, ?, ?, ?)
+                            ON CONFLICT (task) DO UPDATE SET last_run = excluded.last_run,
+                                                             duration_ms = excluded.duration_ms,
+                                                             note = excluded.note''',
+                         (task, time.time(), round((time.perf_counter() - started) * 1000), note))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            conn.rollback()
+            return None
+        self.pause()
+        return note
+
+    def pause(self):
+        if self._interrupt.wait(STEP_PAUSE):
+            raise Interrupted()
+
+    def checkpoint(self, conn, deep):
+        # PASSIVE copies what it can without waiting on readers; a deep run's
+        # TRUNCATE also shrinks the WAL file back to zero
+        busy, wal_pages, copied = conn.execute(f"PRAGMA main.wal_checkpoint({'TRUNCATE' if deep else 'PASSIVE'})").fetchone()
+        return f'{copied}/{wal_pages} WAL pages' + (' (readers active)' if busy else '')
+
+    def optimize(self, conn, deep):
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('PRAGMA main.optimize')
+        return 'ok'
+
+    def analyze(self, conn, deep):
+        # Fresh statistics for the query planner, e.g. after a user's rows
+        # were deleted
+        conn.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        conn.execute('ANALYZE main')
+        return 'ok'
+
+    def vacuum(self, conn, deep):
+        freed = 0
+        if conn.execute('PRAGMA main.auto_vacuum').fetchone()[0] != 2:
+            page_count = conn.execute('PRAGMA main.page_count').fetchone()[0]
+            free = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+            if not deep or free < page_count * VACUUM_REBUILD_FREE:
+                return f'{free} free pages'
+            # Rebuilds the file once; from then on free pages are released
+            # in small steps
+            conn.execute('PRAGMA main.auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM main')
+            return f'rebuilt, {free} pages freed'
+
+        while True:
+            free = conn.execute('PRAGMA main.freelist_count').fetchone()[0]
+            if not free:
+                return f'{freed} pages freed'
+            # The pragma returns a row per page freed, which execute() would
+            # stop at after the first; executescript runs it to the end
+            conn.executescript(f'PRAGMA main.incremental_vacuum({VACUUM_STEP_PAGES})')
+            freed += min(free, VACUUM_STEP_PAGES)
+            self.pause()
+
+    def attachments(self, conn, deep):
+        path = conn.execute('PRAGMA database_list').fetchone()[2]
+        return collect_garbage(conn, path)
+
+    def stats(self):
+        return [file_stats(path) for path in self.paths()]
+
+    def stats_async(self):
+        return self._executor.submit(self.stats)
+
+    def close(self):
+        self.interrupt()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,71 @@
+# Sorted, paged table views. A sort is a list of columns read in one
+# direction, the last of them unique; each page starts after the sort key
+# of the previous page's last row, so with an index in that order every
+# page is a seek plus a short range read however large the table and
+# however deep the page.
+
+
+# Sorts offered by the expense table: heading -> (FROM clause, sort key,
+# first click descending). Each key is read in the order of an index:
+# idx_expenses_user_date, idx_expenses_user_amount, and for categories the
+# Categories name index joined to idx_expenses_user_category, with
+# Categories forced to lead the join. Amounts sort as entered, whatever
+# their currency.
+EXPENSE_SORTS = {
+    'Date': ('{expenses} e JOIN Categories c ON e.category_id = c.category_id', ('e.date', 'e.expense_id'), True),
+    'Amount': ('{expenses} e JOIN Categories c ON e.category_id = c.category_id', ('e.amount', 'e.expense_id'), True),
+    'Category': ('Categories c CROSS JOIN {expenses} e ON e.category_id = c.category_id',
+                 ('c.category_name', 'e.date', 'e.expense_id'), False),
+}
+
+# Sorts offered by the user table: heading -> (sort key, first click
+# descending), on the primary key, idx_users_name, the email's unique index
+# and idx_users_registration
+USER_SORTS = {
+    'ID': (('user_id',), False),
+    'Name': (('name', 'user_id'), False),
+    'Email': (('email',), False),
+    'Registration Date': (('registration_date', 'user_id'), True),
+}
+
+
+def order_by(columns, descending):
+    direction = ' DESC' if descending else ''
+    return 'ORDER BY ' + ', '.join(f'{column}{direction}' for column in columns)
+
+
+def after(columns, descending, values):
+    # (sql, params) for the rows past values in this order. The leading
+    # column is also bounded on its own so SQLite can start the index range
+    # there; the nested terms then skip the ties already shown.
+    op = '<' if descending else '>'
+    sql = f'{columns[-1]} {op} ?'
+    params = [values[-1]]
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        sql = f'({column} {op} ? OR ({column} = ? AND {sql}))'
+        params = [value, value] + params
+    return f'{columns[0]} {op}= ? AND {sql}', [values[0]] + params
+
+
+class Pager:
+    # Start keys of the pages seen so far, for Previous and Next
+    def __init__(self):
+        self.starts = [None]
+
+    @property
+    def start(self):
+        return self.starts[-1]
+
+    @property
+    def number(self):
+        return len(self.starts)
+
+    def next(self, last_key):
+        self.starts.append(last_key)
+
+    def previous(self):
+        if len(self.starts) > 1:
+            self.starts.pop()
+
+    def reset(self):
+        self.starts = [None]
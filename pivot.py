@@ -0,0 +1,97 @@
+from typing import NamedTuple
+
+import numpy as np
+
+from archive import fetch_expenses
+from cached_engine import CachedEngine
+from currency import month_rate_sql
+from database import DB_PATH
+from forecast import month_index, month_start
+
+
+class PivotMatrix(NamedTuple):
+    months: tuple
+    category_ids: tuple
+    category_names: tuple
+    totals: np.ndarray
+    counts: np.ndarray
+
+    def last(self, months):
+        # The most recent months as a new matrix; a view, nothing is copied
+        start = max(0, len(self.months) - months)
+        return self._replace(months=self.months[start:], totals=self.totals[:, start:],
+                             counts=self.counts[:, start:])
+
+    def order(self, column=None, descending=True):
+        # Row order for the table: by one month's spend, by the row total
+        # (column None) or by name (column -1)
+        if column == -1:
+            keys = np.array(self.category_names, dtype=object)
+            return sorted(range(len(keys)), key=lambda i: keys[i].lower(), reverse=descending)
+        values = self.totals.sum(axis=1) if column is None else self.totals[:, column]
+        rows = np.argsort(values, kind='stable')
+        return [int(row) for row in (rows[::-1] if descending else rows)]
+
+    def cell(self, row, column):
+        return self.category_ids[row], self.months[column]
+
+
+def empty_matrix():
+    return PivotMatrix((), (), (), np.zeros((0, 0)), np.zeros((0, 0), dtype=int))
+
+
+class PivotEngine(CachedEngine):
+    # Category x month spending matrix built from the MonthlyTotals rollup
+    # in one query and one np.add.at pass, cached per user until the next
+    # write. Report views slice the cached matrix instead of re-aggregating.
+    def __init__(self, db_path=DB_PATH):
+        super().__init__(db_path, 'pivot')
+
+    def matrix(self, user_id):
+        with self._lock:
+            return self._cached(user_id, (), self._build)
+
+    def matrix_async(self, user_id):
+        return self._executor.submit(self.matrix, user_id)
+
+    def expenses(self, user_id, category_id, month):
+        # Drill-down for one cell: a range scan of idx_expenses_user_date, in
+        # the month's archive when it has been archived
+        start, end = f'{month}-01', month_start(month_index(month) + 1)
+        with self._lock:
+            return fetch_expenses(self._connection(), self.db_path,
+                                  '''SELECT expense_id, date, amount, currency, description FROM {expenses}
+                                     WHERE user_id = ? AND date >= ? AND date < ? AND category_id = ?
+                                     ORDER BY date DESC''',
+                                  (user_id, start, end, category_id), start, f'{month}-31',
+                                  key=lambda row: (row[1], row[0]))
+
+    def _build(self, user_id):
+        cursor = self._conn.cursor()
+        cursor.execute(f'''SELECT t.month, t.category_id, c.category_name, t.total * {month_rate_sql('t')}, t.count
+                           FROM MonthlyTotals t
+                           JOIN Categories c ON t.category_id = c.category_id
+                           WHERE t.user_id = ?''', (user_id,))
+        rows = cursor.fetchall()
+        if not rows:
+            return empty_matrix()
+
+        months, category_ids, names, totals, counts = zip(*rows)
+        month_numbers = np.array([month_index(m) for m in months])
+        first, last = month_numbers.min(), month_numbers.max()
+
+        columns = {}
+        for category_id, name in sorted(set(zip(category_ids, names)), key=lambda c: c[1].lower()):
+            columns[category_id] = (len(columns), name)
+        rows_index = np.array([columns[c][0] for c in category_ids])
+
+        # Every month in the range gets a column, including months with no spend
+        shape = (len(columns), last - first + 1)
+        total_matrix = np.zeros(shape)
+        count_matrix = np.zeros(shape, dtype=int)
+        np.add.at(total_matrix, (rows_index, month_numbers - first), np.array(totals))
+        np.add.at(count_matrix, (rows_index, month_numbers - first), np.array(counts))
+
+        month_labels = tuple(month_start(i)[:7] for i in range(first, last + 1))
+        return PivotMatrix(month_labels, tuple(columns), tuple(name for _, name in columns.values()),
+                           total_matrix, count_matrix)
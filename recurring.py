@@ -0,0 +1,126 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+from database import REPORTING_CURRENCY
+
+FREQUENCIES = ('weekly', 'monthly', 'yearly')
+
+
+def parse_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value
+
+
+def clamp_day(year, month, day):
+    return date(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+
+def next_occurrence(frequency, day, current):
+    # day is the weekday (0 = Monday) for weekly schedules, the day of the
+    # month for monthly ones and the day of the anchor month for yearly ones
+    if frequency == 'weekly':
+        return current + timedelta(days=7)
+    if frequency == 'monthly':
+        year, month = (current.year + 1, 1) if current.month == 12 else (current.year, current.month + 1)
+        return clamp_day(year, month, day)
+    return clamp_day(current.year + 1, current.month, day)
+
+
+def first_occurrence(frequency, day, start):
+    if frequency == 'weekly':
+        return start + timedelta(days=(day - start.weekday()) % 7)
+    if frequency == 'monthly':
+        candidate = clamp_day(start.year, start.month, day)
+        return candidate if candidate >= start else next_occurrence(frequency, day, candidate)
+    return start
+
+
+def due_dates(frequency, day, next_date, until, end_date=None):
+    # All occurrences from next_date up to and including until, plus the
+    # next_date to store afterwards
+    until = min(until, end_date) if end_date else until
+    dates = []
+    while next_date <= until:
+        dates.append(next_date)
+        next_date = next_occurrence(frequency, day, next_date)
+    return dates, next_date
+
+
+def add_schedule(conn, user_id, category_id, amount, description, frequency, start_date, day=None, end_date=None,
+                 currency=REPORTING_CURRENCY):
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency: {frequency}")
+
+    start = parse_date(start_date)
+    if day is None:
+        day = start.weekday() if frequency == 'weekly' else start.day
+
+    cursor = conn.cursor()
+    cursor.execute('''INSERT INTO RecurringExpenses
+                      (user_id, category_id, amount, description, frequency, day, start_date, end_date, next_date, currency)
+                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                   (user_id, category_id, amount, description, frequency, day, start.isoformat(),
+                    parse_date(end_date).isoformat() if end_date else None,
+                    first_occurrence(frequency, day, start).isoformat(), currency))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def generate_due(conn, user_id=None, today=None):
+    # Insert every occurrence that has come due since the last run, for all
+    # schedules at once, in one write transaction. The partial unique index
+    # on Expenses (recurring_id, date) makes reruns and concurrent runs
+    # harmless: an occurrence that already exists is simply skipped.
+    today = today or date.today()
+
+    conn.commit()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        query = '''SELECT recurring_id, user_id, category_id, amount, currency, description, frequency, day,
+                          end_date, next_date
+                   FROM RecurringExpenses
+                   WHERE next_date <= ?'''
+        params = [today.isoformat()]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        cursor.execute(query, params)
+        schedules = cursor.fetchall()
+
+        inserted = []
+        for recurring_id, owner, category_id, amount, currency, description, frequency, day, end_date, next_date in schedules:
+            dates, following = due_dates(frequency, day, parse_date(next_date), today,
+                                         parse_date(end_date) if end_date else None)
+            for occurrence in dates:
+                cursor.execute('''INSERT OR IGNORE INTO Expenses
+                                  (user_id, category_id, date, amount, currency, description, recurring_id)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                               (owner, category_id, occurrence.isoformat(), amount, currency, description, recurring_id))
+                if cursor.rowcount:
+                    inserted.append(cursor.lastrowid)
+            cursor.execute('UPDATE RecurringExpenses SET next_date = ? WHERE recurring_id = ?',
+                           (following.isoformat(), recurring_id))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return inserted
+
+
+def pending_this_month(frequency, day, next_date, today, end_date=None):
+    # Occurrences still to come between tomorrow and the end of this month
+    month_end = clamp_day(today.year, today.month, 31)
+    dates, _ = due_dates(frequency, day, parse_date(next_date), month_end,
+                         parse_date(end_date) if end_date else None)
+    return sum(1 for occurrence in dates if occurrence > today)
+
+
+def monthly_equivalent(frequency, amount):
+    if frequency == 'weekly':
+        return amount * 52 / 12
+    if frequency == 'yearly':
+        return amount / 12
+    return amount
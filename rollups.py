@@ -0,0 +1,143 @@
+# Rollup tables are kept in step with Expenses by triggers, so every writer
+# (the GUI, the write queue, other sessions) maintains them for free and
+# aggregate screens never have to rescan the raw rows. Totals are kept per
+# currency and converted when they are read, so newly loaded exchange rates
+# apply to existing rollups without a rebuild.
+
+ROLLUP_TABLES = ('MonthlyTotals', 'DailyTotals')
+ROLLUP_TRIGGERS = {
+    'MonthlyTotals': ('monthly_totals_insert', 'monthly_totals_delete', 'monthly_totals_update'),
+    'DailyTotals': ('daily_totals_insert', 'daily_totals_delete', 'daily_totals_update'),
+}
+
+
+def init_rollups(cursor):
+    # Rollups from before currencies were tracked are dropped and rebuilt
+    for table in ROLLUP_TABLES:
+        cursor.execute(f'PRAGMA table_info({table})')
+        columns = [row[1] for row in cursor.fetchall()]
+        if columns and 'currency' not in columns:
+            for trigger in ROLLUP_TRIGGERS[table]:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE {table}')
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    missing = [table for table in ROLLUP_TABLES if table not in {row[0] for row in cursor.fetchall()}]
+
+    # Per user, month, category and currency spending
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS MonthlyTotals (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category_id, currency)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS monthly_totals_insert AFTER INSERT ON Expenses
+        BEGIN
+            INSERT INTO MonthlyTotals (user_id, month, category_id, currency, total, count)
+            VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category_id, NEW.currency, NEW.amount, 1)
+            ON CONFLICT (user_id, month, category_id, currency)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS monthly_totals_delete AFTER DELETE ON Expenses
+        BEGIN
+            UPDATE MonthlyTotals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+              AND currency = OLD.currency;
+            DELETE FROM MonthlyTotals
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+              AND currency = OLD.currency AND count <= 0;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS monthly_totals_update
+        AFTER UPDATE OF user_id, category_id, date, amount, currency ON Expenses
+        BEGIN
+            UPDATE MonthlyTotals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+              AND currency = OLD.currency;
+            DELETE FROM MonthlyTotals
+            WHERE user_id = OLD.user_id AND month = substr(OLD.date, 1, 7) AND category_id = OLD.category_id
+              AND currency = OLD.currency AND count <= 0;
+            INSERT INTO MonthlyTotals (user_id, month, category_id, currency, total, count)
+            VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.category_id, NEW.currency, NEW.amount, 1)
+            ON CONFLICT (user_id, month, category_id, currency)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    # Per user, day and currency spending, for calendar views
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS DailyTotals (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day, currency)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS daily_totals_insert AFTER INSERT ON Expenses
+        BEGIN
+            INSERT INTO DailyTotals (user_id, day, currency, total, count)
+            VALUES (NEW.user_id, NEW.date, NEW.currency, NEW.amount, 1)
+            ON CONFLICT (user_id, day, currency)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS daily_totals_delete AFTER DELETE ON Expenses
+        BEGIN
+            UPDATE DailyTotals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.date AND currency = OLD.currency;
+            DELETE FROM DailyTotals
+            WHERE user_id = OLD.user_id AND day = OLD.date AND currency = OLD.currency AND count <= 0;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS daily_totals_update
+        AFTER UPDATE OF user_id, date, amount, currency ON Expenses
+        BEGIN
+            UPDATE DailyTotals SET total = total - OLD.amount, count = count - 1
+            WHERE user_id = OLD.user_id AND day = OLD.date AND currency = OLD.currency;
+            DELETE FROM DailyTotals
+            WHERE user_id = OLD.user_id AND day = OLD.date AND currency = OLD.currency AND count <= 0;
+            INSERT INTO DailyTotals (user_id, day, currency, total, count)
+            VALUES (NEW.user_id, NEW.date, NEW.currency, NEW.amount, 1)
+            ON CONFLICT (user_id, day, currency)
+            DO UPDATE SET total = total + excluded.total, count = count + 1;
+        END
+    ''')
+
+    # Databases created before a rollup existed are backfilled once
+    if missing:
+        rebuild_rollups(cursor, missing)
+
+
+def rebuild_rollups(cursor, tables=ROLLUP_TABLES):
+    if 'MonthlyTotals' in tables:
+        cursor.execute('DELETE FROM MonthlyTotals')
+        cursor.execute('''INSERT INTO MonthlyTotals (user_id, month, category_id, currency, total, count)
+                          SELECT user_id, substr(date, 1, 7), category_id, currency, SUM(amount), COUNT(*)
+                          FROM Expenses
+                          GROUP BY user_id, substr(date, 1, 7), category_id, currency''')
+    if 'DailyTotals' in tables:
+        cursor.execute('DELETE FROM DailyTotals')
+        cursor.execute('''INSERT INTO DailyTotals (user_id, day, currency, total, count)
+                          SELECT user_id, date, currency, SUM(amount), COUNT(*)
+                          FROM Expenses
+                          GROUP BY user_id, date, currency''')
@@ -0,0 +1,108 @@
+from typing import NamedTuple
+
+from archive import expense_sources
+from currency import month_rate_sql
+
+# Saved views: named date and category filters per user. Each view's result
+# is materialized when it is saved, into SavedViewRows (the ids of its
+# expenses) and SavedViewTotals (its spending per month and currency), and
+# from then on the triggers on Expenses (database.py) add and remove rows as
+# expenses are inserted, updated and deleted, so opening a view or showing
+# its total never rescans the expense table. Like the rollups, views keep
+# the expenses archiving moves out of the live table.
+
+# Narrows an expense listing (alias e) to one view's rows
+VIEW_FILTER = 'AND e.expense_id IN (SELECT expense_id FROM SavedViewRows WHERE view_id = ?)'
+
+
+class SavedView(NamedTuple):
+    view_id: int
+    name: str
+    date_from: str
+    date_to: str
+    category_id: int
+    count: int
+    total: float
+
+
+def list_views(conn, user_id):
+    # The user's views by name, with their running count and total in the
+    # reporting currency; a few reads of each view's monthly totals
+    rows = conn.execute(f'''SELECT v.view_id, v.name, v.date_from, v.date_to, v.category_id,
+                                   (SELECT COALESCE(SUM(t.count), 0) FROM SavedViewTotals t
+                                    WHERE t.view_id = v.view_id),
+                                   (SELECT COALESCE(SUM(t.total * {month_rate_sql('t')}), 0) FROM SavedViewTotals t
+                                    WHERE t.view_id = v.view_id)
+                            FROM SavedViews v WHERE v.user_id = ?''', (user_id,)).fetchall()
+    return sorted((SavedView(*row) for row in rows), key=lambda view: view.name.casefold())
+
+
+def save_view(conn, db_path, user_id, name, date_from=None, date_to=None, category_id=None):
+    # Create the view, replacing one of the same name, and fill it from the
+    # live table and the archived years its dates reach. Returns its id.
+    name = ' '.join(name.split())
+    if not name:
+        raise ValueError("A saved view needs a name")
+    date_from, date_to = date_from or None, date_to or None
+    where = ['user_id = ?']
+    params = [user_id]
+    if date_from:
+        where.append('date >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('date <= ?')
+        params.append(date_to)
+    if category_id is not None:
+        where.append('category_id = ?')
+        params.append(category_id)
+    where = ' AND '.join(where)
+
+    # The live rows are read in the same transaction that creates the view,
+    # so none is missed or counted twice by the triggers
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existing = conn.execute('SELECT view_id FROM SavedViews WHERE user_id = ? AND name = ?',
+                                (user_id, name)).fetchone()
+        if existing:
+            drop_view(conn, existing[0])
+        view_id = conn.execute('''INSERT INTO SavedViews (user_id, name, date_from, date_to, category_id)
+                                  VALUES (?, ?, ?, ?, ?)''',
+                               (user_id, name, date_from, date_to, category_id)).lastrowid
+        materialize(conn, view_id, 'main.Expenses', where, params)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    # Archives are read-only, so their rows can follow; each is attached
+    # outside a transaction
+    for source in expense_sources(conn, db_path, date_from or '0000-01-01', date_to):
+        if source != 'main.Expenses':
+            materialize(conn, view_id, source, where, params)
+            conn.commit()
+    return view_id
+
+
+def materialize(conn, view_id, source, where, params):
+    conn.execute(f'''INSERT INTO main.SavedViewRows (view_id, expense_id, user_id)
+                     SELECT ?, expense_id, user_id FROM {source} WHERE {where}''', [view_id] + params)
+    conn.execute(f'''INSERT INTO main.SavedViewTotals (view_id, month, currency, user_id, total, count)
+                     SELECT ?, substr(date, 1, 7), currency, user_id, SUM(amount), COUNT(*) FROM {source}
+                     WHERE {where}
+                     GROUP BY substr(date, 1, 7), currency
+                     ON CONFLICT (view_id, month, currency)
+                     DO UPDATE SET total = total + excluded.total, count = count + excluded.count''',
+                 [view_id] + params)
+
+
+def drop_view(conn, view_id):
+    conn.execute('DELETE FROM SavedViewRows WHERE view_id = ?', (view_id,))
+    conn.execute('DELETE FROM SavedViewTotals WHERE view_id = ?', (view_id,))
+    conn.execute('DELETE FROM SavedViews WHERE view_id = ?', (view_id,))
+
+
+def delete_view(conn, user_id, view_id):
+    # Only the user's own views
+    if conn.execute('SELECT 1 FROM SavedViews WHERE view_id = ? AND user_id = ?', (view_id, user_id)).fetchone():
+        drop_view(conn, view_id)
+        conn.commit()
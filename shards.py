@@ -0,0 +1,297 @@
+import csv
+import multiprocessing
+import os
+import shutil
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple
+
+from archive import all_expense_sources, archive_expenses, archive_path, archived_years, expense_table, init_archive
+from changelog import set_capture
+from currency import day_rate_sql, month_rate_sql
+from database import (DB_PATH, REPORTING_CURRENCY, connect, init_database, init_shard, shard_path, shard_paths,
+                      user_db_path)
+from rollups import ROLLUP_TABLES
+
+# Optional sharded storage: the catalog database keeps Users, Categories and
+# the exchange rates, and each user's rows live in shard user_id % count.
+# Every user's writes then contend only with the other users of the same
+# shard. Shard connections attach the catalog (database.connect), so all
+# per-user code runs unchanged against a shard path.
+USER_TABLES = ('Expenses', 'Reports', 'Budgets', 'CategoryBudgets', 'RecurringExpenses', 'Tags', 'ExpenseTags',
+               'SavedViews', 'SavedViewRows', 'SavedViewTotals')
+
+# Row ids are allocated from a separate range in each shard so that they
+# stay unique across the whole database
+SHARD_ID_SPACE = 1 << 40
+
+EXPORT_COLUMNS = ('expense_id', 'user', 'category', 'date', 'amount', 'currency',
+                  f'amount_{REPORTING_CURRENCY.lower()}', 'description')
+
+
+class AdminStats(NamedTuple):
+    user_totals: dict
+    category_counts: dict
+    expense_count: int
+    total_amount: float
+
+
+def shard_summary(db_path):
+    # Per-user (total, count) and per-category counts of one database, from
+    # its MonthlyTotals rollup. Runs in a worker process.
+    conn = connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute(f'''SELECT t.user_id, SUM(t.total * {month_rate_sql('t')}), SUM(t.count) FROM MonthlyTotals t
+                       GROUP BY t.user_id''')
+    users = {user_id: (total, count) for user_id, total, count in cursor.fetchall()}
+    cursor.execute('SELECT category_id, SUM(count) FROM MonthlyTotals GROUP BY category_id')
+    categories = dict(cursor.fetchall())
+    conn.close()
+    return users, categories
+
+
+def category_usage(db_path):
+    # {category_id: [expenses, schedules and budgets]} of one database. The
+    # expense counts come from the rollup, so archived expenses count too.
+    conn = connect(db_path)
+    usage = defaultdict(lambda: [0, 0])
+    for category_id, count in conn.execute('SELECT category_id, SUM(count) FROM MonthlyTotals GROUP BY category_id'):
+        usage[category_id][0] += count
+    for table in ('RecurringExpenses', 'CategoryBudgets'):
+        for category_id, count in conn.execute(f'''SELECT category_id, COUNT(*) FROM {table}
+                                                   WHERE category_id IS NOT NULL GROUP BY category_id'''):
+            usage[category_id][1] += count
+    conn.close()
+    return usage
+
+
+def export_shard(db_path, part_path, user_names):
+    # One database's expenses, archived years included, as headerless CSV
+    # rows; runs in a worker process
+    conn = connect(db_path)
+    rows = 0
+    with open(part_path, 'w', newline='', encoding='utf-8') as part:
+        writer = csv.writer(part)
+        for source in all_expense_sources(conn, db_path):
+            cursor = conn.execute(f'''SELECT e.expense_id, e.user_id, c.category_name, e.date, e.amount, e.currency,
+                                             e.amount * {day_rate_sql('e')}, e.description
+                                      FROM {source} e
+                                      JOIN Categories c ON e.category_id = c.category_id''')
+            for row in cursor:
+                if row[1] in user_names:
+                    writer.writerow((row[0], user_names[row[1]]) + row[2:])
+                    rows += 1
+    conn.close()
+    return rows
+
+
+def merge_summaries(summaries):
+    user_totals = {}
+    category_counts = {}
+    for users, categories in summaries:
+        for user_id, (total, count) in users.items():
+            previous_total, previous_count = user_totals.get(user_id, (0, 0))
+            user_totals[user_id] = (previous_total + total, previous_count + count)
+        for category_id, count in categories.items():
+            category_counts[category_id] = category_counts.get(category_id, 0) + count
+    return AdminStats(user_totals, category_counts,
+                      sum(count for total, count in user_totals.values()),
+                      sum(total for total, count in user_totals.values()))
+
+
+def enable_sharding(catalog_path, count):
+    # Create count shards next to the catalog and move every user's rows
+    # into theirs. Run once, with the app closed.
+    init_database(catalog_path)
+    conn = connect(catalog_path)
+    if conn.execute('SELECT COUNT(*) FROM Shards').fetchone()[0]:
+        conn.close()
+        raise ValueError("Sharding is already enabled")
+
+    for shard in range(count):
+        init_shard(shard_path(catalog_path, shard))
+
+    # Each shard is filled in its own transaction (ATTACH cannot run inside
+    # one); the catalog only switches over, and drops its copies, at the end.
+    # Moving rows is not a change to sync: the rows' change log entries move
+    # with them instead. Archived years are split into per-shard archive
+    # files the same way.
+    for shard in range(count):
+        conn.execute('ATTACH DATABASE ? AS shard', (shard_path(catalog_path, shard),))
+        conn.execute('BEGIN IMMEDIATE')
+        set_capture(conn, False, 'shard')
+        for table in USER_TABLES:
+            columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+            conn.execute(f'DELETE FROM shard.{table}')
+            conn.execute(f'''INSERT INTO shard.{table} ({columns})
+                             SELECT {columns} FROM main.{table} WHERE user_id % ? = ?''', (count, shard))
+            conn.execute('DELETE FROM shard.sqlite_sequence WHERE name = ?', (table,))
+            conn.execute('''INSERT INTO shard.sqlite_sequence (name, seq)
+                            SELECT ?, MAX(COALESCE((SELECT seq FROM main.sqlite_sequence WHERE name = ?), 0), ?)''',
+                         (table, table, shard * SHARD_ID_SPACE))
+        conn.execute('''INSERT INTO shard.ChangeLog (table_name, row_key, op, origin, clock)
+                        SELECT l.table_name, l.row_key, l.op, l.origin, l.clock FROM main.ChangeLog l
+                        WHERE (l.table_name = 'Expenses' AND l.row_key IN (SELECT uid FROM main.Expenses
+                                                                           WHERE user_id % ? = ?))
+                           OR (l.table_name = 'Budgets'
+                               AND CAST(substr(l.row_key, 1, instr(l.row_key, '|') - 1) AS INTEGER) % ? = ?)
+                        ORDER BY l.seq''', (count, shard, count, shard))
+        # The triggers only rolled up the live rows; the catalog's rollups
+        # cover the archived years too
+        for table in ROLLUP_TABLES:
+            columns = ', '.join(row[1] for row in conn.execute(f'PRAGMA main.table_info({table})'))
+            conn.execute(f'DELETE FROM shard.{table}')
+            conn.execute(f'''INSERT INTO shard.{table} ({columns})
+                             SELECT {columns} FROM main.{table} WHERE user_id % ? = ?''', (count, shard))
+        set_capture(conn, True, 'shard')
+        conn.commit()
+        move_archives(conn, catalog_path, count, shard)
+        conn.execute('DETACH DATABASE shard')
+
+    years = archived_years(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    conn.executemany('INSERT INTO Shards (shard_id) VALUES (?)', [(shard,) for shard in range(count)])
+    set_capture(conn, False)
+    for table in USER_TABLES + ROLLUP_TABLES + ('ArchivedYears',):
+        conn.execute(f'DELETE FROM main.{table}')
+    set_capture(conn, True)
+    conn.commit()
+    conn.close()
+    for year in years:
+        if os.path.exists(archive_path(catalog_path, year)):
+            os.remove(archive_path(catalog_path, year))
+
+
+def move_archives(conn, catalog_path, count, shard):
+    # Copy the shard's users' rows of each archived year of the catalog
+    # (attached as shard) into that shard's own archive file of the year
+    definition, column_types = expense_table(conn)
+    columns = ', '.join(column for column, column_type in column_types)
+    for year in archived_years(conn):
+        path = archive_path(catalog_path, year)
+        if not os.path.exists(path):
+            continue
+        target = archive_path(shard_path(catalog_path, shard), year)
+        init_archive(target, definition, column_types)
+        conn.execute('ATTACH DATABASE ? AS archive', (path,))
+        conn.execute('ATTACH DATABASE ? AS shard_archive', (target,))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM shard_archive.Expenses')
+            moved = conn.execute(f'''INSERT INTO shard_archive.Expenses ({columns})
+                                     SELECT {columns} FROM archive.Expenses WHERE user_id % ? = ?''',
+                                 (count, shard)).rowcount
+            conn.execute('''INSERT INTO shard.ArchivedYears (year, expense_count) VALUES (?, ?)
+                            ON CONFLICT (year) DO UPDATE SET expense_count = excluded.expense_count''', (year, moved))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute('DETACH DATABASE archive')
+            conn.execute('DETACH DATABASE shard_archive')
+
+
+def delete_user_rows(conn, user_id):
+    # Everything of the user's in their database (catalog or shard), without
+    # committing; their Users row and archived years are the caller's
+    for table in USER_TABLES:
+        conn.execute(f'DELETE FROM main.{table} WHERE user_id = ?', (user_id,))
+
+
+class ShardMap:
+    # Where each user's rows live, plus fan-out of whole-system jobs (admin
+    # statistics, export) across the shards on a process pool. Without
+    # shards everything resolves to the catalog itself and runs in-process.
+    def __init__(self, catalog_path=DB_PATH):
+        self.catalog_path = catalog_path
+        self.paths = shard_paths(catalog_path)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shards')
+
+    @property
+    def sharded(self):
+        return bool(self.paths)
+
+    def path_for(self, user_id):
+        return user_db_path(self.catalog_path, user_id, self.paths)
+
+    def all_paths(self):
+        return self.paths or [self.catalog_path]
+
+    def connect_for(self, user_id):
+        return connect(self.path_for(user_id))
+
+    def map(self, func, *iterables):
+        if not self.sharded:
+            return list(map(func, *iterables))
+        with self._lock:
+            if self._pool is None:
+                # spawn, not fork: the app has live threads and connections
+                self._pool = ProcessPoolExecutor(max_workers=min(len(self.paths), os.cpu_count() or 1),
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return list(self._pool.map(func, *iterables))
+
+    def admin_stats(self):
+        return merge_summaries(self.map(shard_summary, self.all_paths()))
+
+    def admin_stats_async(self):
+        return self._executor.submit(self.admin_stats)
+
+    def category_usage(self):
+        # Categories are shared, so their use is summed over every shard
+        usage = defaultdict(lambda: [0, 0])
+        for path in self.all_paths():
+            for category_id, (expenses, references) in category_usage(path).items():
+                usage[category_id][0] += expenses
+                usage[category_id][1] += references
+        return usage
+
+    def archive(self, cutoff):
+        # Move expenses dated before cutoff to the archives, every shard in
+        # parallel; returns the number of rows moved
+        paths = self.all_paths()
+        return sum(self.map(archive_expenses, paths, [cutoff] * len(paths)))
+
+    def archive_async(self, cutoff):
+        return self._executor.submit(self.archive, cutoff)
+
+    def user_totals(self, user_ids):
+        # {user_id: total} for a few users, each read from its own shard
+        totals = {}
+        for user_id in user_ids:
+            conn = self.connect_for(user_id)
+            totals[user_id] = conn.execute(f'''SELECT COALESCE(SUM(t.total * {month_rate_sql('t')}), 0)
+                                               FROM MonthlyTotals t WHERE t.user_id = ?''', (user_id,)).fetchone()[0]
+            conn.close()
+        return totals
+
+    def export_expenses(self, output_path):
+        # Each shard is written to its own part file in parallel; the parts
+        # are then concatenated behind one header
+        conn = connect(self.catalog_path)
+        user_names = dict(conn.execute('SELECT user_id, name FROM Users'))
+        conn.close()
+
+        paths = self.all_paths()
+        parts = [f'{output_path}.part{i}' for i in range(len(paths))]
+        try:
+            rows = sum(self.map(export_shard, paths, parts, [user_names] * len(paths)))
+            with open(output_path, 'w', newline='', encoding='utf-8') as output:
+                csv.writer(output).writerow(EXPORT_COLUMNS)
+                for part in parts:
+                    with open(part, newline='', encoding='utf-8') as source:
+                        shutil.copyfileobj(source, output)
+        finally:
+            for part in parts:
+                if os.path.exists(part):
+                    os.remove(part)
+        return rows
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
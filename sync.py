@@ -0,0 +1,306 @@
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from database import connect, init_database, shard_paths, user_db_path
+
+# Incremental sync between two copies of the database, e.g. on two
+# machines. Each side reads the other's ChangeLog (changelog.py) from where
+# it stopped last time, so the work is proportional to the rows changed
+# since then. Rows travel with their foreign keys as user email and
+# category uid, so the copies may number users, categories and shards
+# differently. A change is applied unless the receiving side already has a
+# version of the row with a higher (clock, origin): the later edit wins,
+# ties go to the higher origin id, and both sides end up identical.
+
+
+class SyncStats(NamedTuple):
+    received: int
+    sent: int
+    conflicts: int
+    skipped: int
+
+
+class Change(NamedTuple):
+    table: str
+    key: str
+    op: str
+    origin: str
+    clock: int
+    row: tuple
+
+
+def database_files(db_path):
+    # The catalog first, so categories arrive before the expenses using them
+    return [db_path] + shard_paths(db_path)
+
+
+def file_origin(conn):
+    return conn.execute("SELECT value FROM main.SyncMeta WHERE key = 'origin'").fetchone()[0]
+
+
+def new_origin(db_path):
+    # For a file copied from another copy: gives it (and its shards) origin
+    # ids of their own, without which their changes could not be told apart
+    for path in database_files(db_path):
+        conn = connect(path)
+        conn.execute("UPDATE main.SyncMeta SET value = lower(hex(randomblob(8))) WHERE key = 'origin'")
+        conn.commit()
+        conn.close()
+
+
+def read_row(conn, table, key):
+    # (wire key, row) for one logged row, or None if the row is gone or its
+    # user no longer exists
+    if table == 'Categories':
+        row = conn.execute('SELECT category_name FROM main.Categories WHERE uid = ?', (key,)).fetchone()
+        return (key, row) if row else None
+    if table == 'Expenses':
+        row = conn.execute('''SELECT u.email, c.uid, c.category_name, e.date, e.amount, e.currency, e.description,
+                                     e.recurring_id
+                              FROM main.Expenses e
+                              JOIN Users u ON e.user_id = u.user_id
+                              JOIN Categories c ON e.category_id = c.category_id
+                              WHERE e.uid = ?''', (key,)).fetchone()
+        return (key, row) if row else None
+    user_id, _, month = key.partition('|')
+    row = conn.execute('''SELECT u.email, b.limit_amount FROM main.Budgets b
+                          JOIN Users u ON b.user_id = u.user_id
+                          WHERE b.user_id = ? AND b.month = ?''', (int(user_id), month)).fetchone()
+    return (f'{row[0]}|{month}', row[1:]) if row else None
+
+
+def wire_key(conn, table, key):
+    # Key of a deleted row as the other side knows it
+    if table != 'Budgets':
+        return key
+    user_id, _, month = key.partition('|')
+    row = conn.execute('SELECT email FROM Users WHERE user_id = ?', (int(user_id),)).fetchone()
+    return f'{row[0]}|{month}' if row else None
+
+
+def read_changes(conn, since):
+    # Changes logged after seq since, and the last seq read. Rows that are
+    # gone without a delete were archived or moved, not changed.
+    changes = []
+    last = since
+    for seq, table, key, op, origin, clock in conn.execute('''SELECT seq, table_name, row_key, op, origin, clock
+                                                               FROM main.ChangeLog WHERE seq > ?
+                                                               ORDER BY seq''', (since,)).fetchall():
+        last = seq
+        if op == 'D':
+            key = wire_key(conn, table, key)
+            if key is not None:
+                changes.append(Change(table, key, op, origin, clock, None))
+            continue
+        found = read_row(conn, table, key)
+        if found is not None:
+            changes.append(Change(table, found[0], op, origin, clock, found[1]))
+    return changes, last
+
+
+class Receiver:
+    # Applies changes to one copy: each row in the file that holds it, in
+    # one transaction per file
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.shards = shard_paths(db_path)
+        self.catalog = connect(db_path)
+        self.catalog.isolation_level = None
+        self.catalog.execute('BEGIN IMMEDIATE')
+        self.connections = {db_path: self.catalog}
+        self.users = dict(self.catalog.execute('SELECT email, user_id FROM Users'))
+        self.received = self.conflicts = self.skipped = 0
+
+    def connection(self, path):
+        if path not in self.connections:
+            # Deferred: IMMEDIATE would also lock the attached catalog,
+            # which this Receiver already holds
+            conn = connect(path)
+            conn.isolation_level = None
+            conn.execute('BEGIN')
+            self.connections[path] = conn
+        return self.connections[path]
+
+    def mark(self, origin):
+        row = self.catalog.execute('SELECT seq FROM SyncPeers WHERE origin = ?', (origin,)).fetchone()
+        return row[0] if row else 0
+
+    def set_mark(self, origin, seq):
+        self.catalog.execute('''INSERT INTO SyncPeers (origin, seq) VALUES (?, ?)
+                                ON CONFLICT (origin) DO UPDATE SET seq = excluded.seq''', (origin, seq))
+
+    def route(self, change):
+        # (connection, local row key) for a change, or None when its user
+        # does not exist here
+        if change.table == 'Categories':
+            return self.catalog, change.key
+        if change.table == 'Expenses' and change.op == 'D':
+            return self.holder(change.key) or self.catalog, change.key
+
+        email = change.row[0] if change.table == 'Expenses' else change.key.partition('|')[0]
+        user_id = self.users.get(email)
+        if user_id is None:
+            return None
+        conn = self.connection(user_db_path(self.db_path, user_id, self.shards))
+        if change.table == 'Budgets':
+            return conn, f'{user_id}|{change.key.partition("|")[2]}'
+        return conn, change.key
+
+    def holder(self, uid):
+        # The file holding an expense, found by uid
+        for path in database_files(self.db_path):
+            conn = self.connection(path)
+            if conn.execute('SELECT 1 FROM main.Expenses WHERE uid = ?', (uid,)).fetchone():
+                return conn
+        return None
+
+    def apply(self, change):
+        routed = self.route(change)
+        if routed is None:
+            self.skipped += 1
+            return
+        conn, key = routed
+
+        local = conn.execute('''SELECT clock, origin, op FROM main.ChangeLog WHERE table_name = ? AND row_key = ?
+                                ORDER BY seq DESC LIMIT 1''', (change.table, key)).fetchone()
+        if local is not None and (local[0], local[1]) >= (change.clock, change.origin):
+            if (local[0], local[1]) != (change.clock, change.origin):
+                self.conflicts += 1
+            return
+
+        try:
+            applied = getattr(self, f'apply_{change.table.lower()}')(conn, key, change, local)
+        except sqlite3.IntegrityError:
+            applied = False
+        if not applied:
+            self.skipped += 1
+            return
+        self.record(conn, change, key)
+        self.received += 1
+
+    def record(self, conn, change, key):
+        # The row's version is now the sender's, replacing what the
+        # triggers logged for the local write
+        conn.execute('DELETE FROM main.ChangeLog WHERE table_name = ? AND row_key = ?', (change.table, key))
+        conn.execute('''INSERT INTO main.ChangeLog (table_name, row_key, op, origin, clock)
+                        VALUES (?, ?, ?, ?, ?)''', (change.table, key, change.op, change.origin, change.clock))
+
+    def apply_categories(self, conn, key, change, local):
+        if change.op == 'D':
+            # Kept while expenses here (archived ones included) still use it
+            row = conn.execute('SELECT category_id FROM Categories WHERE uid = ?', (key,)).fetchone()
+            if row and any(self.connection(path).execute('SELECT 1 FROM main.MonthlyTotals WHERE category_id = ? LIMIT 1',
+                                                         (row[0],)).fetchone()
+                           for path in database_files(self.db_path)):
+                return False
+            conn.execute('DELETE FROM Categories WHERE uid = ?', (key,))
+            return True
+        if not conn.execute('UPDATE Categories SET category_name = ? WHERE uid = ?', (change.row[0], key)).rowcount:
+            conn.execute('INSERT INTO Categories (uid, category_name) VALUES (?, ?)', (key, change.row[0]))
+        return True
+
+    def apply_expenses(self, conn, key, change, local):
+        if change.op == 'D':
+            conn.execute('DELETE FROM main.Expenses WHERE uid = ?', (key,))
+            return True
+        email, category_uid, category_name, expense_date, amount, currency, description, recurring_id = change.row
+        category = self.catalog.execute('SELECT category_id FROM Categories WHERE uid = ?', (category_uid,)).fetchone()
+        if category is None:
+            # Deleted here while still in use on the sender: restored, and
+            # logged as a new change so the sender keeps it too
+            category = (self.catalog.execute('INSERT INTO Categories (uid, category_name) VALUES (?, ?)',
+                                             (category_uid, category_name)).lastrowid,)
+        values = (self.users[email], category[0], expense_date, amount, currency, description, recurring_id)
+        if conn.execute('''UPDATE main.Expenses SET user_id = ?, category_id = ?, date = ?, amount = ?, currency = ?,
+                                                    description = ?, recurring_id = ?
+                           WHERE uid = ?''', values + (key,)).rowcount:
+            return True
+        if local is not None and local[2] != 'D':
+            # Logged here but no longer live: archived, and read-only
+            return False
+        conn.execute('''INSERT INTO main.Expenses (user_id, category_id, date, amount, currency, description,
+                                                   recurring_id, uid)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', values + (key,))
+        return True
+
+    def apply_budgets(self, conn, key, change, local):
+        user_id, _, month = key.partition('|')
+        if change.op == 'D':
+            conn.execute('DELETE FROM main.Budgets WHERE user_id = ? AND month = ?', (int(user_id), month))
+        else:
+            conn.execute('INSERT OR REPLACE INTO main.Budgets (user_id, month, limit_amount) VALUES (?, ?, ?)',
+                         (int(user_id), month, change.row[0]))
+        return True
+
+    def commit(self):
+        for conn in self.connections.values():
+            conn.execute('COMMIT')
+
+    def close(self):
+        for conn in self.connections.values():
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            conn.close()
+
+
+def pull(target_path, source_path):
+    # Apply source's new changes to target; returns the Receiver's counts
+    receiver = Receiver(target_path)
+    try:
+        for path in database_files(source_path):
+            conn = connect(path)
+            try:
+                origin = file_origin(conn)
+                changes, last = read_changes(conn, receiver.mark(origin))
+            finally:
+                conn.close()
+            for change in changes:
+                receiver.apply(change)
+            receiver.set_mark(origin, last)
+        receiver.commit()
+    finally:
+        receiver.close()
+    return receiver
+
+
+def sync_databases(local_path, other_path):
+    # Two-way sync; safe to repeat, and to run while either copy is in use
+    init_database(local_path)
+    init_database(other_path)
+
+    origins = []
+    for db_path in (local_path, other_path):
+        files = set()
+        for path in database_files(db_path):
+            conn = connect(path)
+            files.add(file_origin(conn))
+            conn.close()
+        origins.append(files)
+    if origins[0] & origins[1]:
+        raise ValueError(f"{other_path} is a plain copy of this database; give it its own origin first "
+                         f"(cli.py --db {other_path} sync --new-origin)")
+
+    received = pull(local_path, other_path)
+    sent = pull(other_path, local_path)
+    return SyncStats(received.received, sent.received, received.conflicts + sent.conflicts,
+                     received.skipped + sent.skipped)
+
+
+class DatabaseSync:
+    # Runs sync_databases off the UI thread
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sync')
+
+    def sync(self, other_path):
+        with self._lock:
+            return sync_databases(self.db_path, other_path)
+
+    def sync_async(self, other_path):
+        return self._executor.submit(self.sync, other_path)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,362 @@
+import re
+
+import numpy as np
+
+from archive import all_expense_sources
+from cached_engine import CachedEngine
+from currency import RateCache
+from database import DB_PATH, connect
+
+# Free-form labels on expenses ("trip-goa", "reimbursable"), any number per
+# expense. ExpenseTags holds the pairs; for queries each tag is held in
+# memory as a compressed bitmap of expense ids, so "trip-goa AND NOT
+# reimbursable" or the total of a tag is a few vectorized set operations
+# however many expenses and tags there are, never a join per tag.
+
+# Bitmaps split ids by their high 16 bits, like Roaring bitmaps: each chunk
+# of 65536 ids is a sorted uint16 array while it holds at most this many
+# ids, and a 1024-word bitset (8 KB) above that
+ARRAY_LIMIT = 4096
+BITSET_WORDS = 1024
+
+TAG_NAME = re.compile(r'[^\s(),]+')
+TOKEN = re.compile(r'\s*(\(|\)|[^\s()]+)')
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+def bitset(container):
+    if container.dtype == np.uint64:
+        return container
+    bits = np.zeros(BITSET_WORDS * 64, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder='little').view(np.uint64)
+
+
+def bitset_values(words):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+
+def bitset_test(words, values):
+    return ((words[values >> 6] >> (values & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)
+
+
+def compact(container):
+    # The smaller form for the container's size; None when it is empty
+    if container.dtype == np.uint16:
+        if len(container) > ARRAY_LIMIT:
+            return bitset(container)
+        return container if len(container) else None
+    count = int(np.unpackbits(container.view(np.uint8)).sum())
+    if count > ARRAY_LIMIT:
+        return container
+    return bitset_values(container) if count else None
+
+
+def container_and(a, b):
+    if a.dtype == np.uint16 and b.dtype == np.uint16:
+        return np.intersect1d(a, b, assume_unique=True)
+    if a.dtype == np.uint16:
+        a, b = b, a
+    if b.dtype == np.uint16:
+        return b[bitset_test(a, b)]
+    return a & b
+
+
+def container_or(a, b):
+    if a.dtype == np.uint16 and b.dtype == np.uint16:
+        return np.union1d(a, b)
+    return bitset(a) | bitset(b)
+
+
+def container_andnot(a, b):
+    if a.dtype == np.uint16:
+        return np.setdiff1d(a, b, assume_unique=True) if b.dtype == np.uint16 else a[~bitset_test(b, a)]
+    return a & ~bitset(b)
+
+
+class Bitmap:
+    # Set of non-negative integer ids: {high 16 bits: container}
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        highs = ids >> 16
+        starts = np.flatnonzero(np.r_[True, highs[1:] != highs[:-1]]) if len(ids) else []
+        ends = list(starts[1:]) + [len(ids)]
+        return cls({int(highs[start]): compact((ids[start:end] & 0xFFFF).astype(np.uint16))
+                    for start, end in zip(starts, ends)})
+
+    def ids(self):
+        # Sorted int64 array
+        if not self.containers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([(high << 16) | (container if container.dtype == np.uint16
+                                               else bitset_values(container)).astype(np.int64)
+                               for high, container in sorted(self.containers.items())])
+
+    def __len__(self):
+        return sum(len(container) if container.dtype == np.uint16
+                   else int(np.unpackbits(container.view(np.uint8)).sum())
+                   for container in self.containers.values())
+
+    def add(self, expense_id):
+        high, low = expense_id >> 16, np.uint16(expense_id & 0xFFFF)
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = np.array([low], dtype=np.uint16)
+        elif container.dtype == np.uint16:
+            position = np.searchsorted(container, low)
+            if position == len(container) or container[position] != low:
+                self.containers[high] = compact(np.insert(container, position, low))
+        else:
+            # Containers may be shared with the results of set operations
+            container = container.copy()
+            container[low >> 6] |= np.uint64(1) << np.uint64(low & 63)
+            self.containers[high] = container
+
+    def discard(self, expense_id):
+        high = expense_id >> 16
+        container = self.containers.get(high)
+        if container is None:
+            return
+        low = np.uint16(expense_id & 0xFFFF)
+        if container.dtype == np.uint16:
+            container = container[container != low]
+        else:
+            container = container.copy()
+            container[low >> 6] &= ~(np.uint64(1) << np.uint64(low & 63))
+        container = compact(container)
+        if container is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = container
+
+    def _combine(self, other, operation, keep_left, keep_right):
+        containers = {}
+        for high in self.containers.keys() | other.containers.keys():
+            left, right = self.containers.get(high), other.containers.get(high)
+            if left is not None and right is not None:
+                container = compact(operation(left, right))
+            else:
+                container = left if (left is not None and keep_left) else right if keep_right else None
+            if container is not None:
+                containers[high] = container
+        return Bitmap(containers)
+
+    def __and__(self, other):
+        return self._combine(other, container_and, False, False)
+
+    def __or__(self, other):
+        return self._combine(other, container_or, True, True)
+
+    def __sub__(self, other):
+        return self._combine(other, container_andnot, True, False)
+
+
+def normalize_tag(name):
+    name = name.strip().lower()
+    if not TAG_NAME.fullmatch(name) or name.upper() in OPERATORS:
+        raise ValueError(f"Invalid tag name: {name!r}")
+    return name
+
+
+def parse_tags(expression):
+    # 'trip-goa AND (food OR taxi) AND NOT reimbursable' -> nested tuples
+    # ('and', a, b), ('or', a, b), ('not', a), ('tag', name). NOT binds
+    # tightest, then AND, then OR; tags side by side are ANDed.
+    tokens = TOKEN.findall(expression)
+    position = 0
+
+    def peek():
+        return tokens[position].upper() if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def disjunction():
+        node = conjunction()
+        while peek() == 'OR':
+            take()
+            node = ('or', node, conjunction())
+        return node
+
+    def conjunction():
+        node = negation()
+        while peek() not in (None, 'OR', ')'):
+            if peek() == 'AND':
+                take()
+            node = ('and', node, negation())
+        return node
+
+    def negation():
+        if peek() == 'NOT':
+            take()
+            return ('not', negation())
+        if peek() == '(':
+            take()
+            node = disjunction()
+            if peek() != ')':
+                raise ValueError("Missing ) in tag search")
+            take()
+            return node
+        if peek() in (None, ')', 'AND', 'OR'):
+            raise ValueError("Tag search expects a tag name")
+        return ('tag', normalize_tag(take()))
+
+    node = disjunction()
+    if position < len(tokens):
+        raise ValueError(f"Unexpected {tokens[position]!r} in tag search")
+    return node
+
+
+class _TagModel:
+    # The user's expense ids (live and archived, sorted) with their amounts
+    # in the reporting currency, and tag name -> (tag_id, Bitmap)
+    def __init__(self, ids, amounts, tags):
+        self.ids = ids
+        self.amounts = amounts
+        self.universe = Bitmap.from_ids(ids)
+        self.tags = tags
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == 'tag':
+            return self.tags[node[1]][1] if node[1] in self.tags else Bitmap()
+        if kind == 'not':
+            return self.universe - self.evaluate(node[1])
+        left, right = self.evaluate(node[1]), self.evaluate(node[2])
+        return left & right if kind == 'and' else left | right
+
+    def total(self, bitmap):
+        ids = (bitmap & self.universe).ids()
+        return float(self.amounts[np.searchsorted(self.ids, ids)].sum()), len(ids)
+
+
+class TagIndex(CachedEngine):
+    # Per-user tag bitmaps, loaded in one pass over ExpenseTags. Tagging
+    # through the index updates them directly; any other write to the file
+    # (new or edited expenses, the API, the CLI, sync, another session)
+    # changes PRAGMA data_version and the bitmaps are loaded again on next
+    # use. Everything runs on one background thread.
+    def __init__(self, db_path=DB_PATH, rates=None):
+        super().__init__(db_path, 'tags')
+        self.rates = rates or RateCache(db_path)
+
+    def query(self, user_id, expression):
+        # Sorted ids of the user's expenses matching a tag expression
+        node = parse_tags(expression)
+        with self._lock:
+            return self._model(user_id).evaluate(node).ids()
+
+    def query_async(self, user_id, expression):
+        return self._executor.submit(self.query, user_id, expression)
+
+    def totals(self, user_id):
+        # {tag: (total in the reporting currency, expense count)}, largest first
+        with self._lock:
+            model = self._model(user_id)
+            totals = {name: model.total(bitmap) for name, (tag_id, bitmap) in model.tags.items()}
+        return dict(sorted(((name, total) for name, total in totals.items() if total[1]),
+                           key=lambda item: item[1][0], reverse=True))
+
+    def totals_async(self, user_id):
+        return self._executor.submit(self.totals, user_id)
+
+    def names(self, user_id):
+        # Every tag the user has; like expense_tags, a small read on its own
+        # connection, for the Tk thread
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute('SELECT name FROM Tags WHERE user_id = ?', (user_id,)).fetchall()
+        finally:
+            conn.close()
+        return sorted(row[0] for row in rows)
+
+    def expense_tags(self, expense_id):
+        conn = connect(self.db_path)
+        try:
+            rows = conn.execute('''SELECT t.name FROM ExpenseTags et JOIN Tags t ON t.tag_id = et.tag_id
+                                   WHERE et.expense_id = ?''', (expense_id,)).fetchall()
+        finally:
+            conn.close()
+        return sorted(row[0] for row in rows)
+
+    def set_tags(self, user_id, expense_id, names):
+        # Replace the expense's tags
+        names = {normalize_tag(name) for name in names}
+        current = set(self.expense_tags(expense_id))
+        with self._lock:
+            conn = self._connection()
+            tag_ids = self._tag_ids(conn, user_id, names | current)
+            conn.executemany('DELETE FROM ExpenseTags WHERE user_id = ? AND tag_id = ? AND expense_id = ?',
+                             [(user_id, tag_ids[name], expense_id) for name in current - names])
+            conn.executemany('INSERT OR IGNORE INTO ExpenseTags (user_id, tag_id, expense_id) VALUES (?, ?, ?)',
+                             [(user_id, tag_ids[name], expense_id) for name in names - current])
+            conn.commit()
+            model = self._peek(user_id)
+            if model is not None:
+                for name in current - names:
+                    model.tags[name][1].discard(expense_id)
+                for name in names - current:
+                    model.tags.setdefault(name, (tag_ids[name], Bitmap()))[1].add(expense_id)
+
+    def set_tags_async(self, user_id, expense_id, names):
+        return self._executor.submit(self.set_tags, user_id, expense_id, names)
+
+    def add_tag(self, user_id, expense_ids, name):
+        # Tag several expenses at once
+        name = normalize_tag(name)
+        with self._lock:
+            conn = self._connection()
+            tag_id = self._tag_ids(conn, user_id, {name})[name]
+            conn.executemany('INSERT OR IGNORE INTO ExpenseTags (user_id, tag_id, expense_id) VALUES (?, ?, ?)',
+                             [(user_id, tag_id, expense_id) for expense_id in expense_ids])
+            conn.commit()
+            model = self._peek(user_id)
+            if model is not None:
+                bitmap = model.tags.setdefault(name, (tag_id, Bitmap()))[1]
+                for expense_id in expense_ids:
+                    bitmap.add(expense_id)
+
+    def add_tag_async(self, user_id, expense_ids, name):
+        return self._executor.submit(self.add_tag, user_id, expense_ids, name)
+
+    def _tag_ids(self, conn, user_id, names):
+        conn.executemany('INSERT OR IGNORE INTO Tags (user_id, name) VALUES (?, ?)', [(user_id, name) for name in names])
+        return {name: conn.execute('SELECT tag_id FROM Tags WHERE user_id = ? AND name = ?', (user_id, name)).fetchone()[0]
+                for name in names}
+
+    def _model(self, user_id):
+        # The index's own writes leave data_version as it is
+        return self._cached(user_id, (), self._load)
+
+    def _load(self, user_id):
+        conn = self._connection()
+        rows = []
+        for source in all_expense_sources(conn, self.db_path):
+            rows += conn.execute(f'SELECT expense_id, amount, currency, date FROM {source} WHERE user_id = ?',
+                                 (user_id,)).fetchall()
+        if rows:
+            ids, amounts, currencies, dates = zip(*rows)
+            ids = np.array(ids, dtype=np.int64)
+            amounts = self.rates.convert(amounts, currencies, dates)
+            order = np.argsort(ids)
+            ids, amounts = ids[order], np.asarray(amounts, dtype=float)[order]
+        else:
+            ids, amounts = np.empty(0, dtype=np.int64), np.empty(0)
+
+        names = dict(conn.execute('SELECT tag_id, name FROM Tags WHERE user_id = ?', (user_id,)).fetchall())
+        pairs = np.array(conn.execute('SELECT tag_id, expense_id FROM ExpenseTags WHERE user_id = ? ORDER BY tag_id',
+                                      (user_id,)).fetchall(), dtype=np.int64).reshape(-1, 2)
+        tags = {name: (tag_id, Bitmap()) for tag_id, name in names.items()}
+        if len(pairs):
+            starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+            for start, end in zip(starts, list(starts[1:]) + [len(pairs)]):
+                tag_id = int(pairs[start, 0])
+                if tag_id in names:
+                    tags[names[tag_id]] = (tag_id, Bitmap.from_ids(pairs[start:end, 1]))
+        return _TagModel(ids, amounts, tags)
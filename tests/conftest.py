@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from currency import refresh_monthly_rates  # noqa: E402
+from database import connect, init_database  # noqa: E402
+
+USERS = 20
+EXPENSES_PER_USER = 2000
+CATEGORIES = 12
+
+
+def populate(db_path):
+    # A few years of history for many users, in every table the app reads
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.executemany('INSERT INTO Users (name, email, password) VALUES (?, ?, ?)',
+                     [(f'User {i}', f'user{i}@plans.test', '-') for i in range(USERS)])
+    conn.executemany('INSERT OR IGNORE INTO Categories (category_name) VALUES (?)',
+                     [(f'Category {i}',) for i in range(CATEGORIES)])
+    user_ids = [row[0] for row in conn.execute('SELECT user_id FROM Users')]
+    category_ids = [row[0] for row in conn.execute('SELECT category_id FROM Categories')]
+    conn.executemany('''INSERT INTO Expenses (user_id, category_id, date, amount, description, currency)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     ((user_id, category_ids[i % len(category_ids)],
+                       f'{2022 + i % 3}-{i % 12 + 1:02d}-{i % 28 + 1:02d}', 10.0 + i % 500, f'Expense {i % 300}',
+                       'USD' if i % 10 == 0 else 'INR')
+                      for user_id in user_ids for i in range(EXPENSES_PER_USER)))
+    conn.executemany('INSERT INTO Budgets (user_id, month, limit_amount) VALUES (?, ?, ?)',
+                     [(user_id, f'{year}-{month:02d}', 20000.0)
+                      for user_id in user_ids for year in (2022, 2023, 2024) for month in range(1, 13)])
+    conn.executemany('''INSERT INTO CategoryBudgets (user_id, category_id, period, limit_amount)
+                        VALUES (?, ?, ?, ?)''',
+                     [(user_id, category_ids[0], period, 5000.0)
+                      for user_id in user_ids for period in ('weekly', 'monthly', 'yearly')])
+    conn.executemany('INSERT INTO FxRates (date, currency, rate) VALUES (?, ?, ?)',
+                     [(f'{year}-{month:02d}-01', 'USD', 83.0) for year in (2022, 2023, 2024) for month in range(1, 13)])
+    refresh_monthly_rates(conn.cursor(), ['USD'])
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture(scope='session', params=['analyzed', 'fresh'])
+def plan_db(request, tmp_path_factory):
+    # Plans must hold both with the statistics maintenance collects and on
+    # a database that has never been analyzed
+    db_path = str(tmp_path_factory.mktemp('plans') / 'plans.db')
+    populate(db_path)
+    if request.param == 'analyzed':
+        conn = connect(db_path)
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.close()
+    return db_path
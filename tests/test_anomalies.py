@@ -0,0 +1,30 @@
+from anomalies import AnomalyDetector
+from database import connect, init_database
+
+
+def test_refits_after_outside_writes(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.executemany('INSERT INTO Expenses (user_id, category_id, date, amount) VALUES (1, 1, ?, ?)',
+                     [(f'2024-01-{day:02d}', 100 + day % 3) for day in range(1, 29)])
+    outlier = conn.execute("INSERT INTO Expenses (user_id, category_id, date, amount) VALUES (1, 1, '2024-01-29', 5000)"
+                           ).lastrowid
+    conn.commit()
+
+    detector = AnomalyDetector(db_path)
+    assert list(detector.anomalies(1)) == [outlier]
+
+    # Edited and deleted through another connection, as the CLI or API would
+    conn.execute('UPDATE Expenses SET amount = 101 WHERE expense_id = ?', (outlier,))
+    conn.commit()
+    assert detector.anomalies(1) == {}
+    conn.execute('UPDATE Expenses SET amount = 5000 WHERE expense_id = ?', (outlier,))
+    conn.commit()
+    assert list(detector.anomalies(1)) == [outlier]
+    conn.execute('DELETE FROM Expenses WHERE expense_id = ?', (outlier,))
+    conn.commit()
+    assert detector.anomalies(1) == {}
+
+    conn.close()
+    detector.close()
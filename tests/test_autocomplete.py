@@ -0,0 +1,17 @@
+from autocomplete import _UserIndex
+
+
+def test_far_future_dates_do_not_overflow():
+    # A mistyped year must not break the user's whole index
+    index = _UserIndex([('Rent', 1, '2300-01-01', 10.0, 'INR'), ('Rent', 2, '2024-01-01', 5.0, 'INR'),
+                        ('Groceries', 3, '9999-12-31', 20.0, 'INR')])
+    assert [suggestion.description for suggestion in index.lookup('re', 8)] == ['Rent']
+    assert index.lookup('gro', 8)[0].amount == 20.0
+
+
+def test_recent_uses_outrank_older_ones():
+    # Two uses count as much as one a half-life later; three outweigh it
+    rows = [('Taxi', 1, '2024-01-01', 5.0, 'INR')] * 3 + [('Tea', 2, '2024-03-31', 1.0, 'INR')]
+    assert [suggestion.description for suggestion in _UserIndex(rows).lookup('t', 8)] == ['Taxi', 'Tea']
+    rows = [('Taxi', 1, '2024-01-01', 5.0, 'INR'), ('Tea', 2, '2024-03-31', 1.0, 'INR')]
+    assert [suggestion.description for suggestion in _UserIndex(rows).lookup('t', 8)] == ['Tea', 'Taxi']
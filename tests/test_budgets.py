@@ -0,0 +1,55 @@
+from datetime import date
+
+from budgets import BudgetEngine
+from database import connect, init_database
+from watcher import DataVersionWatcher
+
+# Running budget totals follow writes made through other connections (the
+# CLI, the API, sync), but never count an insert of their own twice.
+TODAY = date.today().isoformat()
+
+
+def setup(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.execute("INSERT INTO CategoryBudgets (user_id, category_id, period, limit_amount) VALUES (1, 1, 'monthly', 100)")
+    conn.commit()
+    watcher = DataVersionWatcher(db_path)
+    engine = BudgetEngine(1, opener=lambda: connect(db_path), watcher=watcher)
+    return conn, watcher, engine
+
+
+def insert(conn, amount):
+    conn.execute('INSERT INTO Expenses (user_id, category_id, date, amount) VALUES (1, 1, ?, ?)', (TODAY, amount))
+    conn.commit()
+
+
+def test_statuses_follow_other_connections(tmp_path):
+    conn, watcher, engine = setup(tmp_path)
+    assert [status.spent for status in engine.statuses()] == [0]
+
+    insert(conn, 30)
+    assert [status.spent for status in engine.statuses()] == [30]
+    conn.execute('DELETE FROM Expenses')
+    conn.commit()
+    assert [status.spent for status in engine.statuses()] == [0]
+    conn.close()
+    watcher.close()
+
+
+def test_own_insert_counted_once(tmp_path):
+    conn, watcher, engine = setup(tmp_path)
+    engine.begin()
+    insert(conn, 85)
+    alerts = engine.record(1, TODAY, 85)
+    assert [alert.threshold for alert in alerts] == [0.8]
+    assert [status.spent for status in engine.statuses()] == [85]
+
+    # A failed insert does not hold back later reloads
+    engine.begin()
+    engine.cancel()
+    insert(conn, 10)
+    assert [status.spent for status in engine.statuses()] == [95]
+    conn.close()
+    watcher.close()
@@ -0,0 +1,259 @@
+# Query-plan regressions: every SQL statement in the app's modules is
+# collected from the source, prepared against a populated database with
+# EXPLAIN QUERY PLAN, and checked for full scans of Expenses and for rows
+# sorted in a temporary B-tree. An index or schema change that turns a
+# listing, report or budget check back into a scan fails here.
+#
+#   python -m pytest tests/test_query_plans.py
+import ast
+import glob
+import importlib
+import itertools
+import os
+import re
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from database import connect
+from paging import EXPENSE_SORTS, USER_SORTS, after
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Statements with a query plan worth checking
+QUERY = re.compile(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+# Calls whose argument at this position is SQL; submit is WriteQueue.submit
+SQL_CALLS = {'execute': 0, 'executemany': 0, 'read_sql_query': 0, 'read_sql': 0, 'fetch_expenses': 2, 'submit': 0}
+
+# Values for the local variables statements are built from. A tuple lists
+# the variants that are all checked, e.g. each filter of the expense view.
+SAMPLE_LOCALS = {
+    'self': SimpleNamespace(expense_filter=('', []), current_user={'id': 1}),
+    'filter_sql': ('', 'AND e.date >= ? AND e.date <= ?', 'AND c.category_name = ?',
+                   'AND e.expense_id IN (SELECT value FROM json_each(?))',
+                   'AND e.expense_id IN (SELECT expense_id FROM SavedViewRows WHERE view_id = ?)'),
+    'month_filter': ('', 'AND b.month IN (?, ?)'),
+    'placeholders': '?, ?',
+    'limit': ('', 'LIMIT ?'),
+    'filters': (['e.user_id = ?'], ['e.user_id = ?', 'e.date >= ?', 'e.date <= ?'],
+                ['e.user_id = ?', 'e.category_id = ?', '(e.date < ? OR (e.date = ? AND e.expense_id < ?))']),
+}
+
+# Locals that only make sense together, by function: each sort of a paged
+# table in both directions, on its first page and on a later one
+FUNCTION_SAMPLES = {
+    ('et', 'load_expense_page'): [
+        {'source': source, 'columns': columns, 'descending': descending,
+         'page_filter': page_filter and 'AND ' + after(columns, descending, columns)[0]}
+        for source, columns, first_descending in EXPENSE_SORTS.values()
+        for descending in (True, False) for page_filter in ('', 'after')],
+    ('et', 'load_users'): [
+        {'columns': columns, 'descending': descending,
+         'page_filter': page_filter and 'WHERE ' + after(columns, descending, columns)[0]}
+        for columns, first_descending in USER_SORTS.values()
+        for descending in (True, False) for page_filter in ('', 'after')],
+}
+
+# The statements of these functions must all be collected and checked
+HOT_FUNCTIONS = [
+    ('et', 'load_expense_page'),
+    ('et', 'load_users'),
+    ('et', 'apply_expense_changes'),
+    ('et', 'fetch_budget_rows'),
+    ('et', 'generate_monthly_report'),
+    ('et', 'generate_yearly_report'),
+    ('et', 'generate_category_report'),
+    ('budgets', 'load'),
+    ('dashboard', '_load'),
+    ('pivot', 'expenses'),
+    ('api_server', 'list_expenses'),
+    ('cli', 'list_expenses'),
+]
+
+# Statements allowed one kind of problem, 'scan' (of Expenses) or 'sort'
+# (in a temp B-tree), by module and function, with the reason
+EXEMPT = {
+    ('anomalies', 'add'): ('sort', "sorts the few rows just written, fetched by primary key"),
+    ('et', 'apply_expense_changes'): ('sort', "sorts the few rows just written, fetched by primary key"),
+    ('budgets', 'load'): ('sort', "sorts one user's handful of category budgets"),
+    ('et', 'generate_category_report'): ('sort', "orders the totals, one row per category"),
+    ('api_server', 'category_report'): ('sort', "orders the totals, one row per category"),
+    ('trends', '_load'): ('sort', "orders the window results, one row per category and month"),
+    ('et', 'clear_all_expenses'): ('scan', "deletes every expense"),
+    ('cli', 'cmd_clear_expenses'): ('scan', "deletes every expense"),
+    ('rollups', 'rebuild_rollups'): ('scan', "one-time backfill of the rollups from every expense"),
+    ('archive', 'archive_expenses'): ('scan', "batch job finding the years to archive across all users"),
+}
+
+
+def enclosing_functions(tree):
+    # {node: name of the innermost function containing it}
+    owners = {}
+
+    def visit(node, owner):
+        for child in ast.iter_child_nodes(node):
+            name = child.name if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)) else owner
+            owners[child] = name
+            visit(child, name)
+
+    visit(tree, '<module>')
+    return owners
+
+
+def function_nodes(tree):
+    return {node.name: node for node in ast.walk(tree) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))}
+
+
+def assigned_expression(function, name, line):
+    # The expression last assigned to a local before line, with any
+    # "name += ..." after it appended
+    expression = None
+    for node in sorted((node for node in ast.walk(function) if getattr(node, 'lineno', line) < line),
+                       key=lambda node: node.lineno):
+        if isinstance(node, ast.Assign) and any(isinstance(target, ast.Name) and target.id == name
+                                                for target in node.targets):
+            expression = node.value
+        elif (isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name) and node.target.id == name
+              and expression is not None):
+            expression = ast.BinOp(left=expression, op=ast.Add(), right=node.value)
+    return expression
+
+
+def variants(expression, function):
+    # One {local: value} per combination of the sample variants it uses,
+    # for each of the function's own samples
+    used = {node.id for node in ast.walk(expression) if isinstance(node, ast.Name)}
+    names = sorted(used & set(SAMPLE_LOCALS))
+    choices = [SAMPLE_LOCALS[name] if isinstance(SAMPLE_LOCALS[name], tuple) else (SAMPLE_LOCALS[name],)
+               for name in names]
+    for own in FUNCTION_SAMPLES.get(function, [{}]):
+        for values in itertools.product(*choices):
+            yield {**dict(zip(names, values)), **own}
+
+
+def collect_statements():
+    # [(module, function, line, sql)] for every query or data change that
+    # could be built from the source; statements made of locals the samples
+    # do not cover are left out
+    statements = []
+    for path in sorted(glob.glob(os.path.join(ROOT, '*.py'))):
+        module_name = os.path.basename(path)[:-3]
+        with open(path, encoding='utf-8') as source:
+            tree = ast.parse(source.read())
+        owners = enclosing_functions(tree)
+        functions = function_nodes(tree)
+        module = None
+
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call):
+                continue
+            name = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, 'id', None)
+            position = SQL_CALLS.get(name)
+            if position is None or len(node.args) <= position:
+                continue
+            expression = node.args[position]
+            owner = owners[node]
+            if isinstance(expression, ast.Name) and owner in functions:
+                expression = assigned_expression(functions[owner], expression.id, node.lineno) or expression
+            if isinstance(expression, ast.Constant):
+                found = [expression.value] if isinstance(expression.value, str) else []
+            else:
+                if module is None:
+                    module = importlib.import_module(module_name)
+                code = compile(ast.fix_missing_locations(ast.Expression(expression)), path, 'eval')
+                found = []
+                for local_values in variants(expression, (module_name, owner)):
+                    try:
+                        value = eval(code, dict(vars(module)), local_values)
+                    except Exception:
+                        continue
+                    if isinstance(value, str):
+                        found.append(value)
+            for sql in dict.fromkeys(found):
+                if QUERY.match(sql):
+                    statements.append((module_name, owner, node.lineno, sql))
+    return statements
+
+
+def expense_aliases(sql):
+    # Names Expenses goes by in sql: its own and any alias; {expenses} is
+    # the table in statements also run against the archives
+    aliases = set()
+    for match in re.finditer(r'\b(?:FROM|JOIN)\s+(?:\w+\.)?(?:Expenses\b|\{expenses\})(?:\s+(?:AS\s+)?(\w+))?', sql,
+                             re.IGNORECASE):
+        aliases.add('Expenses')
+        alias = match.group(1)
+        if alias and alias.upper() not in ('WHERE', 'JOIN', 'LEFT', 'INNER', 'ON', 'GROUP', 'ORDER', 'LIMIT', 'USING'):
+            aliases.add(alias)
+    return aliases
+
+
+def prepare(conn, sql):
+    # Query plan details of sql, or None when it reads a schema only
+    # attached by batch jobs (archive, shard, shard_archive); any other
+    # error is a broken statement and fails the test
+    sql = sql.replace('{expenses}', 'main.Expenses').replace('{archived}', '0').strip().rstrip(';')
+    names = re.findall(r'(?<!:):(\w+)', sql)
+    bindings = dict.fromkeys(names) if names else [None] * sql.count('?')
+    try:
+        return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', bindings)]
+    except sqlite3.OperationalError as e:
+        if not re.match(r'no such table: (archive|shard|shard_archive)\.', str(e)):
+            raise
+        return None
+
+
+def filtered(detail, aliases):
+    # Whether detail searches Expenses by more than the user, e.g. a date
+    # range or a category; SQLite may then sort just the rows in it rather
+    # than read the user's rows in the order asked for
+    words = detail.split()
+    if words[:1] != ['SEARCH'] or len(words) < 2 or words[1].split('.')[-1] not in aliases:
+        return False
+    constraints = re.search(r'\((.*)\)', detail)
+    return constraints is not None and constraints.group(1) != 'user_id=?'
+
+
+def problems(sql, plan):
+    # [(kind, plan detail)]; a scan of Expenses is reported under the
+    # schema-qualified name too (SCAN main.Expenses)
+    found = []
+    aliases = expense_aliases(sql)
+    narrowed = any(filtered(detail, aliases) for detail in plan)
+    for detail in plan:
+        words = detail.split()
+        if words[:1] == ['SCAN'] and len(words) > 1 and words[1].split('.')[-1] in aliases:
+            found.append(('scan', detail))
+        if 'USE TEMP B-TREE FOR' in detail and 'ORDER BY' in detail and not narrowed:
+            found.append(('sort', detail))
+    return found
+
+
+STATEMENTS = collect_statements()
+
+
+def statement_id(statement):
+    module, function, line, sql = statement
+    return f'{module}.{function}:{line}'
+
+
+def test_hot_statements_are_collected():
+    collected = {(module, function) for module, function, line, sql in STATEMENTS}
+    assert [hot for hot in HOT_FUNCTIONS if hot not in collected] == []
+
+
+@pytest.mark.parametrize('statement', STATEMENTS, ids=[statement_id(statement) for statement in STATEMENTS])
+def test_query_plan(plan_db, statement):
+    module, function, line, sql = statement
+    conn = connect(plan_db)
+    try:
+        plan = prepare(conn, sql)
+    finally:
+        conn.close()
+    if plan is None:
+        pytest.skip("reads a database attached only by batch jobs")
+    allowed = EXEMPT.get((module, function), (None,))[0]
+    found = [detail for kind, detail in problems(sql, plan) if kind != allowed]
+    assert found == [], f"{module}.{function} line {line}:\n{sql}\n" + '\n'.join(plan)
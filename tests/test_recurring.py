@@ -0,0 +1,61 @@
+import threading
+from datetime import date
+
+from database import connect, init_database
+from recurring import add_schedule, generate_due
+
+# Each occurrence of a schedule becomes exactly one expense, however often
+# generate_due runs and from however many connections.
+TODAY = date(2024, 4, 20)
+DUE = ['2024-01-15', '2024-02-15', '2024-03-15', '2024-04-15']
+
+
+def setup(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    init_database(db_path)
+    conn = connect(db_path)
+    recurring_id = add_schedule(conn, 1, 1, 40, 'Rent', 'monthly', '2024-01-15')
+    return db_path, conn, recurring_id
+
+
+def occurrences(conn, recurring_id):
+    return [row[0] for row in conn.execute('SELECT date FROM Expenses WHERE recurring_id = ? ORDER BY date',
+                                           (recurring_id,))]
+
+
+def test_reruns_insert_nothing(tmp_path):
+    db_path, conn, recurring_id = setup(tmp_path)
+    assert len(generate_due(conn, today=TODAY)) == 4
+    assert generate_due(conn, today=TODAY) == []
+
+    other = connect(db_path)
+    assert generate_due(other, today=TODAY) == []
+    # Even a schedule whose next_date was never advanced adds no duplicates
+    other.execute("UPDATE RecurringExpenses SET next_date = '2024-01-15'")
+    other.commit()
+    assert generate_due(other, today=TODAY) == []
+    assert occurrences(conn, recurring_id) == DUE
+    other.close()
+    conn.close()
+
+
+def test_concurrent_runs_insert_once(tmp_path):
+    db_path, conn, recurring_id = setup(tmp_path)
+    start = threading.Barrier(4)
+    inserted = []
+
+    def run():
+        runner = connect(db_path)
+        start.wait()
+        inserted.extend(generate_due(runner, today=TODAY))
+        runner.close()
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(inserted) == 4
+    assert occurrences(conn, recurring_id) == DUE
+    conn.close()
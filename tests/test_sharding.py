@@ -0,0 +1,52 @@
+import os
+
+from archive import archive_expenses, archive_path, fetch_expenses
+from database import connect, init_database, shard_path, user_db_path
+from shards import enable_sharding, shard_summary
+
+# Sharding a database whose older years were already archived: every
+# user's rollups, archived rows and archive files move to their shard.
+YEARS = (2019, 2020, 2025)
+
+
+def populate(db_path):
+    init_database(db_path)
+    conn = connect(db_path)
+    conn.executemany('INSERT INTO Users (name, email, password) VALUES (?, ?, ?)',
+                     [(f'User {i}', f'user{i}@shards.test', '-') for i in range(4)])
+    user_ids = [row[0] for row in conn.execute('SELECT user_id FROM Users')]
+    conn.executemany('INSERT INTO Expenses (user_id, category_id, date, amount) VALUES (?, 1, ?, 10)',
+                     [(user_id, f'{year}-06-01') for user_id in user_ids for year in YEARS])
+    conn.commit()
+    conn.close()
+    return user_ids
+
+
+def test_archive_then_shard(tmp_path):
+    db_path = str(tmp_path / 'expenses.db')
+    user_ids = populate(db_path)
+    assert archive_expenses(db_path, '2021-01-01') == 2 * len(user_ids)
+
+    enable_sharding(db_path, 2)
+    paths = [shard_path(db_path, shard) for shard in range(2)]
+
+    totals = {}
+    for path in paths:
+        totals.update({user_id: total for user_id, (total, count) in shard_summary(path)[0].items()})
+    assert totals == {user_id: 10.0 * len(YEARS) for user_id in user_ids}
+
+    # The catalog keeps nothing of the users' archived years
+    conn = connect(db_path)
+    assert conn.execute('SELECT COUNT(*) FROM ArchivedYears').fetchone()[0] == 0
+    assert conn.execute('SELECT COUNT(*) FROM MonthlyTotals').fetchone()[0] == 0
+    conn.close()
+    assert not any(os.path.exists(archive_path(db_path, year)) for year in YEARS)
+
+    # Listings from each shard reach its own archives
+    for user_id in user_ids:
+        path = user_db_path(db_path, user_id, paths)
+        conn = connect(path)
+        rows = fetch_expenses(conn, path, 'SELECT date FROM {expenses} WHERE user_id = ?', (user_id,),
+                              '2019-01-01', key=lambda row: row[0])
+        conn.close()
+        assert [row[0] for row in rows] == ['2025-06-01', '2020-06-01', '2019-06-01']
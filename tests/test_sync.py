@@ -0,0 +1,142 @@
+from database import connect, init_database
+from sync import sync_databases
+
+# Two copies edited apart converge on sync: the change with the higher
+# (clock, origin) wins on both sides, whichever side runs the sync.
+
+
+def copies(tmp_path):
+    paths = [str(tmp_path / 'a.db'), str(tmp_path / 'b.db')]
+    for path, origin in zip(paths, ('aaaa', 'bbbb')):
+        init_database(path)
+        conn = connect(path)
+        conn.execute("UPDATE SyncMeta SET value = ? WHERE key = 'origin'", (origin,))
+        conn.commit()
+        conn.close()
+    sync_databases(*paths)
+    return paths
+
+
+def write(path, sql, params=()):
+    conn = connect(path)
+    cursor = conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+    return cursor.lastrowid
+
+
+def add_expense(path, amount, category='Food'):
+    expense_id = write(path, '''INSERT INTO Expenses (user_id, category_id, date, amount)
+                                SELECT 1, category_id, '2024-03-01', ? FROM Categories WHERE category_name = ?''',
+                       (amount, category))
+    conn = connect(path)
+    uid = conn.execute('SELECT uid FROM Expenses WHERE expense_id = ?', (expense_id,)).fetchone()[0]
+    conn.close()
+    return uid
+
+
+def set_clock(path, table, key, clock):
+    # Pins the version of a row's last change, so the test decides which
+    # edit counts as later
+    write(path, 'UPDATE ChangeLog SET clock = ? WHERE table_name = ? AND row_key = ?', (clock, table, key))
+
+
+def clock_after(*paths):
+    clocks = []
+    for path in paths:
+        conn = connect(path)
+        clocks.append(conn.execute('SELECT MAX(clock) FROM ChangeLog').fetchone()[0])
+        conn.close()
+    return max(clocks) + 1000
+
+
+def expenses(path):
+    conn = connect(path)
+    rows = conn.execute('''SELECT e.uid, c.category_name, e.amount FROM Expenses e
+                           JOIN Categories c ON e.category_id = c.category_id ORDER BY e.uid''').fetchall()
+    conn.close()
+    return rows
+
+
+def categories(path):
+    conn = connect(path)
+    rows = conn.execute('SELECT uid, category_name FROM Categories ORDER BY uid').fetchall()
+    conn.close()
+    return rows
+
+
+def test_concurrent_edits_go_to_higher_clock_then_origin(tmp_path):
+    a, b = copies(tmp_path)
+    uid = add_expense(a, 10)
+    sync_databases(a, b)
+    assert expenses(b) == [(uid, 'Food', 10)]
+
+    # Same clock: the higher origin (b) wins, whichever side syncs
+    write(a, 'UPDATE Expenses SET amount = 11 WHERE uid = ?', (uid,))
+    write(b, 'UPDATE Expenses SET amount = 12 WHERE uid = ?', (uid,))
+    clock = clock_after(a, b)
+    set_clock(a, 'Expenses', uid, clock)
+    set_clock(b, 'Expenses', uid, clock)
+    sync_databases(a, b)
+    assert expenses(a) == expenses(b) == [(uid, 'Food', 12)]
+
+    # A later clock beats the higher origin
+    write(a, 'UPDATE Expenses SET amount = 13 WHERE uid = ?', (uid,))
+    write(b, 'UPDATE Expenses SET amount = 14 WHERE uid = ?', (uid,))
+    clock = clock_after(a, b)
+    set_clock(a, 'Expenses', uid, clock + 1)
+    set_clock(b, 'Expenses', uid, clock)
+    sync_databases(b, a)
+    assert expenses(a) == expenses(b) == [(uid, 'Food', 13)]
+
+
+def test_delete_against_edit(tmp_path):
+    a, b = copies(tmp_path)
+    kept, deleted = add_expense(a, 10), add_expense(a, 20)
+    sync_databases(a, b)
+
+    # An edit made after the delete brings the row back
+    write(a, 'DELETE FROM Expenses WHERE uid = ?', (kept,))
+    write(b, 'UPDATE Expenses SET amount = 15 WHERE uid = ?', (kept,))
+    # A delete made after the edit removes it on both sides
+    write(a, 'UPDATE Expenses SET amount = 25 WHERE uid = ?', (deleted,))
+    write(b, 'DELETE FROM Expenses WHERE uid = ?', (deleted,))
+    clock = clock_after(a, b)
+    set_clock(a, 'Expenses', kept, clock)
+    set_clock(b, 'Expenses', kept, clock + 1)
+    set_clock(a, 'Expenses', deleted, clock)
+    set_clock(b, 'Expenses', deleted, clock + 1)
+
+    sync_databases(a, b)
+    assert expenses(a) == expenses(b) == [(kept, 'Food', 15)]
+
+
+def test_category_deleted_while_used_elsewhere(tmp_path):
+    for first in (0, 1):
+        (tmp_path / str(first)).mkdir()
+        a, b = copies(tmp_path / str(first))
+        write(a, "INSERT INTO Categories (category_name) VALUES ('Gifts')")
+        sync_databases(a, b)
+
+        uid = add_expense(b, 30, 'Gifts')
+        write(a, "DELETE FROM Categories WHERE category_name = 'Gifts'")
+        sync_databases(*((a, b) if first == 0 else (b, a)))
+        sync_databases(a, b)
+
+        # The expense keeps its category on both sides
+        assert expenses(a) == expenses(b) == [(uid, 'Gifts', 30)]
+        assert categories(a) == categories(b)
+
+
+def test_resync_changes_nothing(tmp_path):
+    a, b = copies(tmp_path)
+    add_expense(a, 10)
+    add_expense(b, 20)
+    write(b, "INSERT INTO Budgets (user_id, month, limit_amount) VALUES (1, '2024-03', 500)")
+    stats = sync_databases(a, b)
+    assert (stats.received, stats.sent) == (2, 1)
+    assert expenses(a) == expenses(b)
+
+    assert sync_databases(a, b) == (0, 0, 0, 0)
+    assert sync_databases(b, a) == (0, 0, 0, 0)
+    assert expenses(a) == expenses(b)
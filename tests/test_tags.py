@@ -0,0 +1,113 @@
+import random
+
+import numpy as np
+import pytest
+
+from shards import SHARD_ID_SPACE
+from tags import ARRAY_LIMIT, Bitmap, container_and, container_or, parse_tags
+
+# Bitmap set operations agree with Python sets on both container forms, at
+# the size where one turns into the other, and across chunks and shards.
+
+
+def chunk_ids(rng, high, count):
+    return {(high << 16) | low for low in rng.sample(range(1 << 16), count)}
+
+
+def kinds(bitmap):
+    return {high: 'array' if container.dtype == np.uint16 else 'bitset'
+            for high, container in bitmap.containers.items()}
+
+
+def check(bitmap, ids):
+    assert bitmap.ids().tolist() == sorted(ids)
+    assert len(bitmap) == len(ids)
+    for high, kind in kinds(bitmap).items():
+        count = sum(1 for expense_id in ids if expense_id >> 16 == high)
+        assert kind == ('array' if count <= ARRAY_LIMIT else 'bitset')
+
+
+@pytest.mark.parametrize('left_count, right_count', [
+    (10, 20), (ARRAY_LIMIT, ARRAY_LIMIT), (ARRAY_LIMIT, ARRAY_LIMIT + 1),
+    (ARRAY_LIMIT + 1, 30), (ARRAY_LIMIT + 1, ARRAY_LIMIT + 1), (20000, 20000),
+])
+def test_set_operations_match_sets(left_count, right_count):
+    rng = random.Random(left_count * 100003 + right_count)
+    # Chunk 0, a chunk past 2^16, and ids in the second and third shards'
+    # id ranges
+    highs = [0, 3, SHARD_ID_SPACE >> 16, (2 * SHARD_ID_SPACE >> 16) + 1]
+    left, right = set(), set()
+    for high in highs:
+        left |= chunk_ids(rng, high, left_count)
+        right |= chunk_ids(rng, high, right_count)
+    # Only on one side, and shared between both
+    left |= chunk_ids(rng, 7, left_count)
+    right |= chunk_ids(rng, 9, right_count)
+    right |= set(rng.sample(sorted(left), len(left) // 4))
+
+    a, b = Bitmap.from_ids(sorted(left)), Bitmap.from_ids(sorted(right))
+    check(a, left)
+    check(b, right)
+    check(a | b, left | right)
+    check(a & b, left & right)
+    check(a - b, left - right)
+    check(b - a, right - left)
+
+
+def test_containers_convert_at_limit():
+    # Ids in the second shard's range; the container depends only on the count
+    base = SHARD_ID_SPACE + (5 << 16)
+    ids = set(range(base, base + 2 * ARRAY_LIMIT, 2))
+    bitmap = Bitmap.from_ids(sorted(ids))
+    assert kinds(bitmap) == {base >> 16: 'array'}
+
+    bitmap.add(base + 1)
+    ids.add(base + 1)
+    check(bitmap, ids)
+    assert kinds(bitmap) == {base >> 16: 'bitset'}
+    bitmap.add(base + 1)
+    check(bitmap, ids)
+
+    bitmap.discard(base)
+    ids.discard(base)
+    check(bitmap, ids)
+    assert kinds(bitmap) == {base >> 16: 'array'}
+
+    for expense_id in sorted(ids):
+        bitmap.discard(expense_id)
+    assert bitmap.containers == {}
+    assert len(bitmap) == 0
+
+
+def test_container_operations():
+    rng = random.Random(7)
+    for left_count, right_count in [(100, 200), (100, ARRAY_LIMIT + 1), (ARRAY_LIMIT + 1, 100),
+                                    (ARRAY_LIMIT + 1, ARRAY_LIMIT + 1)]:
+        left = set(rng.sample(range(1 << 16), left_count))
+        right = set(rng.sample(range(1 << 16), right_count))
+        a, b = Bitmap.from_ids(sorted(left)).containers[0], Bitmap.from_ids(sorted(right)).containers[0]
+        assert Bitmap({0: container_or(a, b)}).ids().tolist() == sorted(left | right)
+        assert Bitmap({0: container_and(a, b)}).ids().tolist() == sorted(left & right)
+
+
+def test_shared_containers_are_not_modified():
+    big = Bitmap.from_ids(range(ARRAY_LIMIT + 1))
+    union = big | Bitmap()
+    union.add(70000)
+    union.add(ARRAY_LIMIT + 5)
+    union.discard(0)
+    assert big.ids().tolist() == list(range(ARRAY_LIMIT + 1))
+
+
+def test_parse_tags():
+    assert parse_tags('Trip-Goa') == ('tag', 'trip-goa')
+    assert parse_tags('a OR b AND NOT c') == ('or', ('tag', 'a'), ('and', ('tag', 'b'), ('not', ('tag', 'c'))))
+    assert parse_tags('(a or b) c') == ('and', ('or', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))
+    assert parse_tags('not not a') == ('not', ('not', ('tag', 'a')))
+    assert parse_tags('a AND b AND c') == ('and', ('and', ('tag', 'a'), ('tag', 'b')), ('tag', 'c'))
+
+
+@pytest.mark.parametrize('expression', ['', 'a AND', 'OR a', '(a OR b', 'a )', 'NOT', 'a,b', '()'])
+def test_parse_tags_rejects(expression):
+    with pytest.raises(ValueError):
+        parse_tags(expression)
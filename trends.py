@@ -0,0 +1,107 @@
+from typing import NamedTuple
+
+from cached_engine import CachedEngine
+from currency import month_rate_sql
+from database import DB_PATH
+
+
+class TrendRow(NamedTuple):
+    month: str
+    category_id: object
+    category_name: str
+    total: float
+    rolling_3: object
+    rolling_6: object
+    rolling_12: object
+    month_change: object
+    year_change: object
+    year_to_date: float
+    cumulative: float
+
+
+# MonthlyTotals only has rows for months with spending, so the series is
+# first converted to the reporting currency and made dense (every month x
+# every category, plus an overall row with category_id NULL); the window
+# functions can then count in rows: one row is one month. Rolling averages
+# are NULL until the window is full. Categories deleted since keep their
+# rollup rows and are labelled by id, as in the forecast.
+TREND_QUERY = f'''
+    WITH RECURSIVE
+    converted AS MATERIALIZED (
+        SELECT t.month, t.category_id, SUM(t.total * {month_rate_sql('t')}) AS total
+        FROM MonthlyTotals t
+        WHERE t.user_id = :user_id
+        GROUP BY t.month, t.category_id
+    ),
+    bounds AS (
+        SELECT MIN(month) AS first, MAX(month) AS last FROM converted
+    ),
+    months (month) AS (
+        SELECT first FROM bounds WHERE first IS NOT NULL
+        UNION ALL
+        SELECT strftime('%Y-%m', month || '-01', '+1 month') FROM months, bounds WHERE month < bounds.last
+    ),
+    user_categories AS (
+        SELECT DISTINCT category_id FROM converted
+    ),
+    series AS (
+        SELECT m.month, c.category_id, COALESCE(t.total, 0) AS total
+        FROM months m
+        CROSS JOIN user_categories c
+        LEFT JOIN converted t ON t.month = m.month AND t.category_id = c.category_id
+        UNION ALL
+        SELECT m.month, NULL, COALESCE(SUM(t.total), 0)
+        FROM months m
+        LEFT JOIN converted t ON t.month = m.month
+        GROUP BY m.month
+    )
+    SELECT s.month, s.category_id,
+           CASE WHEN s.category_id IS NULL THEN 'All'
+                ELSE COALESCE(c.category_name, 'Deleted category ' || s.category_id) END AS category_name,
+           s.total,
+           CASE WHEN COUNT(*) OVER w3 = 3 THEN AVG(s.total) OVER w3 END,
+           CASE WHEN COUNT(*) OVER w6 = 6 THEN AVG(s.total) OVER w6 END,
+           CASE WHEN COUNT(*) OVER w12 = 12 THEN AVG(s.total) OVER w12 END,
+           s.total - LAG(s.total, 1) OVER history,
+           s.total - LAG(s.total, 12) OVER history,
+           SUM(s.total) OVER (PARTITION BY s.category_id, substr(s.month, 1, 4) ORDER BY s.month),
+           SUM(s.total) OVER history
+    FROM series s
+    LEFT JOIN Categories c ON s.category_id = c.category_id
+    WINDOW history AS (PARTITION BY s.category_id ORDER BY s.month),
+           w3 AS (history ROWS 2 PRECEDING),
+           w6 AS (history ROWS 5 PRECEDING),
+           w12 AS (history ROWS 11 PRECEDING)
+    ORDER BY s.category_id IS NOT NULL, category_name, s.category_id, s.month
+'''
+
+
+def overall(rows):
+    return [row for row in rows if row.category_id is None]
+
+
+def latest(rows):
+    # The most recent month of each series, overall first
+    result = {}
+    for row in rows:
+        result[row.category_id] = row
+    return list(result.values())
+
+
+class TrendAnalyzer(CachedEngine):
+    # Rolling averages, month-over-month and year-over-year changes and
+    # running totals for every category and month, from one window-function
+    # query over the MonthlyTotals rollup. Cached per user until the next write.
+    def __init__(self, db_path=DB_PATH):
+        super().__init__(db_path, 'trends')
+
+    def trends(self, user_id):
+        with self._lock:
+            return self._cached(user_id, (), self._load)
+
+    def trends_async(self, user_id):
+        return self._executor.submit(self.trends, user_id)
+
+    def _load(self, user_id):
+        rows = self._conn.execute(TREND_QUERY, {'user_id': user_id}).fetchall()
+        return tuple(TrendRow(*row) for row in rows)
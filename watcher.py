@@ -0,0 +1,22 @@
+from database import DB_PATH, connect
+
+
+class DataVersionWatcher:
+    # PRAGMA data_version changes whenever another connection commits to the
+    # database file, so polling it is a near-free "did anything change?" check.
+    def __init__(self, db_path=DB_PATH):
+        self.conn = connect(db_path)
+        self.version = self.read_version()
+
+    def read_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed(self):
+        version = self.read_version()
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,183 @@
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+from database import DB_PATH, connect
+
+# Durability modes map onto PRAGMA synchronous for the writer connection.
+#   full   - every write is committed (and fsynced) before submit() returns
+#   normal - writes are group-committed within the latency window (WAL + NORMAL)
+#   off    - group commit and leave fsync to the OS (fastest, not crash safe)
+DURABILITY_MODES = {
+    'full': 'FULL',
+    'normal': 'NORMAL',
+    'off': 'OFF',
+}
+
+WriteResult = namedtuple('WriteResult', ['lastrowid', 'rowcount'])
+
+
+class WriteQueue:
+    def __init__(self, db_path=DB_PATH, latency_ms=50, durability='normal', max_batch=500, bus=None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+
+        self.db_path = db_path
+        self.latency = latency_ms / 1000.0
+        self.durability = durability
+        self.max_batch = max_batch
+        self.bus = bus
+
+        self._pending = []
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+        # Statistics (read by the benchmark and the admin panel)
+        self.batches_committed = 0
+        self.writes_committed = 0
+
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, sql, params=(), event=None):
+        # event is an optional (table, action, keys) tuple published on the
+        # change bus once the write commits; keys=None means "the new row id"
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write queue is closed")
+            self._pending.append((sql, params, event, future))
+            self._cond.notify_all()
+
+        if self.durability == 'full':
+            future.result()
+        return future
+
+    def execute(self, sql, params=(), event=None):
+        # Submit and wait for the commit, for callers that need the row id
+        return self.submit(sql, params, event).result()
+
+    def set_durability(self, durability):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.flush()
+        with self._cond:
+            self.durability = durability
+            self._cond.notify_all()
+
+    def pending_count(self):
+        with self._cond:
+            return len(self._pending) + self._in_flight
+
+    def flush(self):
+        with self._cond:
+            if not self._pending and not self._in_flight:
+                return
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending or self._in_flight:
+                self._cond.wait()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        conn = connect(self.db_path)
+        current_mode = None
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    break
+
+                # Hold the batch open until the latency window expires, unless
+                # someone is waiting on it or it is already full
+                deadline = time.monotonic() + self.latency
+                while (not self._flush_requested and not self._closed
+                       and self.durability != 'full'
+                       and len(self._pending) < self.max_batch):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending[:self.max_batch]
+                self._pending = self._pending[self.max_batch:]
+                self._in_flight = len(batch)
+                mode = self.durability
+
+            try:
+                if mode != current_mode:
+                    conn.execute(f'PRAGMA synchronous = {DURABILITY_MODES[mode]}')
+                    current_mode = mode
+
+                self._commit(conn, batch)
+            except Exception as e:
+                # Anything else fails the batch's futures rather than the
+                # writer thread, which would leave flush() waiting forever
+                if conn.in_transaction:
+                    conn.rollback()
+                for sql, params, event, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    if not self._pending:
+                        self._flush_requested = False
+                    self._cond.notify_all()
+
+        conn.close()
+
+    def _commit(self, conn, batch):
+        results = []
+        try:
+            cursor = conn.cursor()
+            for sql, params, event, future in batch:
+                cursor.execute(sql, params)
+                results.append(WriteResult(cursor.lastrowid, cursor.rowcount))
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            # One bad statement must not take the rest of the batch down with it
+            for sql, params, event, future in batch:
+                self._commit_one(conn, sql, params, event, future)
+            return
+
+        self.batches_committed += 1
+        self.writes_committed += len(batch)
+        for (sql, params, event, future), result in zip(batch, results):
+            self._publish(event, result)
+            future.set_result(result)
+
+    def _commit_one(self, conn, sql, params, event, future):
+        try:
+            cursor = conn.execute(sql, params)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            future.set_exception(e)
+            return
+
+        self.batches_committed += 1
+        self.writes_committed += 1
+        result = WriteResult(cursor.lastrowid, cursor.rowcount)
+        self._publish(event, result)
+        future.set_result(result)
+
+    def _publish(self, event, result):
+        if self.bus is None or event is None or not result.rowcount:
+            return
+        table, action, keys = event
+        self.bus.publish(table, action, keys if keys is not None else (result.lastrowid,))